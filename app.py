@@ -1,5 +1,6 @@
 """JCI API - Unified application for all microservices"""
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from chalicelib.modules.users.controller import router as users_router
@@ -8,8 +9,32 @@ from chalicelib.modules.entreprises.controller import router as entreprises_rout
 from chalicelib.modules.emplois.controller import router as emplois_router
 from chalicelib.modules.candidats.controller import router as candidats_router
 from chalicelib.modules.applications.controller import router as applications_router
+from chalicelib.common.helpers.index_helper import IndexHelper
+from chalicelib.common.helpers.purge import Purge
+from chalicelib.common.helpers.scheduler import Scheduler
+from chalicelib.config.mongodb import mongodb, ENSURE_INDEXES
+from chalicelib.config.settings import LIFECYCLE_IN_APP, LIFECYCLE_INTERVAL_SECONDS, LIFECYCLE_LEASE_SECONDS
+from chalicelib.modules.jobs.async_service import AsyncJobService
+from pymongoose import methods
 
-app = FastAPI(title='JCI API', version='1.0.0')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the MongoDB clients, prepare indexes, start the job lifecycle, and stop the background work on shutdown"""
+    mongodb.connect()
+    if ENSURE_INDEXES:
+        # Rebuilds drop the old index, they are left to `manage.py ensure-indexes`
+        IndexHelper.ensure(methods.schemas.values(), rebuild=False)
+    lifecycle = Scheduler("job-lifecycle", LIFECYCLE_INTERVAL_SECONDS, LIFECYCLE_LEASE_SECONDS)
+    if LIFECYCLE_IN_APP:
+        lifecycle.start(AsyncJobService().run_lifecycle)
+    yield
+    await lifecycle.stop()
+    await Purge.stop_all()
+    await mongodb.close()
+
+
+app = FastAPI(title='JCI API', version='1.0.0', lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -63,3 +88,9 @@ def health():
             'applications': 'active'
         }
     }
+
+
+@app.get('/health/pool')
+def health_pool():
+    """MongoDB connection pool statistics of this worker"""
+    return mongodb.pool_metrics()
@@ -0,0 +1,186 @@
+"""Archive helper moving deleted documents out of the live collections"""
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReplaceOne
+from pymongo.errors import DuplicateKeyError
+from ...config.mongodb import mongodb
+
+# Deletion date of the archived documents
+DELETED_AT = "deletedAt"
+
+
+class Archive:
+    """
+    Helper class moving deleted documents to `<collection>_archive` and back
+
+    A delete moves the document at once: it is copied to the archive with its
+    `deletedAt`, then removed from the live collection, so the live collections and
+    their indexes only hold live documents and reads need no `deletedAt` predicate.
+    The copy comes first, so an interrupted delete leaves the document live, never lost.
+    """
+
+    SUFFIX = "_archive"
+
+    # Legacy documents of a live collection deleted in place, before deletes moved them, read by the mover
+    index = IndexModel(
+        [(DELETED_AT, ASCENDING)],
+        name=DELETED_AT,
+        partialFilterExpression={DELETED_AT: {"$exists": True}},
+    )
+
+    @staticmethod
+    def collection(collection):
+        """Archive collection of a live collection"""
+        return mongodb.get_collection(collection.name + Archive.SUFFIX)
+
+    @staticmethod
+    def async_collection(collection):
+        """Async archive collection of a live collection"""
+        return mongodb.get_async_collection(collection.name + Archive.SUFFIX)
+
+    @staticmethod
+    def delete(collection, _id: ObjectId) -> Optional[Dict[str, Any]]:
+        """
+        Move a live document to the archive
+
+        The document is copied with its `deletedAt`, then removed with
+        find_one_and_delete: only the caller whose delete matched gets it back, so
+        concurrent deletes of a document count it once. A document changed between the
+        copy and the delete is copied again as it was deleted.
+
+        Args:
+            collection: Native live collection
+            _id: Document ID
+
+        Returns:
+            The document as it was deleted, or None when no live document has this id
+        """
+        document = collection.find_one({"_id": _id})
+        if document is None:
+            return None
+        archive = Archive.collection(collection)
+        deleted_at = datetime.now(timezone.utc)
+        archive.replace_one({"_id": _id}, {**document, DELETED_AT: deleted_at}, upsert=True)
+        before = collection.find_one_and_delete({"_id": _id})
+        if before is not None and before != document:
+            archive.replace_one({"_id": _id}, {**before, DELETED_AT: deleted_at}, upsert=True)
+        return before
+
+    @staticmethod
+    async def delete_async(collection, _id: ObjectId) -> Optional[Dict[str, Any]]:
+        """Async variant of `delete` for AsyncCollection"""
+        document = await collection.find_one({"_id": _id})
+        if document is None:
+            return None
+        archive = Archive.async_collection(collection)
+        deleted_at = datetime.now(timezone.utc)
+        await archive.replace_one({"_id": _id}, {**document, DELETED_AT: deleted_at}, upsert=True)
+        before = await collection.find_one_and_delete({"_id": _id})
+        if before is not None and before != document:
+            await archive.replace_one({"_id": _id}, {**before, DELETED_AT: deleted_at}, upsert=True)
+        return before
+
+    @staticmethod
+    def move(collection, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Move the legacy documents deleted in place, before deletes moved them, to the archive
+
+        Each batch is read on the `deletedAt` index, copied with one unordered
+        bulk_write of upserts, then removed with one delete_many. A document copied
+        twice after an interruption is replaced, so the mover can be re-run.
+
+        Args:
+            collection: Native live collection
+            batch_size: Documents moved per batch
+            dry_run: Only count the documents to move
+
+        Returns:
+            Number of documents moved, or to move
+        """
+        query = {DELETED_AT: {"$exists": True}}
+        if dry_run:
+            return {"moved": collection.count_documents(query)}
+        archive = Archive.collection(collection)
+        moved = 0
+        while True:
+            documents = list(collection.find(query, sort=[(DELETED_AT, ASCENDING)], limit=batch_size))
+            if not documents:
+                return {"moved": moved}
+            archive.bulk_write(
+                [ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in documents],
+                ordered=False
+            )
+            result = collection.delete_many({"_id": {"$in": [document["_id"] for document in documents]}, **query})
+            moved += result.deleted_count
+
+    @staticmethod
+    def restore(
+        collection,
+        _id: str,
+        duplicate_error: Optional[Callable[[Dict[str, Any]], Exception]] = None
+    ) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        Bring an archived document back to the live collection
+
+        The document is inserted back without its `deletedAt`, then removed from the
+        archive. When the live collection already holds its id (restored meanwhile, or
+        left live by an interrupted delete), the live document wins and is returned.
+
+        Args:
+            collection: Native live collection
+            _id: Document ID
+            duplicate_error: Builds the exception reported when a unique index of the
+                live collection rejects the document
+
+        Returns:
+            Tuple of (the live document, or None when the archive has no document with
+            this id, whether this call restored it)
+        """
+        _id = ObjectId(_id)
+        archive = Archive.collection(collection)
+        document = archive.find_one({"_id": _id})
+        if not document:
+            return None, False
+        document.pop(DELETED_AT, None)
+        try:
+            collection.insert_one(document)
+        except DuplicateKeyError:
+            live = collection.find_one({"_id": _id})
+            if live is None:
+                raise Archive._duplicate(document, duplicate_error)
+            archive.delete_one({"_id": _id})
+            return live, False
+        archive.delete_one({"_id": _id})
+        return document, True
+
+    @staticmethod
+    async def restore_async(
+        collection,
+        _id: str,
+        duplicate_error: Optional[Callable[[Dict[str, Any]], Exception]] = None
+    ) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Async variant of `restore` for AsyncCollection"""
+        _id = ObjectId(_id)
+        archive = Archive.async_collection(collection)
+        document = await archive.find_one({"_id": _id})
+        if not document:
+            return None, False
+        document.pop(DELETED_AT, None)
+        try:
+            await collection.insert_one(document)
+        except DuplicateKeyError:
+            live = await collection.find_one({"_id": _id})
+            if live is None:
+                raise Archive._duplicate(document, duplicate_error)
+            await archive.delete_one({"_id": _id})
+            return live, False
+        await archive.delete_one({"_id": _id})
+        return document, True
+
+    @staticmethod
+    def _duplicate(document: Dict[str, Any], duplicate_error) -> Exception:
+        """Exception reported when a unique index rejects a restored document"""
+        if duplicate_error is not None:
+            return duplicate_error(document)
+        return DuplicateKeyError(f"Document {document['_id']} conflicts with a live document")
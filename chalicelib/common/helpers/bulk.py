@@ -0,0 +1,386 @@
+"""Bulk helper for multi-document writes"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Type
+from bson import ObjectId
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from ...config.settings import BULK_WRITE_CONCURRENCY
+
+# Server error code of a unique index violation
+DUPLICATE_KEY_ERROR = 11000
+
+
+class Bulk:
+    """Helper class for bulk endpoints returning one result per item"""
+
+    @staticmethod
+    def error(index: int, message: str) -> Dict[str, Any]:
+        """Build the result of a failed item"""
+        return {"index": index, "error": message}
+
+    @staticmethod
+    def describe(error: ValidationError) -> str:
+        """Flatten a validation error into a single message"""
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc']) or 'item'}: {detail['msg']}"
+            for detail in error.errors()
+        )
+
+    @staticmethod
+    def validate(items: List[Any], model: Type[BaseModel]) -> Tuple[List[Tuple[int, BaseModel]], List[Dict[str, Any]]]:
+        """
+        Validate each item on its own, so one invalid item does not reject the batch
+
+        Args:
+            items: Raw items of the request body
+            model: Model validating an item
+
+        Returns:
+            Tuple of (list of (index, model) for valid items, results of invalid items)
+        """
+        valid, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, model.model_validate(item)))
+            except ValidationError as e:
+                errors.append(Bulk.error(index, Bulk.describe(e)))
+        return valid, errors
+
+    @staticmethod
+    def duplicate(index: int, _id: ObjectId, seen: Dict[ObjectId, int]) -> Optional[Dict[str, Any]]:
+        """Result of an item repeating the id of an earlier item, None the first time an id is seen"""
+        if _id in seen:
+            return Bulk.error(index, f"id: Duplicate of item {seen[_id]}")
+        seen[_id] = index
+        return None
+
+    @staticmethod
+    def validate_ids(items: List[Any]) -> Tuple[List[Tuple[int, ObjectId]], List[Dict[str, Any]]]:
+        """
+        Validate the ids of a bulk delete, an id repeated in the batch fails after its first item
+
+        Args:
+            items: Raw ids of the request body
+
+        Returns:
+            Tuple of (list of (index, _id) for valid ids, results of invalid ids)
+        """
+        valid, errors, seen = [], [], {}
+        for index, item in enumerate(items):
+            if not isinstance(item, str) or not ObjectId.is_valid(item):
+                errors.append(Bulk.error(index, "id: Invalid ObjectId"))
+                continue
+            duplicate = Bulk.duplicate(index, ObjectId(item), seen)
+            if duplicate:
+                errors.append(duplicate)
+                continue
+            valid.append((index, ObjectId(item)))
+        return valid, errors
+
+    @staticmethod
+    def validate_patches(
+        items: List[Any],
+        patch_model: Type[BaseModel]
+    ) -> Tuple[List[Tuple[int, ObjectId, BaseModel]], List[Dict[str, Any]]]:
+        """
+        Validate the {id, patch} items of a bulk patch, an id repeated in the batch fails after its first item
+
+        Args:
+            items: Raw items of the request body
+            patch_model: Model validating a patch
+
+        Returns:
+            Tuple of (list of (index, _id, patch) for valid items, results of invalid items)
+        """
+        valid, errors, seen = [], [], {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not isinstance(item.get("id"), str) or not ObjectId.is_valid(item["id"]):
+                errors.append(Bulk.error(index, "id: Invalid ObjectId"))
+                continue
+            duplicate = Bulk.duplicate(index, ObjectId(item["id"]), seen)
+            if duplicate:
+                errors.append(duplicate)
+                continue
+            try:
+                patch = patch_model.model_validate(item.get("patch") or {})
+            except ValidationError as e:
+                errors.append(Bulk.error(index, Bulk.describe(e)))
+                continue
+            if not patch.model_dump(exclude_none=True):
+                allowed = ", ".join(patch_model.model_fields)
+                errors.append(Bulk.error(index, f"patch: at least one of {allowed} is required"))
+                continue
+            valid.append((index, ObjectId(item["id"]), patch))
+        return valid, errors
+
+    @staticmethod
+    def insert_many(
+        collection,
+        documents: List[Tuple[int, Dict[str, Any]]],
+        duplicate_error: Optional[Callable[[Dict[str, Any]], Exception]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Insert documents with one unordered insert_many
+
+        Args:
+            collection: Native MongoDB collection
+            documents: List of (item index, document) to insert
+            duplicate_error: Builds the exception reported for a duplicate document
+
+        Returns:
+            One result per document, with the new id or the error
+        """
+        if not documents:
+            return []
+        try:
+            collection.insert_many([document for _, document in documents], ordered=False)
+            write_errors = []
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+        return Bulk.insert_results(documents, write_errors, duplicate_error)
+
+    @staticmethod
+    async def insert_many_async(
+        collection,
+        documents: List[Tuple[int, Dict[str, Any]]],
+        duplicate_error: Optional[Callable[[Dict[str, Any]], Exception]] = None
+    ) -> List[Dict[str, Any]]:
+        """Async variant of `insert_many` for AsyncCollection"""
+        if not documents:
+            return []
+        try:
+            await collection.insert_many([document for _, document in documents], ordered=False)
+            write_errors = []
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+        return Bulk.insert_results(documents, write_errors, duplicate_error)
+
+    @staticmethod
+    def insert_results(
+        documents: List[Tuple[int, Dict[str, Any]]],
+        write_errors: List[Dict[str, Any]],
+        duplicate_error: Optional[Callable[[Dict[str, Any]], Exception]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Build the per-item results of an unordered insert_many
+
+        The driver sets the _id of every document before sending them, and the write
+        errors point at the position of the document in the batch.
+
+        Args:
+            documents: List of (item index, document) that were sent
+            write_errors: Write errors of the BulkWriteError, if any
+            duplicate_error: Builds the exception reported for a duplicate document
+
+        Returns:
+            One result per document
+        """
+        failed = {error["index"]: error for error in write_errors}
+        results = []
+        for position, (index, document) in enumerate(documents):
+            error = failed.get(position)
+            if error is None:
+                results.append({"index": index, "id": str(document["_id"])})
+            elif error.get("code") == DUPLICATE_KEY_ERROR and duplicate_error:
+                results.append(Bulk.error(index, str(duplicate_error(document))))
+            else:
+                results.append(Bulk.error(index, error.get("errmsg", "Write failed")))
+        return results
+
+    @staticmethod
+    def projection(
+        targets: List[Tuple[int, ObjectId, Optional[Dict[str, Any]]]],
+        extra_fields: Iterable[str] = ()
+    ) -> Dict[str, int]:
+        """Projection reading the current value of every patched field, and of `extra_fields`"""
+        projection = {"_id": 1, **{field: 1 for field in extra_fields}}
+        for _, _, fields in targets:
+            projection.update({field: 1 for field in fields or {}})
+        return projection
+
+    @staticmethod
+    def write(collection, operations: List[Tuple[int, Any]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Run write operations with one unordered bulk_write
+
+        Args:
+            collection: Native MongoDB collection
+            operations: List of (item index, operation)
+
+        Returns:
+            Write errors keyed by item index
+        """
+        if not operations:
+            return {}
+        try:
+            collection.bulk_write([operation for _, operation in operations], ordered=False)
+            return {}
+        except BulkWriteError as e:
+            return Bulk.write_errors(operations, e)
+
+    @staticmethod
+    async def write_async(collection, operations: List[Tuple[int, Any]]) -> Dict[int, Dict[str, Any]]:
+        """Async variant of `write` for AsyncCollection"""
+        if not operations:
+            return {}
+        try:
+            await collection.bulk_write([operation for _, operation in operations], ordered=False)
+            return {}
+        except BulkWriteError as e:
+            return Bulk.write_errors(operations, e)
+
+    @staticmethod
+    def write_errors(operations: List[Tuple[int, Any]], error: BulkWriteError) -> Dict[int, Dict[str, Any]]:
+        """Key the write errors of a bulk_write by item index"""
+        return {
+            operations[write_error["index"]][0]: write_error
+            for write_error in error.details.get("writeErrors", [])
+        }
+
+    @staticmethod
+    def write_results(
+        targets: List[Tuple[int, ObjectId, Optional[Dict[str, Any]]]],
+        current: Dict[ObjectId, Dict[str, Any]],
+        failed: Dict[int, Dict[str, Any]],
+        duplicate_error: Optional[Callable[[Dict[str, Any]], Exception]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Build the per-item results of a bulk patch or delete
+
+        bulk_write only reports totals, so the per-item counts come from the documents
+        read before the write: an item matched when its document was live, and was
+        modified when one of its fields differed (always, for a delete).
+
+        Args:
+            targets: List of (item index, _id, fields set or None for a delete)
+            current: Documents read before the write, keyed by _id
+            failed: Write errors keyed by item index
+            duplicate_error: Builds the exception reported for a duplicate document
+
+        Returns:
+            One result per item
+        """
+        results = []
+        for index, _id, fields in targets:
+            error = failed.get(index)
+            if error is not None:
+                if error.get("code") == DUPLICATE_KEY_ERROR and duplicate_error:
+                    results.append(Bulk.error(index, str(duplicate_error(fields or {}))))
+                else:
+                    results.append(Bulk.error(index, error.get("errmsg", "Write failed")))
+                continue
+            document = current.get(_id)
+            matched = document is not None
+            modified = matched and (
+                fields is None or any(document.get(field) != value for field, value in fields.items())
+            )
+            results.append({"index": index, "id": str(_id), "matched": int(matched), "modified": int(modified)})
+        return results
+
+    @staticmethod
+    def write_each(
+        targets: List[Tuple[int, ObjectId, Optional[Dict[str, Any]]]],
+        write: Callable[[ObjectId, Optional[Dict[str, Any]]], Optional[Dict[str, Any]]],
+        duplicate_error: Optional[Callable[[Dict[str, Any]], Exception]] = None,
+        concurrency: int = BULK_WRITE_CONCURRENCY
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]]:
+        """
+        Write each item with its own find_one_and_* call, `concurrency` of them in flight
+
+        Used where the writes feed counters: each call returns the document it changed,
+        read atomically with the write, so the per-item counts and the (before, after)
+        pairs are exact even when other requests write the same documents.
+
+        Args:
+            targets: List of (item index, _id, fields set or None for a delete)
+            write: Writes one document and returns it as it was before, None when no
+                document matched
+            duplicate_error: Builds the exception reported for a duplicate document
+            concurrency: Writes kept in flight, by as many threads
+
+        Returns:
+            Tuple of (one result per item, (before, after) of the modified documents,
+            after is None for a delete)
+        """
+        def write_one(target: Tuple[int, ObjectId, Optional[Dict[str, Any]]]):
+            """(document before the write, None) or (None, error message)"""
+            _, _id, fields = target
+            try:
+                return write(_id, fields), None
+            except DuplicateKeyError as e:
+                return None, str(duplicate_error(fields or {})) if duplicate_error else str(e)
+            except PyMongoError as e:
+                return None, str(e)
+
+        if not targets:
+            return [], []
+        with ThreadPoolExecutor(min(concurrency, len(targets))) as pool:
+            written = list(pool.map(write_one, targets))
+        return Bulk.each_results(targets, written)
+
+    @staticmethod
+    async def write_each_async(
+        targets: List[Tuple[int, ObjectId, Optional[Dict[str, Any]]]],
+        write: Callable[[ObjectId, Optional[Dict[str, Any]]], Awaitable[Optional[Dict[str, Any]]]],
+        duplicate_error: Optional[Callable[[Dict[str, Any]], Exception]] = None,
+        concurrency: int = BULK_WRITE_CONCURRENCY
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]]:
+        """Async variant of `write_each`, the writes in flight are coroutines of the event loop"""
+        writes = asyncio.Semaphore(concurrency)
+
+        async def write_one(_id: ObjectId, fields: Optional[Dict[str, Any]]):
+            """(document before the write, None) or (None, error message)"""
+            try:
+                async with writes:
+                    return await write(_id, fields), None
+            except DuplicateKeyError as e:
+                return None, str(duplicate_error(fields or {})) if duplicate_error else str(e)
+            except PyMongoError as e:
+                return None, str(e)
+
+        written = await asyncio.gather(*(write_one(_id, fields) for _, _id, fields in targets))
+        return Bulk.each_results(targets, written)
+
+    @staticmethod
+    def each_results(
+        targets: List[Tuple[int, ObjectId, Optional[Dict[str, Any]]]],
+        written: List[Tuple[Optional[Dict[str, Any]], Optional[str]]]
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]]:
+        """Build the per-item results and the (before, after) pairs of `write_each`"""
+        results, changed = [], []
+        for (index, _id, fields), (before, error) in zip(targets, written):
+            if error is not None:
+                results.append(Bulk.error(index, error))
+                continue
+            matched = before is not None
+            modified = matched and (
+                fields is None or any(before.get(field) != value for field, value in fields.items())
+            )
+            if modified:
+                changed.append((before, None if fields is None else {**before, **fields}))
+            results.append({"index": index, "id": str(_id), "matched": int(matched), "modified": int(modified)})
+        return results, changed
+
+    @staticmethod
+    def response(results: List[Dict[str, Any]], success_status: HTTPStatus) -> Tuple[Dict[str, Any], HTTPStatus]:
+        """
+        Build the body and status of a bulk response
+
+        Args:
+            results: One result per item, in any order
+            success_status: Status returned when every item succeeded
+
+        Returns:
+            Tuple of (body, status), 207 Multi-Status when some items failed
+        """
+        results = sorted(results, key=lambda result: result["index"])
+        failed = sum(1 for result in results if "error" in result)
+        content = {
+            "total": len(results),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "results": results,
+        }
+        return content, (HTTPStatus.MULTI_STATUS if failed else success_status)
@@ -0,0 +1,54 @@
+"""In-process cache helper"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """Thread-safe in-process cache with per-entry expiry and a size bound"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 1024):
+        """
+        Initialize the cache
+
+        Args:
+            ttl_seconds: Seconds an entry stays fresh
+            max_entries: Maximum number of entries, least recently set are evicted first
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a fresh value, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.ttl_seconds:
+            return default
+        return entry[0]
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value even if it has expired, or default if missing"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Remove a value"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every value"""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,149 @@
+"""Counters helper for denormalized counts maintained on write"""
+from collections import Counter, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+
+
+class Counters:
+    """
+    Helper class turning document changes into `$inc` updates of counters
+
+    A counted document contributes to the counters of the document it references:
+    an application to the counts of its job, a published job to the count of its
+    entreprise. The counters are updated after the write of the counted document,
+    so a failure in between leaves them drifted until `manage.py reconcile-counters`.
+    """
+
+    @staticmethod
+    def changes(
+        pairs: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]],
+        reference_field: str,
+        contributions: Callable[[Dict[str, Any]], Dict[str, int]]
+    ) -> Dict[ObjectId, Dict[str, int]]:
+        """
+        Compute the net increments of counted documents going from before to after
+
+        Args:
+            pairs: (before, after) of each written document, None when it did not or
+                no longer exists
+            reference_field: Field holding the id of the document owning the counters
+            contributions: Counters a document contributes to, by field
+
+        Returns:
+            Non zero increments by id of the referenced document
+        """
+        increments = defaultdict(Counter)
+        for before, after in pairs:
+            for document, sign in ((before, -1), (after, 1)):
+                if not document or not ObjectId.is_valid(str(document.get(reference_field))):
+                    continue
+                target = increments[ObjectId(str(document[reference_field]))]
+                for field, count in contributions(document).items():
+                    target[field] += sign * count
+        return {
+            target: {field: count for field, count in counts.items() if count}
+            for target, counts in increments.items()
+            if any(counts.values())
+        }
+
+    @staticmethod
+    def operations(increments: Dict[ObjectId, Dict[str, int]]) -> List[UpdateOne]:
+        """Build one `$inc` update per referenced document"""
+        return [UpdateOne({"_id": target}, {"$inc": counts}) for target, counts in increments.items()]
+
+    @staticmethod
+    def apply(collection, increments: Dict[ObjectId, Dict[str, int]]):
+        """Apply increments with one unordered bulk_write"""
+        if increments:
+            collection.bulk_write(Counters.operations(increments), ordered=False)
+
+    @staticmethod
+    async def apply_async(collection, increments: Dict[ObjectId, Dict[str, int]]):
+        """Async variant of `apply` for AsyncCollection"""
+        if increments:
+            await collection.bulk_write(Counters.operations(increments), ordered=False)
+
+    @staticmethod
+    def reconcile(
+        collection,
+        fields: List[str],
+        recount: Callable[[List[ObjectId]], Dict[ObjectId, Dict[str, Any]]],
+        batch_size: int = 500,
+        dry_run: bool = False
+    ) -> Dict[str, int]:
+        """
+        Recompute counters in batches and rewrite the drifted ones
+
+        Documents are walked in `_id` order, and each batch is recounted with one
+        aggregation. A `$inc` landing between the recount and the `$set` of the same
+        document is lost, so run it while writes are quiet.
+
+        Args:
+            collection: Native collection of the documents holding the counters
+            fields: Counter fields, the only ones read
+            recount: Expected counters of a batch of document ids, by id
+            batch_size: Documents checked per batch
+            dry_run: Only count the drifted documents
+
+        Returns:
+            Counts of checked and drifted documents
+        """
+        totals = {"checked": 0, "drifted": 0}
+        last_id = None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            projection = {field: 1 for field in fields}
+            documents = list(collection.find(query, projection, sort=[("_id", 1)], limit=batch_size))
+            if not documents:
+                return totals
+            last_id = documents[-1]["_id"]
+            expected = recount([document["_id"] for document in documents])
+            operations = [
+                UpdateOne({"_id": document["_id"]}, {"$set": expected[document["_id"]]})
+                for document in documents
+                if Counters.drifted(document, expected[document["_id"]])
+            ]
+            totals["checked"] += len(documents)
+            totals["drifted"] += len(operations)
+            if operations and not dry_run:
+                collection.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    async def reconcile_async(
+        collection,
+        fields: List[str],
+        recount: Callable[[List[ObjectId]], Awaitable[Dict[ObjectId, Dict[str, Any]]]],
+        batch_size: int = 500,
+        dry_run: bool = False
+    ) -> Dict[str, int]:
+        """Async variant of `reconcile` for AsyncCollection"""
+        totals = {"checked": 0, "drifted": 0}
+        last_id = None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            projection = {field: 1 for field in fields}
+            cursor = collection.find(query, projection, sort=[("_id", 1)], limit=batch_size)
+            documents = await cursor.to_list(None)
+            if not documents:
+                return totals
+            last_id = documents[-1]["_id"]
+            expected = await recount([document["_id"] for document in documents])
+            operations = [
+                UpdateOne({"_id": document["_id"]}, {"$set": expected[document["_id"]]})
+                for document in documents
+                if Counters.drifted(document, expected[document["_id"]])
+            ]
+            totals["checked"] += len(documents)
+            totals["drifted"] += len(operations)
+            if operations and not dry_run:
+                await collection.bulk_write(operations, ordered=False)
+
+    @staticmethod
+    def drifted(stored: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+        """Compare stored counters with recomputed ones, zero entries are ignored"""
+        def normalize(value):
+            if isinstance(value, dict):
+                return {key: count for key, count in value.items() if count}
+            return value or 0
+        return any(normalize(stored.get(field)) != normalize(value) for field, value in expected.items())
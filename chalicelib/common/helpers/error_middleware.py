@@ -1,7 +1,7 @@
 """Error handling middleware"""
+import inspect
 from functools import wraps
 from http import HTTPStatus
-from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
 from ..enums.response_type_enum import ResponseTypeEnum
 from ..exceptions.exception import (
@@ -12,82 +12,40 @@ from ..exceptions.exception import (
 from ..helpers.message_response_helper import MessageResponseHelper
 
 
+def build_error_response(e: Exception) -> JSONResponse:
+    """Map an exception raised by a route handler to a JSON error response"""
+    if isinstance(e, UserAlreadyExistsException):
+        message, status_code = str(e), HTTPStatus.CONFLICT
+    elif isinstance(e, UserNotFoundException):
+        message, status_code = str(e), HTTPStatus.NOT_FOUND
+    elif isinstance(e, (UserException, JobException, EntrepriseException,
+                        EmploiException, CandidatException, ApplicationException)):
+        message, status_code = str(e), HTTPStatus.BAD_REQUEST
+    elif isinstance(e, ValueError):
+        message, status_code = str(e), HTTPStatus.BAD_REQUEST
+    else:
+        message, status_code = f"Internal server error: {str(e)}", HTTPStatus.INTERNAL_SERVER_ERROR
+    message_response = MessageResponseHelper.build(ResponseTypeEnum.ERROR, message)
+    return JSONResponse(content=message_response, status_code=status_code)
+
+
 def exception_handler(func):
     """Decorator to handle exceptions in route handlers"""
     @wraps(func)
     async def async_wrapper(*args, **kwargs):
         try:
             return await func(*args, **kwargs)
-        except UserAlreadyExistsException as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                str(e)
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.CONFLICT)
-        except UserNotFoundException as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                str(e)
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
-        except (UserException, JobException, EntrepriseException, 
-                EmploiException, CandidatException, ApplicationException) as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                str(e)
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
-        except ValueError as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                str(e)
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
         except Exception as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                f"Internal server error: {str(e)}"
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
-    
+            return build_error_response(e)
+
     @wraps(func)
     def sync_wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
-        except UserAlreadyExistsException as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                str(e)
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.CONFLICT)
-        except UserNotFoundException as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                str(e)
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
-        except (UserException, JobException, EntrepriseException, 
-                EmploiException, CandidatException, ApplicationException) as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                str(e)
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
-        except ValueError as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                str(e)
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
         except Exception as e:
-            message_response = MessageResponseHelper.build(
-                ResponseTypeEnum.ERROR,
-                f"Internal server error: {str(e)}"
-            )
-            return JSONResponse(content=message_response, status_code=HTTPStatus.INTERNAL_SERVER_ERROR)
-    
-    # Return appropriate wrapper based on whether the function is async or not
-    import inspect
+            return build_error_response(e)
+
+    # Keep coroutine handlers on the event loop, sync handlers run in the threadpool
     if inspect.iscoroutinefunction(func):
         return async_wrapper
     else:
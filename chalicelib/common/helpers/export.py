@@ -0,0 +1,113 @@
+"""Export helper for streaming whole collections"""
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Type
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+
+class Export:
+    """Helper class streaming validated documents as NDJSON or CSV"""
+
+    NDJSON = "ndjson"
+    CSV = "csv"
+    media_types = {NDJSON: "application/x-ndjson", CSV: "text/csv"}
+
+    @staticmethod
+    def check_format(export_format: Optional[str]) -> str:
+        """
+        Validate the `format=` query parameter
+
+        Args:
+            export_format: Requested format, NDJSON when missing
+
+        Returns:
+            The normalized format
+        """
+        export_format = (export_format or Export.NDJSON).lower()
+        if export_format not in Export.media_types:
+            raise ValueError(f"format must be one of: {', '.join(Export.media_types)}")
+        return export_format
+
+    @staticmethod
+    def columns(projection: Optional[Dict[str, int]], model: Type[BaseModel]) -> List[str]:
+        """
+        List the CSV columns of documents read with a projection
+
+        Args:
+            projection: Projection of the read, None for full documents
+            model: Full model of the collection
+
+        Returns:
+            Field names, in the order of the model
+        """
+        names = {name: (info.alias or name) for name, info in model.model_fields.items()}
+        if not projection:
+            return list(names)
+        # Like MongoDB, _id is returned unless excluded and the other fields tell an
+        # inclusion from an exclusion
+        if any(value for key, value in projection.items() if key != "_id"):
+            return [name for name, key in names.items() if projection.get(key, key == "_id")]
+        return [name for name, key in names.items() if projection.get(key, 1)]
+
+    @staticmethod
+    async def ndjson(models: AsyncIterator[BaseModel]) -> AsyncIterator[str]:
+        """Serialize models as one JSON document per line"""
+        async for model in models:
+            yield model.model_dump_json(exclude_none=True) + "\n"
+
+    @staticmethod
+    async def csv(models: AsyncIterator[BaseModel], columns: List[str]) -> AsyncIterator[str]:
+        """Serialize models as CSV rows, booleans, lists and objects are JSON encoded"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        async for model in models:
+            data = model.model_dump(mode="json")
+            writer.writerow([Export.cell(data.get(column)) for column in columns])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    @staticmethod
+    def cell(value: Any) -> str:
+        """Convert a JSON value to a CSV cell"""
+        if value is None:
+            return ""
+        if isinstance(value, (bool, list, dict)):
+            return json.dumps(value)
+        return str(value)
+
+    @staticmethod
+    def response(
+        models: AsyncIterator[BaseModel],
+        export_format: str,
+        columns: List[str],
+        filename: str
+    ) -> StreamingResponse:
+        """
+        Stream models in the requested format
+
+        Rows are written as the cursor yields them, so memory does not grow with the
+        size of the export. Errors raised once streaming started end the response.
+
+        Args:
+            models: Validated documents, in export order
+            export_format: Format returned by `check_format`
+            columns: CSV columns
+            filename: Base name of the downloaded file
+
+        Returns:
+            The streaming response
+        """
+        if export_format == Export.CSV:
+            content = Export.csv(models, columns)
+        else:
+            content = Export.ndjson(models)
+        return StreamingResponse(
+            content,
+            media_type=Export.media_types[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+        )
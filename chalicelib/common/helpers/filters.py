@@ -1,12 +1,16 @@
 """Filters helper for query building"""
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+from ...config.settings import MAX_PAGE_SIZE
 
 
 class Filters:
     """Helper class for building MongoDB queries with filtering and pagination"""
-    
-    # Filter for non-deleted documents
-    deleted_at_filter = {"deletedAt": None}
+
+    # Ways of computing the total of a list
+    TOTAL_NONE = "false"
+    TOTAL_EXACT = "exact"
+    TOTAL_ESTIMATED = "estimated"
+    total_modes = (TOTAL_NONE, TOTAL_EXACT, TOTAL_ESTIMATED)
     
     def __init__(
         self,
@@ -15,6 +19,9 @@ class Filters:
         email: Optional[str] = None,
         skip: int = 0,
         limit: int = 100,
+        cursor: Optional[str] = None,
+        include_total: Optional[str] = None,
+        fields: Optional[str] = None,
         **kwargs
     ):
         """
@@ -25,13 +32,53 @@ class Filters:
             status: Filter by status
             email: Filter by email
             skip: Number of documents to skip
-            limit: Maximum number of documents to return
+            limit: Maximum number of documents to return, capped at MAX_PAGE_SIZE
+            cursor: Keyset cursor, empty string for the first page, None for offset mode
+            include_total: How to compute the total (false, exact or estimated)
+            fields: Comma separated fields to return, "*" for full documents
         """
         self.role = role
         self.status = status
         self.email = email
-        self.skip = int(skip) if skip else 0
-        self.limit = int(limit) if limit else 100
+        self.skip = int(skip) if skip is not None else 0
+        if self.skip < 0:
+            raise ValueError("skip must not be negative")
+        self.limit = min(int(limit), MAX_PAGE_SIZE) if limit is not None else 100
+        if self.limit < 1:
+            raise ValueError("limit must be at least 1")
+        self.cursor = cursor
+        self.include_total = (include_total or self.TOTAL_EXACT).lower()
+        if self.include_total not in self.total_modes:
+            raise ValueError(f"includeTotal must be one of: {', '.join(self.total_modes)}")
+        self.fields = self.parse_fields(fields)
+
+    @staticmethod
+    def changed_filter(fields: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build a predicate matching documents where at least one field differs
+
+        Args:
+            fields: Field values about to be set
+
+        Returns:
+            MongoDB predicate, so an update leaves unchanged documents untouched
+        """
+        return {"$or": [{field: {"$ne": value}} for field, value in fields.items()]}
+
+    @staticmethod
+    def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+        """
+        Split a `fields=` query parameter
+
+        Args:
+            fields: Comma separated field names
+
+        Returns:
+            List of field names, or None when no selection was made
+        """
+        if not fields:
+            return None
+        return [field.strip() for field in fields.split(",") if field.strip()] or None
         
     def apply(self) -> Dict[str, Any]:
         """
@@ -40,7 +87,7 @@ class Filters:
         Returns:
             Dictionary representing MongoDB query
         """
-        query = {**self.deleted_at_filter}
+        query = {}
         
         if self.role:
             query["role"] = self.role
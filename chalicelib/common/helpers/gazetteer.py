@@ -0,0 +1,172 @@
+"""Offline geocoding helper backed by the gazetteer shipped with the package"""
+import csv
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from pymongo import UpdateOne
+
+# Places file: name, latitude, longitude and `|` separated aliases
+GAZETTEER_FILE = Path(__file__).resolve().parent.parent / "data" / "gazetteer.csv"
+# Mean Earth radius used by MongoDB spherical queries
+EARTH_RADIUS_KM = 6378.1
+
+
+class Gazetteer:
+    """
+    Helper class geocoding free-text locations without any network call
+
+    Locations are matched against the place names and aliases of the gazetteer,
+    accents, case and punctuation folded: the whole text first, then each comma
+    separated part, then the longest run of words naming a place, so
+    "La Marsa, Tunis" and "Sfax - Tunisie" are both found.
+    """
+
+    # Separators between the parts of a location, most specific part first
+    PARTS = re.compile(r"[,;/|()]")
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Fold accents, case and punctuation of a place name"""
+        folded = unicodedata.normalize("NFKD", text)
+        folded = "".join(char for char in folded if not unicodedata.combining(char))
+        return " ".join(re.findall(r"[a-z0-9]+", folded.lower()))
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def places() -> Dict[str, Tuple[float, float]]:
+        """Coordinates as (longitude, latitude), by normalized name and alias"""
+        places = {}
+        with open(GAZETTEER_FILE, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                coordinates = (float(row["longitude"]), float(row["latitude"]))
+                for name in [row["name"], *(row["aliases"] or "").split("|")]:
+                    if name.strip():
+                        places.setdefault(Gazetteer.normalize(name), coordinates)
+        return places
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def max_words() -> int:
+        """Number of words of the longest place name"""
+        return max(len(name.split()) for name in Gazetteer.places())
+
+    @staticmethod
+    def point(longitude: float, latitude: float) -> Dict[str, Any]:
+        """Build a GeoJSON point"""
+        return {"type": "Point", "coordinates": [longitude, latitude]}
+
+    @staticmethod
+    def geocode(location: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Find the point of a free-text location
+
+        Args:
+            location: Location as entered, e.g. "Lac 2, Tunis"
+
+        Returns:
+            GeoJSON point, or None when no place of the gazetteer is named
+        """
+        if not location:
+            return None
+        places = Gazetteer.places()
+        for candidate in Gazetteer._candidates(location):
+            if candidate in places:
+                return Gazetteer.point(*places[candidate])
+        return None
+
+    @staticmethod
+    def _candidates(location: str) -> Iterator[str]:
+        """Normalized texts to look up, from the whole location to single words"""
+        yield Gazetteer.normalize(location)
+        parts = [Gazetteer.normalize(part) for part in Gazetteer.PARTS.split(location)]
+        for part in parts:
+            yield part
+        for part in parts:
+            words = part.split()
+            for size in range(min(len(words), Gazetteer.max_words()), 0, -1):
+                for start in range(len(words) - size + 1):
+                    yield " ".join(words[start:start + size])
+
+    @staticmethod
+    def parse(near: str) -> Dict[str, Any]:
+        """
+        Read the `near=` parameter of a geo query
+
+        Args:
+            near: "latitude,longitude" or a place name of the gazetteer
+
+        Returns:
+            GeoJSON point
+        """
+        match = re.fullmatch(r"\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*", near or "")
+        if match:
+            latitude, longitude = float(match.group(1)), float(match.group(2))
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError("near: Invalid coordinates")
+            return Gazetteer.point(longitude, latitude)
+        point = Gazetteer.geocode(near)
+        if point is None:
+            raise ValueError(f"near: Unknown place {near}")
+        return point
+
+    @staticmethod
+    def within(field: str, point: Dict[str, Any], radius_km: float) -> Dict[str, Any]:
+        """Predicate matching the points of a field within a radius, usable in counts"""
+        return {field: {"$geoWithin": {"$centerSphere": [point["coordinates"], radius_km / EARTH_RADIUS_KM]}}}
+
+    @staticmethod
+    def document(document: Dict[str, Any], location_field: str, point_field: str) -> Dict[str, Any]:
+        """
+        Geocode the location of a serialized document or patch, in place, before it is written
+
+        The point is set to None when the location names no known place, so a
+        changed location never keeps the point of the previous one.
+        """
+        if location_field in document:
+            document[point_field] = Gazetteer.geocode(document[location_field])
+        return document
+
+    @staticmethod
+    def backfill(
+        collection,
+        location_field: str,
+        point_field: str,
+        batch_size: int = 1000,
+        refresh_all: bool = False
+    ) -> Dict[str, int]:
+        """
+        Geocode the documents written before their location was geocoded
+
+        Documents are walked in `_id` order and each batch is written with one
+        unordered bulk_write.
+
+        Args:
+            collection: Native MongoDB collection
+            location_field: Field holding the free-text location
+            point_field: Field receiving the GeoJSON point
+            batch_size: Documents read and written per batch
+            refresh_all: Also geocode the documents that already went through it,
+                after the gazetteer was extended
+
+        Returns:
+            Number of documents checked and located
+        """
+        query = {} if refresh_all else {point_field: {"$exists": False}}
+        checked, located, last_id = 0, 0, None
+        while True:
+            batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+            cursor = collection.find(batch_query, {location_field: 1}).sort("_id", 1).limit(batch_size)
+            documents: List[Dict[str, Any]] = list(cursor)
+            if not documents:
+                break
+            last_id = documents[-1]["_id"]
+            operations = []
+            for document in documents:
+                point = Gazetteer.geocode(document.get(location_field))
+                located += point is not None
+                operations.append(UpdateOne({"_id": document["_id"]}, {"$set": {point_field: point}}))
+            collection.bulk_write(operations, ordered=False)
+            checked += len(documents)
+        return {"checked": checked, "located": located}
@@ -0,0 +1,303 @@
+"""Import helper for loading NDJSON or CSV files into a collection"""
+import csv
+import hashlib
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type
+from bson import ObjectId
+from pydantic import BaseModel, ValidationError
+from pymongo.errors import BulkWriteError
+from .bulk import Bulk, DUPLICATE_KEY_ERROR
+from .typed_query import TypedQuery
+
+logger = logging.getLogger(__name__)
+
+
+class ImportHelper:
+    """
+    Load a file into a collection in batches
+
+    Batches are validated by a process pool and written by a thread pool keeping
+    several unordered insert_many in flight. Documents without an id get one derived
+    from the content of the file and their record number, so an import resumed from
+    its checkpoint skips the documents already written as duplicates instead of
+    inserting them twice, while another file of the same name gets other ids.
+    """
+
+    NDJSON = "ndjson"
+    CSV = "csv"
+    formats = (NDJSON, CSV)
+
+    def __init__(
+        self,
+        collection,
+        model: Type[BaseModel],
+        source: str,
+        file_format: Optional[str] = None,
+        batch_size: int = 1000,
+        workers: Optional[int] = None,
+        writers: int = 4,
+        checkpoint: Optional[str] = None,
+        lowercase: Sequence[str] = (),
+        derive: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+    ):
+        """
+        Initialize an import
+
+        Args:
+            collection: Native MongoDB collection to write to
+            model: Model validating a record
+            source: Path of the NDJSON or CSV file
+            file_format: ndjson or csv, guessed from the file extension when missing
+            batch_size: Records validated and inserted together
+            workers: Validation processes, one per CPU when missing
+            writers: insert_many kept in flight
+            checkpoint: Path of the checkpoint file, None to always start over
+            lowercase: Fields stored in lowercase, like the services do
+            derive: Sets the fields the create path derives (location point, ...) on a
+                document, a module level function or static method so the workers can load it
+        """
+        self.collection = collection
+        self.model = model
+        self.source = source
+        self.file_format = self.detect_format(source, file_format)
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.writers = writers
+        self.checkpoint = checkpoint
+        self.lowercase = tuple(lowercase)
+        self.derive = derive
+        self.source_hash = self.file_hash(source)
+        self.totals = {"read": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "failed": 0}
+        self.errors: List[Dict[str, Any]] = []
+        self._finished: Dict[int, int] = {}
+        self._done = 0
+
+    @staticmethod
+    def detect_format(source: str, file_format: Optional[str] = None) -> str:
+        """Validate the file format, or guess it from the file extension"""
+        file_format = (file_format or os.path.splitext(source)[1].lstrip(".")).lower()
+        if file_format == "jsonl":
+            file_format = ImportHelper.NDJSON
+        if file_format not in ImportHelper.formats:
+            raise ValueError(f"format must be one of: {', '.join(ImportHelper.formats)}")
+        return file_format
+
+    @staticmethod
+    def file_hash(source: str) -> str:
+        """SHA-256 of the content of a file, read in chunks"""
+        digest = hashlib.sha256()
+        with open(source, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def csv_record(row: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Convert a CSV row written by the export back to a record
+
+        Empty cells are left out, and lists and objects are JSON decoded; the model
+        coerces the remaining strings.
+        """
+        record = {}
+        for column, cell in row.items():
+            if cell is None or cell == "":
+                continue
+            if cell[0] in "[{":
+                cell = json.loads(cell)
+            record[column] = cell
+        return record
+
+    def read_batches(self, skip: int = 0) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """
+        Read the file in batches
+
+        Args:
+            skip: Number of records already imported
+
+        Yields:
+            Tuple of (number of the first record, records)
+        """
+        with open(self.source, newline="", encoding="utf-8") as file:
+            if self.file_format == self.CSV:
+                records = (self.csv_record(row) for row in csv.DictReader(file))
+            else:
+                records = (json.loads(line) for line in file if line.strip())
+            batch, start = [], skip
+            for number, record in enumerate(records):
+                if number < skip:
+                    continue
+                batch.append(record)
+                if len(batch) == self.batch_size:
+                    yield start, batch
+                    batch, start = [], number + 1
+            if batch:
+                yield start, batch
+
+    @staticmethod
+    def document_id(source_hash: str, number: int, created_at: Optional[datetime] = None) -> ObjectId:
+        """
+        Derive a stable ObjectId for a record without id
+
+        The id is hashed from the content hash of the file and the record number. When
+        the record has a creation date, it fills the timestamp part so the id still
+        sorts with it.
+        """
+        key = f"{source_hash}:{number}".encode()
+        if created_at is None:
+            return ObjectId(hashlib.blake2b(key, digest_size=12).digest())
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        timestamp = int(created_at.timestamp()).to_bytes(4, "big")
+        return ObjectId(timestamp + hashlib.blake2b(key, digest_size=8).digest())
+
+    @staticmethod
+    def validate_batch(
+        model: Type[BaseModel],
+        source_hash: str,
+        start: int,
+        records: List[Dict[str, Any]],
+        lowercase: Tuple[str, ...] = (),
+        derive: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+    ) -> Tuple[int, List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+        """
+        Validate a batch, in a worker process
+
+        Returns:
+            Tuple of (first record number, (record number, document) to insert, errors)
+        """
+        documents, errors = [], []
+        for number, record in enumerate(records, start):
+            try:
+                document = model.model_validate(record).model_dump(by_alias=True, exclude_none=True)
+            except ValidationError as e:
+                errors.append(Bulk.error(number, Bulk.describe(e)))
+                continue
+            TypedQuery.document(model, document)
+            for field in lowercase:
+                if isinstance(document.get(field), str):
+                    document[field] = document[field].lower()
+            if derive is not None:
+                derive(document)
+            if document.get("_id"):
+                document["_id"] = ObjectId(document["_id"])
+            else:
+                # The model defaults createdAt to now, which would change on every run
+                created_at = document.get("createdAt") if record.get("createdAt") else None
+                document["_id"] = ImportHelper.document_id(source_hash, number, created_at)
+            documents.append((number, document))
+        return start, documents, errors
+
+    def insert_batch(self, documents: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Insert a validated batch with one unordered insert_many, in a writer thread"""
+        if not documents:
+            return []
+        try:
+            self.collection.insert_many([document for _, document in documents], ordered=False)
+            return []
+        except BulkWriteError as e:
+            return [
+                {
+                    **Bulk.error(documents[error["index"]][0], error.get("errmsg", "Write failed")),
+                    "duplicate": self.duplicate_id(error),
+                }
+                for error in e.details.get("writeErrors", [])
+            ]
+
+    @staticmethod
+    def duplicate_id(error: Dict[str, Any]) -> bool:
+        """Whether a write error is a duplicate `_id`, a record already imported, and not of another unique index"""
+        if error.get("code") != DUPLICATE_KEY_ERROR:
+            return False
+        key_pattern = error.get("keyPattern")
+        if key_pattern is not None:
+            return list(key_pattern) == ["_id"]
+        return " index: _id_ " in error.get("errmsg", "")
+
+    def load_checkpoint(self) -> int:
+        """Number of records already imported from the source, 0 without checkpoint"""
+        if not self.checkpoint or not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint, encoding="utf-8") as file:
+            state = json.load(file)
+        if state.get("source") != os.path.abspath(self.source):
+            raise ValueError(f"Checkpoint {self.checkpoint} belongs to {state.get('source')}")
+        # A rewritten file would resume at a record number meaning another record
+        if state.get("sha256") != self.source_hash:
+            raise ValueError(f"Checkpoint {self.checkpoint} belongs to another content of {self.source}")
+        return int(state.get("records", 0))
+
+    def save_checkpoint(self):
+        """Record the number of records imported, written atomically"""
+        if not self.checkpoint:
+            return
+        temporary = f"{self.checkpoint}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"source": os.path.abspath(self.source), "sha256": self.source_hash, "records": self._done}, file)
+        os.replace(temporary, self.checkpoint)
+
+    def run(self) -> Dict[str, int]:
+        """
+        Import the file, resuming from the checkpoint when there is one
+
+        Returns:
+            Counts of read, inserted, duplicate, invalid and failed records
+        """
+        self._done = self.load_checkpoint()
+        if self._done:
+            logger.info("Resuming %s after %s records", self.source, self._done)
+
+        with ProcessPoolExecutor(self.workers) as validators, ThreadPoolExecutor(self.writers) as writers:
+            validating, writing = deque(), {}
+            for start, records in self.read_batches(self._done):
+                self.totals["read"] += len(records)
+                validating.append(validators.submit(
+                    self.validate_batch, self.model, self.source_hash, start, records, self.lowercase, self.derive
+                ))
+                # Bound the batches held in memory to what the pools can work on
+                if len(validating) >= self.workers * 2:
+                    self._write(validating.popleft().result(), writers, writing)
+            while validating:
+                self._write(validating.popleft().result(), writers, writing)
+            self._collect(writing, wait(writing).done)
+
+        return self.totals
+
+    def _write(self, validated, writers: ThreadPoolExecutor, writing: Dict[Any, Tuple[int, int, int]]):
+        """Submit a validated batch to the writers, waiting when they are all busy"""
+        start, documents, errors = validated
+        self.totals["invalid"] += len(errors)
+        self.errors.extend(errors)
+        while len(writing) >= self.writers:
+            self._collect(writing, wait(writing, return_when=FIRST_COMPLETED).done)
+        end = start + len(documents) + len(errors)
+        writing[writers.submit(self.insert_batch, documents)] = (start, end, len(documents))
+
+    def _collect(self, writing: Dict[Any, Tuple[int, int, int]], done):
+        """Count finished writes and move the checkpoint past the batches all written"""
+        for future in done:
+            start, end, count = writing.pop(future)
+            failures = future.result()
+            # Duplicates of another unique index are rejected records, reported with their message
+            duplicates = sum(1 for failure in failures if failure["duplicate"])
+            self.totals["duplicates"] += duplicates
+            self.totals["failed"] += len(failures) - duplicates
+            self.totals["inserted"] += count - len(failures)
+            self.errors.extend(
+                Bulk.error(failure["index"], failure["error"])
+                for failure in failures if not failure["duplicate"]
+            )
+            self._finished[start] = end
+
+        # Batches finish out of order, the checkpoint only covers a contiguous prefix
+        advanced = False
+        while self._done in self._finished:
+            self._done = self._finished.pop(self._done)
+            advanced = True
+        if advanced:
+            self.save_checkpoint()
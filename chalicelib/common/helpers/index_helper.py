@@ -0,0 +1,274 @@
+"""Index helper for reconciling declared schema indexes with MongoDB"""
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+from pymongo import IndexModel, TEXT
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+
+class IndexHelper:
+    """Helper class to create or reconcile the indexes declared on schemas"""
+
+    CREATE = "create"
+    REBUILD = "rebuild"
+    DROP = "drop"
+
+    # Suffix of the name a replacement is built under while the old index still serves
+    TEMPORARY_SUFFIX = "_rebuild"
+
+    # Errors of an index whose keys are already indexed under another name or with other options
+    CONFLICT_CODES = (85, 86)
+
+    # Options compared between the declared and the existing index, with their defaults
+    compared_options = {
+        "unique": False,
+        "sparse": False,
+        "partialFilterExpression": None,
+        "expireAfterSeconds": None,
+        "weights": None,
+        "default_language": "english",
+    }
+
+    @staticmethod
+    def plan(schema, prune: bool = False) -> List[Dict[str, Any]]:
+        """
+        Compute the actions needed to make the collection match the schema indexes
+
+        Args:
+            schema: Schema declaring an `indexes` list of IndexModel
+            prune: Also drop indexes that are not declared on the schema
+
+        Returns:
+            List of actions (create, rebuild or drop)
+        """
+        existing = schema.native_collection.index_information()
+        declared: List[IndexModel] = getattr(schema, "indexes", [])
+        declared_names = {index.document["name"] for index in declared}
+        actions = []
+
+        for index in declared:
+            spec = index.document
+            name = spec["name"]
+            current = existing.get(name)
+            if current is not None:
+                if not IndexHelper._matches(spec, current):
+                    actions.append(IndexHelper._action(
+                        schema, IndexHelper.REBUILD, name, index, drop_name=name, previous=current
+                    ))
+                continue
+
+            # Same keys under another name would make create_index fail
+            renamed = next(
+                (
+                    existing_name for existing_name, info in existing.items()
+                    if existing_name != "_id_"
+                    and existing_name not in declared_names
+                    and IndexHelper._keys(info["key"]) == IndexHelper._keys(spec["key"])
+                ),
+                None
+            )
+            if renamed:
+                actions.append(IndexHelper._action(
+                    schema, IndexHelper.REBUILD, name, index, drop_name=renamed, previous=existing[renamed]
+                ))
+            else:
+                actions.append(IndexHelper._action(schema, IndexHelper.CREATE, name, index))
+
+        if prune:
+            rebuilt = {action["drop_name"] for action in actions if action.get("drop_name")}
+            for existing_name in existing:
+                if existing_name == "_id_" or existing_name in declared_names or existing_name in rebuilt:
+                    continue
+                actions.append(IndexHelper._action(schema, IndexHelper.DROP, existing_name, None, drop_name=existing_name))
+
+        return actions
+
+    @staticmethod
+    def apply(schema, actions: List[Dict[str, Any]], rebuild: bool = True) -> List[Dict[str, Any]]:
+        """
+        Apply planned actions on the schema collection
+
+        A rebuild never leaves the collection without its index: the replacement is
+        built first, and the old index is only dropped once the data is known to fit it.
+
+        Args:
+            schema: Schema owning the collection
+            actions: Actions returned by `plan`
+            rebuild: Also rebuild and drop indexes, otherwise only missing ones are created
+
+        Returns:
+            The actions, each with a `status` and an optional `error`
+        """
+        collection = schema.native_collection
+        for action in actions:
+            if not rebuild and action["action"] != IndexHelper.CREATE:
+                action["status"] = "skipped"
+                logger.warning(
+                    "Index %s on %s needs a %s, run `manage.py ensure-indexes`",
+                    action["name"], action["collection"], action["action"]
+                )
+                continue
+            try:
+                if action["action"] == IndexHelper.REBUILD:
+                    IndexHelper._rebuild(collection, action)
+                elif action["action"] == IndexHelper.DROP:
+                    collection.drop_index(action["drop_name"])
+                else:
+                    collection.create_indexes([action["index"]])
+                action["status"] = "applied"
+            except OperationFailure as e:
+                action["status"] = "failed"
+                action["error"] = str(e)
+                logger.error("Index %s on %s failed: %s", action["name"], action["collection"], e)
+        return actions
+
+    @staticmethod
+    def _rebuild(collection, action: Dict[str, Any]) -> None:
+        """
+        Replace an index, building the replacement before the old index is dropped
+
+        The replacement is first built under a temporary name next to the old index,
+        a build failing on the data (duplicates of a unique index, ...) leaves the old
+        one untouched. The server refuses two indexes on the same keys unless their
+        options allow it; the data is then checked up front instead. Once the old
+        index is dropped the replacement takes its final name, and should that build
+        fail all the same, the old index is created again.
+        """
+        index = action["index"]
+        spec = index.document
+        temporary = spec["name"] + IndexHelper.TEMPORARY_SUFFIX
+        try:
+            collection.create_indexes([IndexModel(
+                list(spec["key"].items()), **{**IndexHelper._options(spec), "name": temporary}
+            )])
+        except OperationFailure as e:
+            if e.code not in IndexHelper.CONFLICT_CODES:
+                raise
+            temporary = None
+            IndexHelper._check_unique(collection, spec)
+
+        collection.drop_index(action["drop_name"])
+        if temporary is not None:
+            collection.drop_index(temporary)
+        try:
+            collection.create_indexes([index])
+        except OperationFailure:
+            previous = IndexHelper._model(action["drop_name"], action["previous"])
+            collection.create_indexes([previous])
+            raise
+
+    @staticmethod
+    def _check_unique(collection, spec: Dict[str, Any]) -> None:
+        """Raise the server error a unique index would fail with when its keys hold duplicates"""
+        if not spec.get("unique"):
+            return
+        pipeline = []
+        if spec.get("partialFilterExpression"):
+            pipeline.append({"$match": spec["partialFilterExpression"]})
+        pipeline += [
+            {"$group": {"_id": {field.replace(".", "_"): f"${field}" for field in spec["key"]}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": 1},
+        ]
+        duplicate = next(iter(collection.aggregate(pipeline)), None)
+        if duplicate is not None:
+            raise OperationFailure(f"E11000 duplicate key {duplicate['_id']} for index {spec['name']}", code=11000)
+
+    @staticmethod
+    def _options(spec: Dict[str, Any]) -> Dict[str, Any]:
+        """Options of an index document, without its keys and name"""
+        return {option: value for option, value in spec.items() if option not in ("key", "name", "v", "ns")}
+
+    @staticmethod
+    def _model(name: str, info: Dict[str, Any]) -> IndexModel:
+        """IndexModel recreating an index from its `index_information()` entry"""
+        keys = []
+        for field, direction in info["key"]:
+            if field == "_fts":
+                keys += [(text_field, TEXT) for text_field in info.get("weights", {})]
+            elif field != "_ftsx":
+                keys.append((field, direction))
+        options = {option: value for option, value in info.items() if option not in ("key", "v", "ns")}
+        return IndexModel(keys, **{**options, "name": name})
+
+    @staticmethod
+    def ensure(
+        schemas: Iterable, dry_run: bool = False, prune: bool = False, rebuild: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Create or reconcile the indexes of every schema
+
+        Args:
+            schemas: Schemas declaring indexes
+            dry_run: Only compute the diff, do not touch the database
+            prune: Also drop indexes that are not declared
+            rebuild: Also rebuild the indexes that changed, the app startup only creates
+
+        Returns:
+            List of actions with their status
+        """
+        results = []
+        for schema in schemas:
+            actions = IndexHelper.plan(schema, prune=prune)
+            if dry_run:
+                for action in actions:
+                    action["status"] = "pending"
+            else:
+                IndexHelper.apply(schema, actions, rebuild=rebuild)
+            results.extend(actions)
+        return results
+
+    @staticmethod
+    def describe(action: Dict[str, Any]) -> str:
+        """Build a one-line description of an action"""
+        line = f"[{action['status']}] {action['action']} {action['collection']}.{action['name']}"
+        if action["index"] is not None:
+            line += f" {action['index'].document}"
+        if action.get("drop_name") and action["drop_name"] != action["name"]:
+            line += f" (replaces {action['drop_name']})"
+        if action.get("error"):
+            line += f": {action['error']}"
+        return line
+
+    @staticmethod
+    def _action(
+        schema, action: str, name: str, index, drop_name: str = None, previous: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Build an action dictionary, `previous` is the existing index a rebuild replaces"""
+        return {
+            "collection": schema.schema_name,
+            "action": action,
+            "name": name,
+            "index": index,
+            "drop_name": drop_name,
+            "previous": previous,
+        }
+
+    @staticmethod
+    def _keys(key: Any) -> List[tuple]:
+        """
+        Normalize an index key specification to a list of (field, direction)
+
+        The server reports the fields of a text index as the `_fts`/`_ftsx` pair, the
+        text fields themselves being compared through the `weights` option.
+        """
+        items = key.items() if hasattr(key, "items") else key
+        keys = []
+        for field, direction in items:
+            if direction == TEXT or field == "_ftsx":
+                if ("_fts", TEXT) not in keys:
+                    keys += [("_fts", TEXT), ("_ftsx", 1)]
+                continue
+            keys.append((field, int(direction) if isinstance(direction, (int, float)) else direction))
+        return keys
+
+    @staticmethod
+    def _matches(spec: Dict[str, Any], current: Dict[str, Any]) -> bool:
+        """Check whether an existing index matches its declaration"""
+        if IndexHelper._keys(spec["key"]) != IndexHelper._keys(current["key"]):
+            return False
+        for option, default in IndexHelper.compared_options.items():
+            if spec.get(option, default) != current.get(option, default):
+                return False
+        return True
@@ -0,0 +1,86 @@
+"""Lease helper electing the one worker running a periodic task"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from pymongo.errors import DuplicateKeyError
+from ...config.mongodb import mongodb
+
+
+class Lease:
+    """
+    Named lease stored in MongoDB, held by one worker until it stops renewing it
+
+    The holder renews the lease on each run; the others fail to take it until it
+    expires, which happens when the holder stopped or stalled longer than the TTL.
+    A run must therefore end well within the TTL.
+    """
+
+    # Collection of the leases, one document per name
+    COLLECTION = "Lease"
+
+    def __init__(self, name: str, ttl_seconds: float, owner: Optional[str] = None):
+        """
+        Initialize the lease
+
+        Args:
+            name: Name of the leased task, the `_id` of its document
+            ttl_seconds: Seconds the lease is held after each renewal
+            owner: Identity of this worker, host, pid and a random suffix by default
+        """
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def _acquire_update(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Filter matching a free or own lease, and the update taking it"""
+        now = datetime.now(timezone.utc)
+        query = {"_id": self.name, "$or": [{"leaseUntil": {"$lte": now}}, {"owner": self.owner}]}
+        update = {"$set": {"owner": self.owner, "leaseUntil": now + timedelta(seconds=self.ttl_seconds)}}
+        return query, update
+
+    def acquire(self) -> bool:
+        """
+        Take or renew the lease
+
+        Returns:
+            True when this worker holds the lease until the TTL
+        """
+        query, update = self._acquire_update()
+        try:
+            # A lease held by another worker does not match, and its _id rejects the upsert
+            mongodb.get_collection(self.COLLECTION).update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def acquire_async(self) -> bool:
+        """Async variant of `acquire`"""
+        query, update = self._acquire_update()
+        try:
+            # A lease held by another worker does not match, and its _id rejects the upsert
+            await mongodb.get_async_collection(self.COLLECTION).update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def release(self) -> None:
+        """Give the lease up if this worker holds it, so another one takes over at once"""
+        mongodb.get_collection(self.COLLECTION).delete_one({"_id": self.name, "owner": self.owner})
+
+    async def release_async(self) -> None:
+        """Async variant of `release`"""
+        await mongodb.get_async_collection(self.COLLECTION).delete_one({"_id": self.name, "owner": self.owner})
+
+    def _held(self) -> Dict[str, Any]:
+        """Filter matching the lease while a worker holds it"""
+        return {"_id": self.name, "leaseUntil": {"$gt": datetime.now(timezone.utc)}}
+
+    def held(self) -> bool:
+        """Whether a worker, this one or another, holds the lease"""
+        return mongodb.get_collection(self.COLLECTION).find_one(self._held(), {"_id": 1}) is not None
+
+    async def held_async(self) -> bool:
+        """Async variant of `held`"""
+        return await mongodb.get_async_collection(self.COLLECTION).find_one(self._held(), {"_id": 1}) is not None
@@ -0,0 +1,297 @@
+"""Pagination helper for offset and keyset (cursor) pagination"""
+import asyncio
+import base64
+import binascii
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+from bson import json_util
+from bson.errors import InvalidBSON
+from pymongo import DESCENDING
+from .cache import TTLCache
+from .filters import Filters
+from ...config.settings import COUNT_CACHE_TTL
+
+
+class Page(NamedTuple):
+    """One page of a list, field names match the *ModelResult models"""
+    total: Optional[int]
+    totalExact: bool
+    results: List[Dict[str, Any]]
+    nextCursor: Optional[str]
+
+
+class Pagination:
+    """Helper class for paging list queries sorted by (sort field, _id) descending"""
+
+    INVALID_CURSOR = "Invalid cursor"
+
+    # Estimated totals, refreshed in the background once stale
+    count_cache = TTLCache(COUNT_CACHE_TTL)
+    _refreshing = set()
+    _refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="count-refresh")
+    _refresh_tasks = set()
+
+    @staticmethod
+    def sort(sort_field: str) -> List[Tuple[str, int]]:
+        """
+        Build the sort specification, using _id as a tie-breaker
+
+        Args:
+            sort_field: Field the list is ordered by
+
+        Returns:
+            Sort specification
+        """
+        return [(sort_field, DESCENDING), ("_id", DESCENDING)]
+
+    @staticmethod
+    def encode_cursor(document: Dict[str, Any], sort_field: str) -> str:
+        """
+        Build an opaque cursor pointing after a document
+
+        Args:
+            document: Last document of the current page
+            sort_field: Field the list is ordered by
+
+        Returns:
+            URL-safe cursor string
+        """
+        payload = json_util.dumps({"v": document.get(sort_field), "id": document["_id"]})
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+        """
+        Decode a cursor built by `encode_cursor`
+
+        Args:
+            cursor: Opaque cursor string
+
+        Returns:
+            Tuple of (sort value, _id)
+        """
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            payload = json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            return payload["v"], payload["id"]
+        except (binascii.Error, UnicodeDecodeError, ValueError, KeyError, TypeError, InvalidBSON):
+            raise ValueError(Pagination.INVALID_CURSOR)
+
+    @staticmethod
+    def seek(sort_field: str, cursor: str) -> Dict[str, Any]:
+        """
+        Build the seek predicate selecting documents after the cursor
+
+        Args:
+            sort_field: Field the list is ordered by
+            cursor: Opaque cursor string
+
+        Returns:
+            MongoDB predicate on (sort field, _id)
+        """
+        value, _id = Pagination.decode_cursor(cursor)
+        if value is None:
+            # Cursor taken on a document without the sort field, continue among those
+            return {sort_field: None, "_id": {"$lt": _id}}
+        # The range on the sort field bounds the index scan, the $or breaks ties on _id
+        return {
+            sort_field: {"$lte": value},
+            "$or": [
+                {sort_field: {"$lt": value}},
+                {"_id": {"$lt": _id}},
+            ]
+        }
+
+    @staticmethod
+    def page_query(query: Dict[str, Any], filters: Filters, sort_field: str) -> Dict[str, Any]:
+        """
+        Restrict a query to the requested page when in cursor mode
+
+        Args:
+            query: Base MongoDB query
+            filters: Filters holding the optional cursor
+            sort_field: Field the list is ordered by
+
+        Returns:
+            MongoDB query for the page
+        """
+        if not filters.cursor:
+            return query
+        return {"$and": [query, Pagination.seek(sort_field, filters.cursor)]}
+
+    @staticmethod
+    def find_page(
+        collection,
+        query: Dict[str, Any],
+        filters: Filters,
+        sort_field: str,
+        projection: Optional[Dict[str, int]] = None,
+        count_hint: Optional[Union[str, List[Tuple[str, int]]]] = None
+    ) -> Page:
+        """
+        Run a paged find in offset or cursor mode
+
+        Args:
+            collection: Native MongoDB collection
+            query: Base MongoDB query
+            filters: Filters holding skip, limit, the optional cursor and the total mode
+            sort_field: Field the list is ordered by
+            projection: Optional projection of the returned documents
+            count_hint: Index the exact total is counted on, by name or keys, when the planner could pick another
+
+        Returns:
+            The page
+        """
+        cursor = collection.find(
+            Pagination.page_query(query, filters, sort_field),
+            projection,
+            limit=filters.limit + 1,
+            skip=Pagination.skip(filters),
+            sort=Pagination.sort(sort_field)
+        )
+        documents, next_cursor = Pagination.split_page(list(cursor), filters, sort_field)
+        if filters.include_total == Filters.TOTAL_EXACT:
+            # The page keeps the seek as an index bound, the total is counted apart from it
+            count_options = {"hint": count_hint} if count_hint else {}
+            return Page(collection.count_documents(query, **count_options), True, documents, next_cursor)
+        total_count = None
+        if filters.include_total == Filters.TOTAL_ESTIMATED:
+            total_count = Pagination.estimated_total(collection, query)
+        return Page(total_count, False, documents, next_cursor)
+
+    @staticmethod
+    async def find_page_async(
+        collection,
+        query: Dict[str, Any],
+        filters: Filters,
+        sort_field: str,
+        projection: Optional[Dict[str, int]] = None,
+        count_hint: Optional[Union[str, List[Tuple[str, int]]]] = None
+    ) -> Page:
+        """Async variant of `find_page` for AsyncCollection, counting the exact total alongside the page"""
+        cursor = collection.find(
+            Pagination.page_query(query, filters, sort_field),
+            projection,
+            limit=filters.limit + 1,
+            skip=Pagination.skip(filters),
+            sort=Pagination.sort(sort_field)
+        )
+        if filters.include_total == Filters.TOTAL_EXACT:
+            # The page keeps the seek as an index bound, the total is counted alongside it
+            count_options = {"hint": count_hint} if count_hint else {}
+            documents, total_count = await asyncio.gather(
+                cursor.to_list(None), collection.count_documents(query, **count_options)
+            )
+            return Page(total_count, True, *Pagination.split_page(documents, filters, sort_field))
+
+        documents, next_cursor = Pagination.split_page(await cursor.to_list(None), filters, sort_field)
+        total_count = None
+        if filters.include_total == Filters.TOTAL_ESTIMATED:
+            total_count = await Pagination.estimated_total_async(collection, query)
+        return Page(total_count, False, documents, next_cursor)
+
+    @staticmethod
+    def skip(filters: Filters) -> int:
+        """Number of documents to skip, always 0 in cursor mode"""
+        return 0 if filters.cursor is not None else filters.skip
+
+    @staticmethod
+    def facet_page(facet: Optional[Dict[str, Any]], filters: Filters, sort_field: str) -> Page:
+        """Build a page from an aggregation ending with a {total: [{count}], results: [...]} `$facet`"""
+        facet = facet or {}
+        total = facet.get("total") or [{"count": 0}]
+        documents, next_cursor = Pagination.split_page(facet.get("results", []), filters, sort_field)
+        return Page(total[0]["count"], True, documents, next_cursor)
+
+    @staticmethod
+    def count_key(collection, query: Dict[str, Any]) -> str:
+        """Build the cache key of a count"""
+        return f"{collection.full_name}:{json_util.dumps(query, sort_keys=True)}"
+
+    @staticmethod
+    def estimated_total(collection, query: Dict[str, Any]) -> int:
+        """
+        Estimate the number of documents matching a query
+
+        Uses the collection metadata when the query has no filter,
+        otherwise a cached count that is refreshed in the background once stale.
+
+        Args:
+            collection: Native MongoDB collection
+            query: Base MongoDB query
+
+        Returns:
+            Estimated count
+        """
+        if not query:
+            return collection.estimated_document_count()
+
+        key = Pagination.count_key(collection, query)
+        count = Pagination.count_cache.get(key)
+        if count is not None:
+            return count
+
+        count = Pagination.count_cache.get_stale(key)
+        if count is None:
+            count = collection.count_documents(query)
+            Pagination.count_cache.set(key, count)
+        elif key not in Pagination._refreshing:
+            Pagination._refreshing.add(key)
+            Pagination._refresh_executor.submit(Pagination._refresh_count, collection, query, key)
+        return count
+
+    @staticmethod
+    async def estimated_total_async(collection, query: Dict[str, Any]) -> int:
+        """Async variant of `estimated_total`, refreshing stale counts in a task"""
+        if not query:
+            return await collection.estimated_document_count()
+
+        key = Pagination.count_key(collection, query)
+        count = Pagination.count_cache.get(key)
+        if count is not None:
+            return count
+
+        count = Pagination.count_cache.get_stale(key)
+        if count is None:
+            count = await collection.count_documents(query)
+            Pagination.count_cache.set(key, count)
+        elif key not in Pagination._refreshing:
+            Pagination._refreshing.add(key)
+            task = asyncio.get_running_loop().create_task(Pagination._refresh_count_async(collection, query, key))
+            Pagination._refresh_tasks.add(task)
+            task.add_done_callback(Pagination._refresh_tasks.discard)
+        return count
+
+    @staticmethod
+    def _refresh_count(collection, query: Dict[str, Any], key: str) -> None:
+        """Recount a query and store it in the cache"""
+        try:
+            Pagination.count_cache.set(key, collection.count_documents(query))
+        finally:
+            Pagination._refreshing.discard(key)
+
+    @staticmethod
+    async def _refresh_count_async(collection, query: Dict[str, Any], key: str) -> None:
+        """Async variant of `_refresh_count`"""
+        try:
+            Pagination.count_cache.set(key, await collection.count_documents(query))
+        finally:
+            Pagination._refreshing.discard(key)
+
+    @staticmethod
+    def split_page(documents: List[Dict[str, Any]], filters: Filters, sort_field: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Trim the look-ahead document and build the next cursor
+
+        Args:
+            documents: Up to limit + 1 documents
+            filters: Filters holding the limit
+            sort_field: Field the list is ordered by
+
+        Returns:
+            Tuple of (documents of the page, next cursor or None)
+        """
+        if len(documents) <= filters.limit:
+            return documents, None
+        documents = documents[:filters.limit]
+        return documents, Pagination.encode_cursor(documents[-1], sort_field)
@@ -0,0 +1,96 @@
+"""Connection pool statistics helper"""
+import threading
+from collections import deque
+from pymongo import monitoring
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Pool listener recording connection checkout wait times and pool usage"""
+
+    def __init__(self, window: int = 1000):
+        """
+        Initialize the listener
+
+        Args:
+            window: Number of recent checkouts kept to compute percentiles
+        """
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.open_connections = 0
+        self.in_use = 0
+
+    def snapshot(self) -> dict:
+        """
+        Build a summary of the pool since the client was created
+
+        Returns:
+            Dictionary with checkout counts, wait times in milliseconds and usage
+        """
+        with self._lock:
+            recent = sorted(self._recent)
+            checkouts = self.checkouts
+            summary = {
+                "checkouts": checkouts,
+                "checkoutFailures": self.checkout_failures,
+                "openConnections": self.open_connections,
+                "inUse": self.in_use,
+                "avgWaitMs": round(self.total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+                "maxWaitMs": round(self.max_wait * 1000, 3),
+            }
+        if recent:
+            summary["p95WaitMs"] = round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 3)
+        else:
+            summary["p95WaitMs"] = 0.0
+        return summary
+
+    def _record_wait(self, duration: float):
+        """Record the time spent waiting for a connection"""
+        self.total_wait += duration
+        self.max_wait = max(self.max_wait, duration)
+        self._recent.append(duration)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self._record_wait(getattr(event, "duration", 0.0) or 0.0)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            self._record_wait(getattr(event, "duration", 0.0) or 0.0)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections = max(self.open_connections - 1, 0)
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.in_use = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
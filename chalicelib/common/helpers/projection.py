@@ -0,0 +1,79 @@
+"""Projection helper for sparse fieldsets"""
+from typing import Any, Dict, List, Optional, Type
+from pydantic import BaseModel
+
+
+class Projection:
+    """Helper class turning a `fields=` selection into a MongoDB projection"""
+
+    # Requests the full documents, bypassing the default list projection
+    ALL_FIELDS = "*"
+
+    @staticmethod
+    def build(
+        fields: Optional[List[str]],
+        model: Type[BaseModel],
+        default: Optional[Dict[str, int]] = None,
+        sort_field: Optional[str] = None
+    ) -> Optional[Dict[str, int]]:
+        """
+        Build the projection of a read
+
+        Args:
+            fields: Requested field names, None when no selection was made
+            model: Full model of the collection, used to validate the field names
+            default: Projection used when no selection was made
+            sort_field: Field the list is ordered by, always projected to build cursors
+
+        Returns:
+            MongoDB projection, or None to fetch full documents
+        """
+        if fields is None:
+            return default
+        if fields == [Projection.ALL_FIELDS]:
+            return None
+
+        allowed = {name: (info.alias or name) for name, info in model.model_fields.items()}
+        unknown = [field for field in fields if field not in allowed]
+        if unknown:
+            raise ValueError(
+                f"Unknown fields: {', '.join(unknown)}. Allowed fields: {', '.join(allowed)}"
+            )
+
+        projection = {allowed[field]: 1 for field in fields}
+        if sort_field:
+            projection[sort_field] = 1
+        return projection
+
+    @staticmethod
+    def model(
+        projection: Optional[Dict[str, int]],
+        model: Type[BaseModel],
+        partial_model: Type[BaseModel]
+    ) -> Type[BaseModel]:
+        """
+        Pick the model validating documents read with a projection
+
+        Projected documents may miss required fields, and the full model would fill
+        the defaults of the fields that were not selected.
+
+        Args:
+            projection: Projection of the read, None for full documents
+            model: Full model of the collection
+            partial_model: Same model with every field optional and without defaults
+
+        Returns:
+            The model to validate the documents with
+        """
+        return model if projection is None else partial_model
+
+    @staticmethod
+    def validate(
+        documents: List[Dict[str, Any]],
+        projection: Optional[Dict[str, int]],
+        model: Type[BaseModel],
+        partial_model: Type[BaseModel]
+    ) -> List[BaseModel]:
+        """Validate a list of documents read with a projection"""
+        target = Projection.model(projection, model, partial_model)
+        return [target.model_validate(document) for document in documents]
@@ -0,0 +1,279 @@
+"""Purge helper hard deleting the documents deleted for longer than a retention period"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import ASCENDING
+from ...config.mongodb import mongodb
+from ...config.settings import PURGE_BATCH_SIZE, PURGE_LEASE_SECONDS, PURGE_MAX_DELETES_PER_SECOND
+from .archive import Archive, DELETED_AT
+from .lease import Lease
+
+logger = logging.getLogger(__name__)
+
+
+class Purge:
+    """
+    Helper class hard deleting the documents deleted before a retention period, live and archived
+
+    Documents are walked in `_id` order and deleted in small batches, each one followed
+    by a pause keeping the deletes under a budget per second, so a purge never floods
+    the primary and the replication with one huge delete_many. The last `_id` deleted
+    is checkpointed after each batch: an interrupted purge resumes from it with the
+    same cutoff, and a lease keeps one worker purging a collection at a time.
+    """
+
+    # Collection of the checkpoints, one document per purged collection
+    COLLECTION = "Purge"
+
+    # Background purges started by the API in this worker, by live collection
+    running: Dict[str, asyncio.Task] = {}
+
+    def __init__(
+        self,
+        name: str,
+        retention_days: float,
+        batch_size: int = PURGE_BATCH_SIZE,
+        max_per_second: float = PURGE_MAX_DELETES_PER_SECOND,
+        lease_seconds: float = PURGE_LEASE_SECONDS
+    ):
+        """
+        Initialize the purge
+
+        Args:
+            name: Live collection, its archive is purged after it
+            retention_days: Days deleted documents are kept
+            batch_size: Documents deleted per delete_many
+            max_per_second: Deletes per second allowed across the batches, 0 for no pause
+            lease_seconds: Seconds the lease is held after each batch, longer than a batch lasts
+        """
+        self.name = name
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.max_per_second = max_per_second
+        self.lease = Lease(f"purge-{name}", lease_seconds)
+
+    @property
+    def targets(self) -> List[str]:
+        """Purged collections, the live one first"""
+        return [self.name, self.name + Archive.SUFFIX]
+
+    def count(self) -> Dict[str, int]:
+        """Documents a purge started now would delete, by collection"""
+        query = self._expired(self._cutoff())
+        return {name: mongodb.get_collection(name).count_documents(query) for name in self.targets}
+
+    async def count_async(self) -> Dict[str, int]:
+        """Async variant of `count`"""
+        query = self._expired(self._cutoff())
+        return {name: await mongodb.get_async_collection(name).count_documents(query) for name in self.targets}
+
+    def run(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Purge the live collection then its archive, each from its checkpoint
+
+        Returns:
+            Progress of each collection, or None when another worker holds the lease
+        """
+        if not self.lease.acquire():
+            return None
+        progress = []
+        try:
+            for name in self.targets:
+                state = self._run(name)
+                progress.append(Purge.describe(state))
+                if state["finishedAt"] is None:
+                    break
+        finally:
+            self.lease.release()
+        return progress
+
+    async def run_async(self) -> Optional[List[Dict[str, Any]]]:
+        """Async variant of `run`"""
+        if not await self.lease.acquire_async():
+            return None
+        progress = []
+        try:
+            for name in self.targets:
+                state = await self._run_async(name)
+                progress.append(Purge.describe(state))
+                if state["finishedAt"] is None:
+                    break
+        finally:
+            await self.lease.release_async()
+        return progress
+
+    def _run(self, name: str) -> Dict[str, Any]:
+        """Purge one collection from its checkpoint, the returned state is unfinished when the lease was lost"""
+        collection = mongodb.get_collection(name)
+        checkpoints = mongodb.get_collection(self.COLLECTION)
+        state = self._resume(name, checkpoints.find_one({"_id": name}))
+        checkpoints.replace_one({"_id": name}, state, upsert=True)
+        last = time.monotonic()
+        while True:
+            started = time.monotonic()
+            cursor = collection.find(self._query(state), {"_id": 1}, sort=[("_id", ASCENDING)], limit=self.batch_size)
+            ids = [document["_id"] for document in cursor]
+            deleted = 0
+            if ids:
+                # Restored since they were read: the predicate keeps them
+                deleted = collection.delete_many({"_id": {"$in": ids}, **self._expired(state["cutoff"])}).deleted_count
+            state, last = self._advance(state, ids, deleted, last)
+            checkpoints.replace_one({"_id": name}, state)
+            if not ids:
+                return state
+            if not self.lease.acquire():
+                logger.warning("%s: lease lost, the purge stops at %s", name, state["lastId"])
+                return state
+            time.sleep(self._pause(len(ids), started))
+
+    async def _run_async(self, name: str) -> Dict[str, Any]:
+        """Async variant of `_run`"""
+        collection = mongodb.get_async_collection(name)
+        checkpoints = mongodb.get_async_collection(self.COLLECTION)
+        state = self._resume(name, await checkpoints.find_one({"_id": name}))
+        await checkpoints.replace_one({"_id": name}, state, upsert=True)
+        last = time.monotonic()
+        while True:
+            started = time.monotonic()
+            cursor = collection.find(self._query(state), {"_id": 1}, sort=[("_id", ASCENDING)], limit=self.batch_size)
+            ids = [document["_id"] async for document in cursor]
+            deleted = 0
+            if ids:
+                # Restored since they were read: the predicate keeps them
+                result = await collection.delete_many({"_id": {"$in": ids}, **self._expired(state["cutoff"])})
+                deleted = result.deleted_count
+            state, last = self._advance(state, ids, deleted, last)
+            await checkpoints.replace_one({"_id": name}, state)
+            if not ids:
+                return state
+            if not await self.lease.acquire_async():
+                logger.warning("%s: lease lost, the purge stops at %s", name, state["lastId"])
+                return state
+            await asyncio.sleep(self._pause(len(ids), started))
+
+    async def start(self) -> bool:
+        """
+        Run `run_async` in the background of the running event loop
+
+        Returns:
+            False when a worker, this one or another, is already purging the collection
+        """
+        task = Purge.running.get(self.name)
+        if task is not None and not task.done():
+            return False
+        if not await self.lease.acquire_async():
+            return False
+        task = asyncio.get_running_loop().create_task(self.run_async())
+        Purge.running[self.name] = task
+        task.add_done_callback(self._done)
+        return True
+
+    def _done(self, task: asyncio.Task) -> None:
+        """Forget a finished background purge and log its failure"""
+        Purge.running.pop(self.name, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("%s: purge failed", self.name, exc_info=task.exception())
+
+    @staticmethod
+    async def stop_all() -> None:
+        """Cancel the background purges of this worker, they resume from their checkpoints"""
+        tasks = list(Purge.running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def progress(self) -> Dict[str, Any]:
+        """Whether the collection is being purged, and the checkpoints of its last purge"""
+        states = mongodb.get_collection(self.COLLECTION).find({"_id": {"$in": self.targets}})
+        return self._progress(self.lease.held(), list(states))
+
+    async def progress_async(self) -> Dict[str, Any]:
+        """Async variant of `progress`"""
+        states = mongodb.get_async_collection(self.COLLECTION).find({"_id": {"$in": self.targets}})
+        return self._progress(await self.lease.held_async(), [state async for state in states])
+
+    def _progress(self, running: bool, states: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Progress of the purged collections, in purge order"""
+        states.sort(key=lambda state: self.targets.index(state["_id"]))
+        return {"running": running, "collections": [Purge.describe(state) for state in states]}
+
+    def _cutoff(self) -> datetime:
+        """Deletion date before which documents are purged"""
+        return datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+
+    def _resume(self, name: str, state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Checkpoint of an unfinished purge, or of a new one cutting off now"""
+        if state is not None and state.get("finishedAt") is None:
+            logger.info("%s: resuming the purge after %s", name, state["lastId"])
+            return state
+        now = datetime.now(timezone.utc)
+        return {
+            "_id": name,
+            "retentionDays": self.retention_days,
+            "cutoff": self._cutoff(),
+            "lastId": None,
+            "deleted": 0,
+            "batches": 0,
+            "seconds": 0.0,
+            "startedAt": now,
+            "updatedAt": now,
+            "finishedAt": None,
+        }
+
+    def _advance(
+        self, state: Dict[str, Any], ids: List[Any], deleted: int, last: float
+    ) -> Tuple[Dict[str, Any], float]:
+        """Checkpoint after a batch, finished when the batch was empty"""
+        now = time.monotonic()
+        state = {**state, "seconds": state["seconds"] + now - last, "updatedAt": datetime.now(timezone.utc)}
+        if not ids:
+            state["finishedAt"] = state["updatedAt"]
+            described = Purge.describe(state)
+            logger.info(
+                "%s: purge finished, %s deleted in %ss (%s/s)",
+                state["_id"], described["deleted"], described["seconds"], described["perSecond"]
+            )
+            return state, now
+        state.update(lastId=ids[-1], deleted=state["deleted"] + deleted, batches=state["batches"] + 1)
+        described = Purge.describe(state)
+        logger.info("%s: %s deleted at %s/s", state["_id"], described["deleted"], described["perSecond"])
+        return state, now
+
+    def _pause(self, deleted: int, started: float) -> float:
+        """Seconds to wait after a batch so the deletes stay within the budget per second"""
+        if self.max_per_second <= 0:
+            return 0.0
+        return max(0.0, deleted / self.max_per_second - (time.monotonic() - started))
+
+    @staticmethod
+    def _expired(cutoff: datetime) -> Dict[str, Any]:
+        """Predicate matching the documents deleted before the cutoff, on the partial deletedAt index"""
+        return {DELETED_AT: {"$exists": True, "$lte": cutoff}}
+
+    @staticmethod
+    def _query(state: Dict[str, Any]) -> Dict[str, Any]:
+        """Expired documents after the checkpoint"""
+        query = Purge._expired(state["cutoff"])
+        if state["lastId"] is not None:
+            query["_id"] = {"$gt": state["lastId"]}
+        return query
+
+    @staticmethod
+    def describe(state: Dict[str, Any]) -> Dict[str, Any]:
+        """JSON friendly progress of a checkpoint, with the average deletes per second"""
+        seconds = state["seconds"]
+        return {
+            "collection": state["_id"],
+            "retentionDays": state["retentionDays"],
+            "cutoff": state["cutoff"].isoformat(),
+            "deleted": state["deleted"],
+            "batches": state["batches"],
+            "seconds": round(seconds, 1),
+            "perSecond": round(state["deleted"] / seconds, 1) if seconds else 0.0,
+            "lastId": str(state["lastId"]) if state["lastId"] is not None else None,
+            "startedAt": state["startedAt"].isoformat(),
+            "updatedAt": state["updatedAt"].isoformat(),
+            "finishedAt": state["finishedAt"].isoformat() if state["finishedAt"] else None,
+        }
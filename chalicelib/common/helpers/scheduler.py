@@ -0,0 +1,94 @@
+"""Scheduler helper running periodic tasks on one worker at a time"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+from .lease import Lease
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """
+    Helper class running a task every interval while holding its lease
+
+    Every worker of the app (or every `manage.py` worker) may run a scheduler for
+    the same task: the lease lets one of them run each tick, and another one takes
+    over when it stops.
+    """
+
+    def __init__(self, name: str, interval_seconds: float, lease_seconds: float):
+        """
+        Initialize the scheduler
+
+        Args:
+            name: Name of the task, also the name of its lease
+            interval_seconds: Seconds between two ticks
+            lease_seconds: Seconds the lease is held after a tick, longer than a tick lasts
+        """
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.lease = Lease(name, lease_seconds)
+        self._task: Optional[asyncio.Task] = None
+
+    def tick(self, task: Callable[[], Any]) -> Optional[Any]:
+        """
+        Run the task once if this worker holds the lease
+
+        Returns:
+            Result of the task, or None when another worker holds the lease
+        """
+        if not self.lease.acquire():
+            return None
+        return task()
+
+    async def tick_async(self, task: Callable[[], Awaitable[Any]]) -> Optional[Any]:
+        """Async variant of `tick`"""
+        if not await self.lease.acquire_async():
+            return None
+        return await task()
+
+    def run(self, task: Callable[[], Any]) -> None:
+        """Run the task every interval until interrupted, then give the lease up"""
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    result = self.tick(task)
+                    if result is not None:
+                        logger.info("%s: %s", self.name, result)
+                except Exception:
+                    logger.exception("%s failed", self.name)
+                time.sleep(max(0.0, self.interval_seconds - (time.monotonic() - started)))
+        finally:
+            self.lease.release()
+
+    async def run_async(self, task: Callable[[], Awaitable[Any]]) -> None:
+        """Async variant of `run`, stopped by cancelling it"""
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    result = await self.tick_async(task)
+                    if result is not None:
+                        logger.info("%s: %s", self.name, result)
+                except Exception:
+                    logger.exception("%s failed", self.name)
+                await asyncio.sleep(max(0.0, self.interval_seconds - (time.monotonic() - started)))
+        finally:
+            await self.lease.release_async()
+
+    def start(self, task: Callable[[], Awaitable[Any]]) -> None:
+        """Run the task in the background of the running event loop"""
+        self._task = asyncio.get_running_loop().create_task(self.run_async(task))
+
+    async def stop(self) -> None:
+        """Cancel the background run started by `start` and wait for it to give the lease up"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
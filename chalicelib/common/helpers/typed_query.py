@@ -0,0 +1,119 @@
+"""Typed query helper keeping reference fields in their stored BSON type"""
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Type, get_args
+from bson import ObjectId
+from pydantic import BaseModel
+
+# Operators whose operand is a value, or a list of values, of the field
+VALUE_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin", "$all")
+# Operators combining whole predicates
+LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+
+
+class TypedQuery:
+    """
+    Helper class coercing the reference fields of a model to ObjectId
+
+    Fields annotated `ObjectIdStr` are read and written as strings by the API but
+    stored as ObjectId, the type of the `_id` they point at. Compiling queries and
+    written documents through this helper keeps a single type per field, so a lookup
+    by reference is one equality on its index.
+    """
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def fields(model: Type[BaseModel]) -> FrozenSet[str]:
+        """Stored names of the ObjectId fields of a model, `_id` excluded"""
+        return frozenset(
+            info.alias or name
+            for name, info in model.model_fields.items()
+            if (info.alias or name) != "_id" and TypedQuery.is_object_id(info.annotation)
+        )
+
+    @staticmethod
+    def is_object_id(annotation: Any) -> bool:
+        """Tell an ObjectId annotation, also inside Optional, Annotated or List"""
+        return annotation is ObjectId or any(TypedQuery.is_object_id(arg) for arg in get_args(annotation))
+
+    @staticmethod
+    def value(field: str, value: Any) -> Any:
+        """
+        Coerce a value of a reference field
+
+        Args:
+            field: Field name, for the error message
+            value: String, ObjectId, list of them or operator document
+
+        Returns:
+            The value with ObjectIds in place of strings
+        """
+        if isinstance(value, str):
+            if not ObjectId.is_valid(value):
+                raise ValueError(f"{field}: Invalid ObjectId")
+            return ObjectId(value)
+        if isinstance(value, (list, tuple)):
+            return [TypedQuery.value(field, item) for item in value]
+        if isinstance(value, dict):
+            return {
+                operator: TypedQuery.value(field, operand) if operator in VALUE_OPERATORS else operand
+                for operator, operand in value.items()
+            }
+        return value
+
+    @staticmethod
+    def compile(model: Type[BaseModel], query: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Copy a query with the reference fields of the model coerced
+
+        Args:
+            model: Full model of the collection
+            query: MongoDB query, references may be strings
+
+        Returns:
+            The query to send
+        """
+        fields = TypedQuery.fields(model)
+        compiled = {}
+        for key, value in query.items():
+            if key in LOGICAL_OPERATORS:
+                compiled[key] = [TypedQuery.compile(model, clause) for clause in value]
+            elif key in fields:
+                compiled[key] = TypedQuery.value(key, value)
+            else:
+                compiled[key] = value
+        return compiled
+
+    @staticmethod
+    def document(model: Type[BaseModel], document: Dict[str, Any]) -> Dict[str, Any]:
+        """Coerce the reference fields of a serialized document or patch, in place, before it is written"""
+        for field in TypedQuery.fields(model) & document.keys():
+            document[field] = TypedQuery.value(field, document[field])
+        return document
+
+    @staticmethod
+    def migrate(collection, model: Type[BaseModel], dry_run: bool = False) -> Dict[str, int]:
+        """
+        Convert the references still stored as strings to ObjectId
+
+        Each field is converted on the server by one pipeline update_many; strings that
+        are not valid ObjectIds are left as they are.
+
+        Args:
+            collection: Native MongoDB collection
+            model: Full model of the collection
+            dry_run: Only count the documents to convert
+
+        Returns:
+            Documents holding (dry run) or converted from a string, by field
+        """
+        counts = {}
+        for field in sorted(TypedQuery.fields(model)):
+            query = {field: {"$type": "string"}}
+            if dry_run:
+                counts[field] = collection.count_documents(query)
+                continue
+            result = collection.update_many(query, [{"$set": {field: {"$convert": {
+                "input": f"${field}", "to": "objectId", "onError": f"${field}"
+            }}}}])
+            counts[field] = result.modified_count
+        return counts
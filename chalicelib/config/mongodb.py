@@ -1,7 +1,11 @@
 """MongoDB client configuration"""
 import os
-from pymongo import MongoClient
+from datetime import timezone
+from bson import CodecOptions
+from pymongo import MongoClient, AsyncMongoClient
+from pymongoose import methods
 from dotenv import load_dotenv
+from ..common.helpers.pool_stats import PoolStatsListener
 
 # Load environment variables from .env file
 load_dotenv()
@@ -10,5 +14,104 @@ load_dotenv()
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
 DATABASE_NAME = os.getenv('DATABASE_NAME', 'JCI')
 
-# Create MongoDB client
-mongo_client = MongoClient(MONGODB_URI)[DATABASE_NAME]
+# Create or reconcile the declared schema indexes when the app starts
+ENSURE_INDEXES = os.getenv('ENSURE_INDEXES', 'true').lower() == 'true'
+
+# Connection pool sizing, per client and per worker process
+MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', '100'))
+MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', '0'))
+MONGODB_MAX_IDLE_TIME_MS = os.getenv('MONGODB_MAX_IDLE_TIME_MS')
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS')
+
+# Wire compression, in order of preference (zstd and snappy need pymongo[zstd,snappy])
+MONGODB_COMPRESSORS = os.getenv('MONGODB_COMPRESSORS', 'zstd,snappy')
+
+# Documents are stored in UTC and read back as timezone-aware datetimes
+codec_options = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+
+
+class MongoDB:
+    """Owns the MongoDB clients of the process"""
+
+    def __init__(self):
+        self.client = None
+        self.async_client = None
+        self.pool_stats = PoolStatsListener()
+        self.async_pool_stats = PoolStatsListener()
+
+    @staticmethod
+    def client_options() -> dict:
+        """
+        Build the client options from the environment
+
+        Returns:
+            Keyword arguments for MongoClient and AsyncMongoClient
+        """
+        options = {
+            "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+            "minPoolSize": MONGODB_MIN_POOL_SIZE,
+        }
+        if MONGODB_MAX_IDLE_TIME_MS:
+            options["maxIdleTimeMS"] = int(MONGODB_MAX_IDLE_TIME_MS)
+        if MONGODB_WAIT_QUEUE_TIMEOUT_MS:
+            options["waitQueueTimeoutMS"] = int(MONGODB_WAIT_QUEUE_TIMEOUT_MS)
+        if MONGODB_COMPRESSORS:
+            options["compressors"] = MONGODB_COMPRESSORS
+        return options
+
+    def connect(self):
+        """Create the clients if they do not exist yet"""
+        if self.client is None:
+            self.client = MongoClient(MONGODB_URI, event_listeners=[self.pool_stats], **self.client_options())
+            # pymongoose methods use the blocking database
+            methods.database = self.client[DATABASE_NAME]
+        if self.async_client is None:
+            self.async_client = AsyncMongoClient(
+                MONGODB_URI, event_listeners=[self.async_pool_stats], **self.client_options()
+            )
+
+    async def close(self):
+        """Close the clients and their connection pools"""
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            methods.database = None
+
+    @property
+    def database(self):
+        """Blocking database, connecting on first use"""
+        if self.client is None:
+            self.connect()
+        return self.client[DATABASE_NAME]
+
+    @property
+    def async_database(self):
+        """Asyncio database, connecting on first use"""
+        if self.async_client is None:
+            self.connect()
+        return self.async_client[DATABASE_NAME]
+
+    def get_collection(self, name: str):
+        """Get a blocking collection"""
+        return self.database.get_collection(name, codec_options=codec_options)
+
+    def get_async_collection(self, name: str):
+        """Get an asyncio collection"""
+        return self.async_database.get_collection(name, codec_options=codec_options)
+
+    def pool_metrics(self) -> dict:
+        """Connection pool statistics of both clients in this process"""
+        return {
+            "pid": os.getpid(),
+            "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+            "minPoolSize": MONGODB_MIN_POOL_SIZE,
+            "sync": self.pool_stats.snapshot(),
+            "async": self.async_pool_stats.snapshot(),
+        }
+
+
+# Process-wide MongoDB connection, opened by the app lifespan or on first use
+mongodb = MongoDB()
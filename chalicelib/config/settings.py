@@ -0,0 +1,72 @@
+"""Application settings"""
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Seconds an estimated list total is served before being refreshed in the background
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', '60'))
+
+# Maximum number of items accepted by a bulk endpoint
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '1000'))
+
+# Writes kept in flight by the bulk patches and deletes of jobs and applications
+BULK_WRITE_CONCURRENCY = int(os.getenv('BULK_WRITE_CONCURRENCY', '32'))
+
+# Documents fetched per round trip by the export cursors
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '1000'))
+
+# Seconds the stats of an entreprise are served from the in-process cache
+STATS_CACHE_TTL = float(os.getenv('STATS_CACHE_TTL', '15'))
+
+# Largest page returned by a list endpoint, larger limits are capped
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
+
+# Age after which a job needs twice the text score to rank the same in a search
+SEARCH_FRESHNESS_HALF_LIFE_DAYS = float(os.getenv('SEARCH_FRESHNESS_HALF_LIFE_DAYS', '30'))
+
+# Similar jobs stored per job, how long they are served, the terms kept per job, the newest
+# published jobs sharing a term that are scored, and seconds the term idf counts are cached
+SIMILAR_JOBS_COUNT = int(os.getenv('SIMILAR_JOBS_COUNT', '10'))
+SIMILAR_JOBS_TTL = float(os.getenv('SIMILAR_JOBS_TTL', '86400'))
+SIMILAR_JOBS_MAX_TERMS = int(os.getenv('SIMILAR_JOBS_MAX_TERMS', '30'))
+SIMILAR_JOBS_CANDIDATES = int(os.getenv('SIMILAR_JOBS_CANDIDATES', '2000'))
+SIMILAR_IDF_TTL = float(os.getenv('SIMILAR_IDF_TTL', '3600'))
+
+# Newest published jobs sharing a skill that are scored per match request, and seconds the
+# skill rarity weights are served from the in-process cache
+MATCH_CANDIDATES = int(os.getenv('MATCH_CANDIDATES', '2000'))
+SKILL_WEIGHTS_TTL = float(os.getenv('SKILL_WEIGHTS_TTL', '300'))
+
+# Seconds the job facet counts are served from the in-process cache, 0 to disable it
+FACETS_CACHE_TTL = float(os.getenv('FACETS_CACHE_TTL', '30'))
+
+# Most frequent values returned per facet
+FACETS_MAX_VALUES = int(os.getenv('FACETS_MAX_VALUES', '50'))
+
+# Radius of `GET /jobs?near=` when `radiusKm` is not given, and the largest one accepted
+GEO_DEFAULT_RADIUS_KM = float(os.getenv('GEO_DEFAULT_RADIUS_KM', '25'))
+GEO_MAX_RADIUS_KM = float(os.getenv('GEO_MAX_RADIUS_KM', '300'))
+
+# Job lifecycle (scheduled publish, expiry): run it in the app process, every how many
+# seconds, how long a worker holds its lease, and jobs moved per update_many
+LIFECYCLE_IN_APP = os.getenv('LIFECYCLE_IN_APP', 'false').lower() == 'true'
+LIFECYCLE_INTERVAL_SECONDS = float(os.getenv('LIFECYCLE_INTERVAL_SECONDS', '60'))
+LIFECYCLE_LEASE_SECONDS = float(os.getenv('LIFECYCLE_LEASE_SECONDS', '300'))
+LIFECYCLE_BATCH_SIZE = int(os.getenv('LIFECYCLE_BATCH_SIZE', '1000'))
+
+
+# Days deleted documents are kept, live or archived, before `purge-deleted` removes them for good,
+# for every module unless RETENTION_DAYS_<MODULE> overrides it
+RETENTION_DAYS = float(os.getenv('RETENTION_DAYS', '365'))
+RETENTION_DAYS_USERS = float(os.getenv('RETENTION_DAYS_USERS', RETENTION_DAYS))
+RETENTION_DAYS_EMPLOIS = float(os.getenv('RETENTION_DAYS_EMPLOIS', RETENTION_DAYS))
+RETENTION_DAYS_CANDIDATS = float(os.getenv('RETENTION_DAYS_CANDIDATS', RETENTION_DAYS))
+RETENTION_DAYS_APPLICATIONS = float(os.getenv('RETENTION_DAYS_APPLICATIONS', RETENTION_DAYS))
+
+# Purge: documents deleted per batch, deletes per second allowed across the batches (0 for
+# no pause), and how long a worker holds the lease of the collection it purges
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', '500'))
+PURGE_MAX_DELETES_PER_SECOND = float(os.getenv('PURGE_MAX_DELETES_PER_SECOND', '2000'))
+PURGE_LEASE_SECONDS = float(os.getenv('PURGE_LEASE_SECONDS', '300'))
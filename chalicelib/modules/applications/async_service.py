@@ -0,0 +1,297 @@
+"""Application async service layer used by the route handlers"""
+
+from typing import Any, List, Optional
+from datetime import datetime, timezone
+from bson import ObjectId
+from pydantic import BaseModel
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from ...common.helpers.archive import Archive
+from ...common.helpers.bulk import Bulk
+from ...common.helpers.counters import Counters
+from ...common.helpers.filters import Filters
+from ...common.helpers.pagination import Pagination
+from ...common.helpers.projection import Projection
+from ...common.helpers.purge import Purge
+from ...common.helpers.typed_query import TypedQuery
+from ...config.settings import (
+    EXPORT_BATCH_SIZE, PURGE_BATCH_SIZE, PURGE_MAX_DELETES_PER_SECOND, RETENTION_DAYS_APPLICATIONS
+)
+from .model import ApplicationModel, ApplicationPartialModel, ApplicationPatchModel, ApplicationModelResult
+from .schema import application_schema
+from ..jobs.model import JobModel
+from ..jobs.schema import job_schema
+from ...common.exceptions.exception import ApplicationAlreadyExistsException
+
+
+class AsyncApplicationService:
+    """Async service class for application operations"""
+
+    def __init__(self):
+        self.schema = application_schema
+
+    @property
+    def collection(self):
+        """Collection of the schema on the current client"""
+        return self.schema.async_collection
+
+    @property
+    def job_collection(self):
+        """Collection of the jobs holding the application counters"""
+        return job_schema.async_collection
+
+    async def get_all_models(self, filters: Filters):
+        """Get all applications with filtering and pagination"""
+        query = filters.apply()
+        projection = Projection.build(filters.fields, ApplicationModel, self.schema.list_projection, ApplicationModel.appliedAt)
+        page = await Pagination.find_page_async(self.collection, query, filters, ApplicationModel.appliedAt, projection)
+        return self._page_result(page, projection)
+
+    async def export_models(self, filters: Filters, job_id: Optional[str] = None, candidat_id: Optional[str] = None):
+        """
+        Read applications for an export, with a batched cursor instead of pages
+
+        Args:
+            filters: Filters of the list, `fields` selects the exported fields
+            job_id: Only export the applications of this job
+            candidat_id: Only export the applications of this candidat
+
+        Returns:
+            Tuple of (projection of the read, async iterator of applications)
+        """
+        query = filters.apply()
+        if job_id:
+            query[ApplicationModel.jobId] = job_id
+        if candidat_id:
+            query[ApplicationModel.candidatId] = candidat_id
+        query = TypedQuery.compile(ApplicationModel, query)
+        projection = Projection.build(filters.fields, ApplicationModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection).sort(
+            {ApplicationModel.appliedAt: -1}
+        ).batch_size(EXPORT_BATCH_SIZE)
+        model = Projection.model(projection, ApplicationModel, ApplicationPartialModel)
+        return projection, (model.model_validate(document) async for document in cursor)
+
+    async def get_model(self, _id: str, fields: Optional[List[str]] = None):
+        """Get application by ID"""
+        projection = Projection.build(fields, ApplicationModel)
+        result = await self.collection.find_one({"_id": ObjectId(_id)}, projection)
+        if not result:
+            return None
+        return Projection.model(projection, ApplicationModel, ApplicationPartialModel).model_validate(result)
+
+    async def get_by_job(self, job_id: str, filters: Filters = None):
+        """Get applications by job ID, paginated like the list"""
+        if filters is None:
+            filters = Filters()
+        query = filters.apply()
+        query[ApplicationModel.jobId] = job_id
+        query = TypedQuery.compile(ApplicationModel, query)
+
+        projection = Projection.build(filters.fields, ApplicationModel, self.schema.list_projection, ApplicationModel.appliedAt)
+        page = await Pagination.find_page_async(
+            self.collection, query, filters, ApplicationModel.appliedAt, projection,
+            count_hint=self.schema.JOB_INDEX
+        )
+        return self._page_result(page, projection)
+
+    async def get_by_candidat(self, candidat_id: str, filters: Filters = None):
+        """Get applications by candidate ID, paginated like the list"""
+        if filters is None:
+            filters = Filters()
+        query = filters.apply()
+        query[ApplicationModel.candidatId] = candidat_id
+        query = TypedQuery.compile(ApplicationModel, query)
+
+        projection = Projection.build(filters.fields, ApplicationModel, self.schema.list_projection, ApplicationModel.appliedAt)
+        page = await Pagination.find_page_async(
+            self.collection, query, filters, ApplicationModel.appliedAt, projection,
+            count_hint=self.schema.CANDIDAT_INDEX
+        )
+        return self._page_result(page, projection)
+
+    async def add_model(self, model: ApplicationModel):
+        """Create a new application"""
+        serialized_data = self._serialize_new(model)
+
+        # Insert into MongoDB collection, the unique index rejects duplicates
+        try:
+            result = await self.collection.insert_one(serialized_data)
+        except DuplicateKeyError:
+            raise self._duplicate_error(serialized_data)
+        await self._update_counters([(None, serialized_data)])
+
+        # Build the created object from the inserted data instead of reading it back
+        return ApplicationModel.model_validate({**serialized_data, "_id": result.inserted_id})
+
+    async def add_models(self, items: List[Any]):
+        """
+        Create applications with one unordered insert_many
+
+        Args:
+            items: Raw items, validated one by one
+
+        Returns:
+            One result per item, with the new id or the error
+        """
+        models, errors = Bulk.validate(items, ApplicationModel)
+        documents = [(index, self._serialize_new(model)) for index, model in models]
+        results = await Bulk.insert_many_async(self.collection, documents, self._duplicate_error)
+        inserted = {result["index"] for result in results if "id" in result}
+        await self._update_counters([(None, document) for index, document in documents if index in inserted])
+        return errors + results
+
+    def _serialize_new(self, model: ApplicationModel) -> dict:
+        """Serialize a new application with its creation metadata"""
+        serialized_data = TypedQuery.document(ApplicationModel, model.model_dump(exclude_none=True))
+
+        # Add creation metadata
+        now = datetime.now(timezone.utc)
+        serialized_data[ApplicationModel.appliedAt] = now
+        serialized_data[ApplicationModel.createdAt] = now
+
+        return serialized_data
+
+    def _duplicate_error(self, document: dict) -> Exception:
+        """Exception reported when the unique index rejects an application"""
+        return ApplicationAlreadyExistsException("Application already exists for this job and candidate")
+
+    async def patch_model(self, _id: str, patch_model: BaseModel):
+        """
+        Apply a partial update in one round trip
+
+        The filter only matches when a field differs, so the "no changes" check is
+        done by the database and an unchanged application is not written.
+
+        Args:
+            _id: Application ID
+            patch_model: Patch model, None fields are left untouched
+
+        Returns:
+            The updated application, or None when it does not exist or nothing changed
+        """
+        # The document is read before the update, so the counters follow the change
+        fields = TypedQuery.document(ApplicationModel, patch_model.model_dump(exclude_none=True))
+        if not fields:
+            return None
+        before = await self.collection.find_one_and_update(
+            {"_id": ObjectId(_id), **Filters.changed_filter(fields)},
+            {"$set": fields},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not before:
+            return None
+        result = {**before, **fields}
+        await self._update_counters([(before, result)])
+        return ApplicationModel.model_validate(result)
+
+    async def exists(self, _id: str) -> bool:
+        """Check if an application exists"""
+        result = await self.collection.find_one({"_id": ObjectId(_id)}, {"_id": 1})
+        return result is not None
+
+    async def delete_model(self, _id: str):
+        """Move an application to the archive"""
+        before = await Archive.delete_async(self.collection, ObjectId(_id))
+        if not before:
+            return 0
+        await self._update_counters([(before, None)])
+        return 1
+
+    async def restore_model(self, _id: str):
+        """
+        Restore an application from the archive
+
+        Args:
+            _id: Application ID
+
+        Returns:
+            The restored application, or None when the archive has no application with this id
+        """
+        document, restored = await Archive.restore_async(self.collection, _id, self._duplicate_error)
+        if not document:
+            return None
+        if restored:
+            await self._update_counters([(None, document)])
+        return ApplicationModel.model_validate(document)
+
+    def purge(
+        self,
+        batch_size: int = PURGE_BATCH_SIZE,
+        max_per_second: float = PURGE_MAX_DELETES_PER_SECOND
+    ) -> Purge:
+        """
+        Purge of the applications deleted more than RETENTION_DAYS_APPLICATIONS ago, live and archived
+
+        `manage.py purge-deleted` runs it inline, `POST /applications/purge` in the background.
+        """
+        return Purge(self.schema.schema_name, RETENTION_DAYS_APPLICATIONS, batch_size, max_per_second)
+
+    async def patch_models(self, items: List[Any]):
+        """
+        Apply partial updates, one find_one_and_update per application
+
+        Args:
+            items: Raw {id, patch} items, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        patches, errors = Bulk.validate_patches(items, ApplicationPatchModel)
+        targets = [
+            (index, _id, TypedQuery.document(ApplicationModel, patch.model_dump(exclude_none=True)))
+            for index, _id, patch in patches
+        ]
+        results, changed = await Bulk.write_each_async(targets, self._patch_one, self._duplicate_error)
+        await self._update_counters(changed)
+        return errors + results
+
+    async def _patch_one(self, _id: ObjectId, fields: dict):
+        """Patch an application of a bulk patch, returning the fields it had before"""
+        before = await self.collection.find_one_and_update(
+            {"_id": _id, **Filters.changed_filter(fields)},
+            {"$set": fields},
+            projection=Bulk.projection([(None, _id, fields)], [ApplicationModel.jobId, ApplicationModel.status])
+        )
+        if before is None and await self.collection.find_one({"_id": _id}, {"_id": 1}):
+            # Matched but already up to date: reported as not modified, and not written
+            return {"_id": _id, **fields}
+        return before
+
+    async def delete_models(self, items: List[Any]):
+        """
+        Move applications to the archive, `BULK_WRITE_CONCURRENCY` at a time
+
+        Args:
+            items: Raw application ids, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        ids, errors = Bulk.validate_ids(items)
+        targets = [(index, _id, None) for index, _id in ids]
+        results, changed = await Bulk.write_each_async(targets, self._delete_one)
+        await self._update_counters(changed)
+        return errors + results
+
+    async def _delete_one(self, _id: ObjectId, _fields: None):
+        """Move an application of a bulk delete to the archive, returning it as it was"""
+        return await Archive.delete_async(self.collection, _id)
+
+    def _counters(self, document: dict) -> dict:
+        """Counters of its job an application contributes to"""
+        return {
+            JobModel.applicationCount: 1,
+            f"{JobModel.applicationCountByStatus}.{document[ApplicationModel.status]}": 1,
+        }
+
+    async def _update_counters(self, pairs):
+        """Apply the counter changes of written applications to their jobs"""
+        increments = Counters.changes(pairs, ApplicationModel.jobId, self._counters)
+        await Counters.apply_async(self.job_collection, increments)
+
+    def _page_result(self, page, projection):
+        """Build the result of a page read with a projection"""
+        return ApplicationModelResult(**page._replace(
+            results=Projection.validate(page.results, projection, ApplicationModel, ApplicationPartialModel)
+        )._asdict())
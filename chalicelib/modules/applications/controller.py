@@ -1,67 +1,156 @@
 from http import HTTPStatus
+from typing import Any, List
 from fastapi import APIRouter, Query, Path, Body, status
 from fastapi.responses import JSONResponse, Response
-from .service import ApplicationService
+from .async_service import AsyncApplicationService
 from ...common.enums.response_type_enum import ResponseTypeEnum
 from ...common.exceptions.exception import ApplicationException
+from ...common.helpers.bulk import Bulk
 from ...common.helpers.error_middleware import exception_handler
+from ...common.helpers.export import Export
 from ...common.helpers.filters import Filters
 from ...common.helpers.message_response_helper import MessageResponseHelper
+from ...config.settings import BULK_MAX_ITEMS
 from .messages import Messages
 from .model import ApplicationModel, ApplicationPatchModel
 
-service = ApplicationService()
+service = AsyncApplicationService()
 router = APIRouter(prefix='/applications', tags=['applications'])
 
 
 @router.post('', status_code=status.HTTP_201_CREATED)
 @exception_handler
-def add(payload: ApplicationModel):
+async def add(payload: ApplicationModel):
     """Create a new application"""
-    inserted_model = service.add_model(payload)
+    inserted_model = await service.add_model(payload)
     return JSONResponse(
         content=inserted_model.model_dump(exclude_none=True, mode='json'),
         status_code=HTTPStatus.CREATED
     )
 
 
+@router.post('/bulk', status_code=status.HTTP_201_CREATED)
+@exception_handler
+async def add_bulk(payload: List[Any] = Body(...)):
+    """Create applications in bulk, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise ApplicationException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.add_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.CREATED)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.patch('/bulk')
+@exception_handler
+async def patch_bulk(payload: List[Any] = Body(...)):
+    """Partially update applications in bulk from {id, patch} items, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise ApplicationException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.patch_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.delete('/bulk')
+@exception_handler
+async def delete_bulk(payload: List[Any] = Body(...)):
+    """Move applications to the archive in bulk from a list of ids, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise ApplicationException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.delete_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
 @router.get('')
 @exception_handler
-def get_all_with_criteria(
+async def get_all_with_criteria(
     jobId: str = Query(None),
     candidatId: str = Query(None),
     role: str = Query(None),
     status: str = Query(None),
     email: str = Query(None),
-    skip: int = Query(0),
-    limit: int = Query(100)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: str = Query(None),
+    includeTotal: str = Query(Filters.TOTAL_EXACT),
+    fields: str = Query(None)
 ):
     """Get all applications with filtering and pagination"""
+    criteria = Filters(
+        role=role, status=status, email=email, skip=skip, limit=limit,
+        cursor=cursor, include_total=includeTotal, fields=fields
+    )
+
     # If jobId is provided, get applications for that job
     if jobId:
-        models = service.get_by_job(jobId)
+        models = await service.get_by_job(jobId, criteria)
         return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
-    
+
     # If candidatId is provided, get applications for that candidat
     if candidatId:
-        models = service.get_by_candidat(candidatId)
+        models = await service.get_by_candidat(candidatId, criteria)
         return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
-    
-    criteria = Filters(role=role, status=status, email=email, skip=skip, limit=limit)
-    models = service.get_all_models(filters=criteria)
+
+    models = await service.get_all_models(filters=criteria)
     return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
 
 
+@router.get('/export')
+@exception_handler
+async def export(
+    jobId: str = Query(None),
+    candidatId: str = Query(None),
+    role: str = Query(None),
+    status: str = Query(None),
+    email: str = Query(None),
+    format: str = Query(Export.NDJSON),
+    fields: str = Query(None)
+):
+    """Stream the applications matching the filters as NDJSON or CSV"""
+    export_format = Export.check_format(format)
+    criteria = Filters(role=role, status=status, email=email, fields=fields)
+    projection, models = await service.export_models(criteria, job_id=jobId, candidat_id=candidatId)
+    return Export.response(models, export_format, Export.columns(projection, ApplicationModel), 'applications')
+
+
+@router.get('/purge')
+@exception_handler
+async def purge_progress():
+    """Progress of the purge of the applications deleted for longer than their retention period"""
+    return JSONResponse(content=await service.purge().progress_async())
+
+
+@router.post('/purge')
+@exception_handler
+async def purge(dryRun: bool = Query(False)):
+    """Hard delete the applications deleted for longer than their retention period, in the background"""
+    purge_run = service.purge()
+    if dryRun:
+        return JSONResponse(content=await purge_run.count_async())
+
+    if not await purge_run.start():
+        message_response = MessageResponseHelper.build(
+            ResponseTypeEnum.ERROR,
+            Messages.PURGE_RUNNING
+        )
+        return JSONResponse(content=message_response, status_code=HTTPStatus.CONFLICT)
+    return JSONResponse(content=await purge_run.progress_async(), status_code=HTTPStatus.ACCEPTED)
+
+
 @router.get('/{_id}')
 @exception_handler
-def get_by_id(_id: str = Path(...)):
+async def get_by_id(_id: str = Path(...), fields: str = Query(None)):
     """Get application by ID"""
     if not _id:
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.ERROR,
             Messages.REQUIRED_ID)
         return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
-    model = service.get_model(_id)
+    model = await service.get_model(_id, Filters.parse_fields(fields))
     if model:
         return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
     else:
@@ -73,43 +162,39 @@ def get_by_id(_id: str = Path(...)):
 
 @router.patch('/{_id}')
 @exception_handler
-def patch(_id: str = Path(...), application_patch_model: ApplicationPatchModel = Body(...)):
+async def patch(_id: str = Path(...), application_patch_model: ApplicationPatchModel = Body(...)):
     """Partially update an application"""
     if not _id:
         raise ApplicationException(Messages.REQUIRED_ID)
     
-    existing_application = service.get_model(_id)
-    if not existing_application:
-        message_response = MessageResponseHelper.build(
-            ResponseTypeEnum.ERROR,
-            Messages.ERROR_NOT_FOUND
-        )
-        return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
-    
     if not any(application_patch_model.model_dump(exclude_none=True).keys()):
         application_patch_model_keys = list(application_patch_model.model_fields.keys())
         message = Messages.UNAUTHORIZED_FIELDS.format(allowed_fields=application_patch_model_keys)
         raise ApplicationException(message)
-    
-    if not service.check_changes(existing_application, application_patch_model):
+
+    # One round trip, matching only when a field changes
+    patched_model = await service.patch_model(_id, application_patch_model)
+    if patched_model:
+        return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
+
+    if await service.exists(_id):
         return Response(content="", status_code=HTTPStatus.NO_CONTENT)
-    
-    # Update fields
-    service.update_application(_id, application_patch_model)
-    
-    patched_model = service.get_model(_id)
-    
-    return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
+
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
 
 
 @router.delete('/{_id}')
 @exception_handler
-def delete_by_id(_id: str = Path(...)):
-    """Delete an application (soft delete)"""
+async def delete_by_id(_id: str = Path(...)):
+    """Delete an application, moving it to the archive"""
     if not _id:
         raise ApplicationException(Messages.REQUIRED_ID)
     
-    if service.delete_model(_id):
+    if await service.delete_model(_id):
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.SUCCESS,
             Messages.SUCCESS_DELETED
@@ -122,3 +207,21 @@ def delete_by_id(_id: str = Path(...)):
         )
         status_code = HTTPStatus.NOT_FOUND
     return JSONResponse(content=message_response, status_code=status_code)
+
+
+@router.post('/{_id}/restore')
+@exception_handler
+async def restore(_id: str = Path(...)):
+    """Restore a deleted application from the archive"""
+    if not _id:
+        raise ApplicationException(Messages.REQUIRED_ID)
+
+    restored_model = await service.restore_model(_id)
+    if restored_model:
+        return JSONResponse(content=restored_model.model_dump(exclude_none=True, mode='json'))
+
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
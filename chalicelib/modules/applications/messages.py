@@ -12,9 +12,11 @@ class Messages:
     # Error messages
     ERROR_NOT_FOUND = "Application not found"
     REQUIRED_ID = "Application ID is required"
+    PURGE_RUNNING = "A purge of the deleted applications is already running"
     REQUIRED_JOB_ID = "Job ID is required"
     REQUIRED_CANDIDAT_ID = "Candidat ID is required"
     UNAUTHORIZED_FIELDS = "Only the following fields can be updated: {allowed_fields}"
+    BULK_SIZE = "Bulk requests take between 1 and {max_items} items"
     
     # Validation messages
     APPLICATION_EXISTS = "Application already exists for this job and candidate"
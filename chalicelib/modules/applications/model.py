@@ -2,7 +2,7 @@
 
 from datetime import datetime, timezone
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, Literal
+from typing import Optional, Literal, Union
 from ...common.types.type import ObjectIdStr
 
 
@@ -48,9 +48,26 @@ class ApplicationPatchModel(BaseModel, metaclass=MetaModel):
     status: Optional[Literal["submitted", "reviewed", "accepted", "rejected"]] = None
 
 
+class ApplicationPartialModel(BaseModel, metaclass=MetaModel):
+    """Application model of a document read with a projection, every field is optional"""
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
+    jobId: Optional[ObjectIdStr] = None
+    candidatId: Optional[ObjectIdStr] = None
+    cvUrl: Optional[str] = None
+    coverLetter: Optional[str] = None
+    status: Optional[Literal["submitted", "reviewed", "accepted", "rejected"]] = None
+    appliedAt: Optional[datetime] = None
+    createdAt: Optional[datetime] = None
+    deletedAt: Optional[datetime] = None
+
+
 class ApplicationModelResult(BaseModel, metaclass=MetaModel):
     """Application result model with pagination"""
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
     
-    total: int
-    results: list[ApplicationModel]
+    total: Optional[int] = None
+    totalExact: bool = True
+    results: list[Union[ApplicationModel, ApplicationPartialModel]]
+    nextCursor: Optional[str] = None
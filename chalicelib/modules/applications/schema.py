@@ -1,17 +1,44 @@
 """Application schema definitions for validation"""
 
-from datetime import datetime, timezone
-from bson import CodecOptions
+from datetime import datetime
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from pymongoose import methods
 from pymongoose.mongo_types import Types, Schema
 from .model import ApplicationModel
-from ...config.mongodb import mongo_client
-
-methods.database = mongo_client
+from ...common.helpers.archive import Archive
+from ...config.mongodb import mongodb
 
 
 class ApplicationSchema(Schema):
     schema_name = "Application"
+    # Keys of the indexes of the applications of a job and of a candidat, hinted to their counts
+    JOB_INDEX = [(ApplicationModel.jobId, ASCENDING), (ApplicationModel.appliedAt, DESCENDING), ("_id", DESCENDING)]
+    CANDIDAT_INDEX = [
+        (ApplicationModel.candidatId, ASCENDING), (ApplicationModel.appliedAt, DESCENDING), ("_id", DESCENDING)
+    ]
+    # Indexes backing Filters.apply() and the list sort; deleted documents are in the archive.
+    # The unique index enforces one application per (job, candidat).
+    indexes = [
+        IndexModel(
+            [(ApplicationModel.appliedAt, DESCENDING), ("_id", DESCENDING)],
+            name="appliedAt",
+        ),
+        IndexModel(
+            [(ApplicationModel.status, ASCENDING), (ApplicationModel.appliedAt, DESCENDING), ("_id", DESCENDING)],
+            name="status_appliedAt",
+        ),
+        IndexModel(JOB_INDEX, name="jobId_appliedAt"),
+        IndexModel(CANDIDAT_INDEX, name="candidatId_appliedAt"),
+        IndexModel(
+            [(ApplicationModel.jobId, ASCENDING), (ApplicationModel.candidatId, ASCENDING)],
+            name="jobId_candidatId",
+            unique=True,
+        ),
+        # Legacy documents deleted in place, before deletes moved them, for `manage.py archive-deleted`
+        Archive.index,
+    ]
+    # Default projection of list reads, leaving out the cover letter
+    list_projection = {ApplicationModel.coverLetter: 0, ApplicationModel.deletedAt: 0}
 
     def __init__(self, **kwargs):
         self.schema = {
@@ -56,10 +83,16 @@ class ApplicationSchema(Schema):
             },
         }
         super().__init__(self.schema_name, self.schema, kwargs)
-        self.native_collection = methods.database.get_collection(
-            self.schema_name,
-            codec_options=CodecOptions(tz_aware=True, tzinfo=timezone.utc)
-        )
+
+    @property
+    def native_collection(self):
+        """Blocking collection, resolved on the current client"""
+        return mongodb.get_collection(self.schema_name)
+
+    @property
+    def async_collection(self):
+        """Asyncio collection, resolved on the current client"""
+        return mongodb.get_async_collection(self.schema_name)
 
 
 application_schema = ApplicationSchema()
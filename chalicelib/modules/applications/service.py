@@ -1,131 +1,297 @@
-"""Application service layer for business logic"""
+"""Application service layer for `manage.py` and scripts, on the blocking client"""
 
-from typing import Any
-from datetime import datetime
+from typing import Any, List, Optional
+from datetime import datetime, timezone
 from bson import ObjectId
 from pydantic import BaseModel
-from pymongoose import methods
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from ...common.helpers.archive import Archive
+from ...common.helpers.bulk import Bulk
+from ...common.helpers.counters import Counters
 from ...common.helpers.filters import Filters
-from .model import ApplicationModel, ApplicationModelResult
-from .schema import application_schema, ApplicationSchema
+from ...common.helpers.pagination import Pagination
+from ...common.helpers.projection import Projection
+from ...common.helpers.purge import Purge
+from ...common.helpers.typed_query import TypedQuery
+from ...config.settings import (
+    EXPORT_BATCH_SIZE, PURGE_BATCH_SIZE, PURGE_MAX_DELETES_PER_SECOND, RETENTION_DAYS_APPLICATIONS
+)
+from .model import ApplicationModel, ApplicationPartialModel, ApplicationPatchModel, ApplicationModelResult
+from .schema import application_schema
+from ..jobs.model import JobModel
+from ..jobs.schema import job_schema
 from ...common.exceptions.exception import ApplicationAlreadyExistsException
 
 
 class ApplicationService:
     """Service class for application operations"""
-    
+
     def __init__(self):
         self.schema = application_schema
-        self.collection = application_schema.native_collection
-        
+
+    @property
+    def collection(self):
+        """Collection of the schema on the current client"""
+        return self.schema.native_collection
+
+    @property
+    def job_collection(self):
+        """Collection of the jobs holding the application counters"""
+        return job_schema.native_collection
+
     def get_all_models(self, filters: Filters):
         """Get all applications with filtering and pagination"""
         query = filters.apply()
-        total_count = self.collection.count_documents(query)
-        cursor = self.collection.find(
-            query,
-            limit=filters.limit,
-            skip=filters.skip,
-            sort={ApplicationModel.appliedAt: -1}
-        )
-        return ApplicationModelResult(total=total_count, results=list(cursor))
-    
-    def get_model(self, _id: str):
+        projection = Projection.build(filters.fields, ApplicationModel, self.schema.list_projection, ApplicationModel.appliedAt)
+        page = Pagination.find_page(self.collection, query, filters, ApplicationModel.appliedAt, projection)
+        return self._page_result(page, projection)
+
+    def export_models(self, filters: Filters, job_id: Optional[str] = None, candidat_id: Optional[str] = None):
+        """
+        Read applications for an export, with a batched cursor instead of pages
+
+        Args:
+            filters: Filters of the list, `fields` selects the exported fields
+            job_id: Only export the applications of this job
+            candidat_id: Only export the applications of this candidat
+
+        Returns:
+            Tuple of (projection of the read, iterator of applications)
+        """
+        query = filters.apply()
+        if job_id:
+            query[ApplicationModel.jobId] = job_id
+        if candidat_id:
+            query[ApplicationModel.candidatId] = candidat_id
+        query = TypedQuery.compile(ApplicationModel, query)
+        projection = Projection.build(filters.fields, ApplicationModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection).sort(
+            {ApplicationModel.appliedAt: -1}
+        ).batch_size(EXPORT_BATCH_SIZE)
+        model = Projection.model(projection, ApplicationModel, ApplicationPartialModel)
+        return projection, (model.model_validate(document) for document in cursor)
+
+    def get_model(self, _id: str, fields: Optional[List[str]] = None):
         """Get application by ID"""
-        result = self.collection.find_one({"_id": ObjectId(_id), "deletedAt": None})
+        projection = Projection.build(fields, ApplicationModel)
+        result = self.collection.find_one({"_id": ObjectId(_id)}, projection)
         if not result:
             return None
-        return ApplicationModel.model_validate(result)
-    
-    def get_by_job(self, job_id: str):
-        """Get applications by job ID"""
-        results = self.collection.find({
-            "jobId": job_id,
-            "deletedAt": None
-        }).sort({ApplicationModel.appliedAt: -1})
-        applications = [ApplicationModel.model_validate(result) for result in results]
-        return ApplicationModelResult(total=len(applications), results=applications)
-    
-    def get_by_candidat(self, candidat_id: str):
-        """Get applications by candidate ID"""
-        results = self.collection.find({
-            "candidatId": candidat_id,
-            "deletedAt": None
-        }).sort({ApplicationModel.appliedAt: -1})
-        applications = [ApplicationModel.model_validate(result) for result in results]
-        return ApplicationModelResult(total=len(applications), results=applications)
-    
+        return Projection.model(projection, ApplicationModel, ApplicationPartialModel).model_validate(result)
+
+    def get_by_job(self, job_id: str, filters: Filters = None):
+        """Get applications by job ID, paginated like the list"""
+        if filters is None:
+            filters = Filters()
+        query = filters.apply()
+        query[ApplicationModel.jobId] = job_id
+        query = TypedQuery.compile(ApplicationModel, query)
+
+        projection = Projection.build(filters.fields, ApplicationModel, self.schema.list_projection, ApplicationModel.appliedAt)
+        page = Pagination.find_page(
+            self.collection, query, filters, ApplicationModel.appliedAt, projection,
+            count_hint=self.schema.JOB_INDEX
+        )
+        return self._page_result(page, projection)
+
+    def get_by_candidat(self, candidat_id: str, filters: Filters = None):
+        """Get applications by candidate ID, paginated like the list"""
+        if filters is None:
+            filters = Filters()
+        query = filters.apply()
+        query[ApplicationModel.candidatId] = candidat_id
+        query = TypedQuery.compile(ApplicationModel, query)
+
+        projection = Projection.build(filters.fields, ApplicationModel, self.schema.list_projection, ApplicationModel.appliedAt)
+        page = Pagination.find_page(
+            self.collection, query, filters, ApplicationModel.appliedAt, projection,
+            count_hint=self.schema.CANDIDAT_INDEX
+        )
+        return self._page_result(page, projection)
+
     def add_model(self, model: ApplicationModel):
         """Create a new application"""
-        # Check if application already exists for this job and candidate
-        existing_application = self._get_existing_application(model)
-        if existing_application:
-            raise ApplicationAlreadyExistsException("Application already exists for this job and candidate")
-        
-        # Serialize the model
-        serialized_data = model.model_dump(exclude_none=True)
-        
+        serialized_data = self._serialize_new(model)
+
+        # Insert into MongoDB collection, the unique index rejects duplicates
+        try:
+            result = self.collection.insert_one(serialized_data)
+        except DuplicateKeyError:
+            raise self._duplicate_error(serialized_data)
+        self._update_counters([(None, serialized_data)])
+
+        # Build the created object from the inserted data instead of reading it back
+        return ApplicationModel.model_validate({**serialized_data, "_id": result.inserted_id})
+
+    def add_models(self, items: List[Any]):
+        """
+        Create applications with one unordered insert_many
+
+        Args:
+            items: Raw items, validated one by one
+
+        Returns:
+            One result per item, with the new id or the error
+        """
+        models, errors = Bulk.validate(items, ApplicationModel)
+        documents = [(index, self._serialize_new(model)) for index, model in models]
+        results = Bulk.insert_many(self.collection, documents, self._duplicate_error)
+        inserted = {result["index"] for result in results if "id" in result}
+        self._update_counters([(None, document) for index, document in documents if index in inserted])
+        return errors + results
+
+    def _serialize_new(self, model: ApplicationModel) -> dict:
+        """Serialize a new application with its creation metadata"""
+        serialized_data = TypedQuery.document(ApplicationModel, model.model_dump(exclude_none=True))
+
         # Add creation metadata
-        serialized_data[ApplicationModel.appliedAt] = datetime.utcnow()
-        serialized_data[ApplicationModel.createdAt] = datetime.utcnow()
-        
-        # Insert into MongoDB collection
-        inserted_id = methods.insert_one(ApplicationSchema.schema_name, serialized_data)
-        
-        # Return the complete object after insertion
-        return self.get_model(inserted_id)
-    
-    def _get_existing_application(self, model: ApplicationModel):
-        """Check if application already exists for job and candidate"""
-        return self.collection.find_one({
-            ApplicationModel.jobId: model.jobId,
-            ApplicationModel.candidatId: model.candidatId,
-            "deletedAt": None
-        })
-
-    def update_application(self, _id: str, patch_model: BaseModel):
-        """Update application fields"""
-        obj_id = ObjectId(_id)
-        update_data = {}
-        
-        # Build update data from patch model
-        patch_dict = patch_model.model_dump(exclude_none=True)
-        for field, value in patch_dict.items():
-            if value is not None:
-                update_data[field] = value
-        
-        if not update_data:
-            return
-        
-        self.schema.update(
-            {"_id": obj_id, "deletedAt": None},
-            {"$set": update_data}
+        now = datetime.now(timezone.utc)
+        serialized_data[ApplicationModel.appliedAt] = now
+        serialized_data[ApplicationModel.createdAt] = now
+
+        return serialized_data
+
+    def _duplicate_error(self, document: dict) -> Exception:
+        """Exception reported when the unique index rejects an application"""
+        return ApplicationAlreadyExistsException("Application already exists for this job and candidate")
+
+    def patch_model(self, _id: str, patch_model: BaseModel):
+        """
+        Apply a partial update in one round trip
+
+        The filter only matches when a field differs, so the "no changes" check is
+        done by the database and an unchanged application is not written.
+
+        Args:
+            _id: Application ID
+            patch_model: Patch model, None fields are left untouched
+
+        Returns:
+            The updated application, or None when it does not exist or nothing changed
+        """
+        # The document is read before the update, so the counters follow the change
+        fields = TypedQuery.document(ApplicationModel, patch_model.model_dump(exclude_none=True))
+        if not fields:
+            return None
+        before = self.collection.find_one_and_update(
+            {"_id": ObjectId(_id), **Filters.changed_filter(fields)},
+            {"$set": fields},
+            return_document=ReturnDocument.BEFORE
         )
+        if not before:
+            return None
+        result = {**before, **fields}
+        self._update_counters([(before, result)])
+        return ApplicationModel.model_validate(result)
+
+    def exists(self, _id: str) -> bool:
+        """Check if an application exists"""
+        result = self.collection.find_one({"_id": ObjectId(_id)}, {"_id": 1})
+        return result is not None
 
     def delete_model(self, _id: str):
-        """Soft delete an application"""
-        obj_id = ObjectId(_id)
-        result = self.schema.update(
-            {"_id": obj_id, "deletedAt": None},
-            {"$set": {"deletedAt": datetime.utcnow()}}
+        """Move an application to the archive"""
+        before = Archive.delete(self.collection, ObjectId(_id))
+        if not before:
+            return 0
+        self._update_counters([(before, None)])
+        return 1
+
+    def restore_model(self, _id: str):
+        """
+        Restore an application from the archive
+
+        Args:
+            _id: Application ID
+
+        Returns:
+            The restored application, or None when the archive has no application with this id
+        """
+        document, restored = Archive.restore(self.collection, _id, self._duplicate_error)
+        if not document:
+            return None
+        if restored:
+            self._update_counters([(None, document)])
+        return ApplicationModel.model_validate(document)
+
+    def purge(
+        self,
+        batch_size: int = PURGE_BATCH_SIZE,
+        max_per_second: float = PURGE_MAX_DELETES_PER_SECOND
+    ) -> Purge:
+        """
+        Purge of the applications deleted more than RETENTION_DAYS_APPLICATIONS ago, live and archived
+
+        `manage.py purge-deleted` runs it inline, `POST /applications/purge` in the background.
+        """
+        return Purge(self.schema.schema_name, RETENTION_DAYS_APPLICATIONS, batch_size, max_per_second)
+
+    def patch_models(self, items: List[Any]):
+        """
+        Apply partial updates, one find_one_and_update per application
+
+        Args:
+            items: Raw {id, patch} items, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        patches, errors = Bulk.validate_patches(items, ApplicationPatchModel)
+        targets = [
+            (index, _id, TypedQuery.document(ApplicationModel, patch.model_dump(exclude_none=True)))
+            for index, _id, patch in patches
+        ]
+        results, changed = Bulk.write_each(targets, self._patch_one, self._duplicate_error)
+        self._update_counters(changed)
+        return errors + results
+
+    def _patch_one(self, _id: ObjectId, fields: dict):
+        """Patch an application of a bulk patch, returning the fields it had before"""
+        before = self.collection.find_one_and_update(
+            {"_id": _id, **Filters.changed_filter(fields)},
+            {"$set": fields},
+            projection=Bulk.projection([(None, _id, fields)], [ApplicationModel.jobId, ApplicationModel.status])
         )
-        return result.modified_count
-
-    def check_changes(self, existing_application_model: BaseModel, application_patch_model: BaseModel) -> bool:
-        """Check if there are any changes between existing and patch models"""
-        for field in application_patch_model.model_fields_set:
-            new_val = getattr(application_patch_model, field)
-            old_val = getattr(existing_application_model, field, None)
-            if self._to_plain(new_val) != self._to_plain(old_val):
-                return True
-        return False
-
-    def _to_plain(self, value: Any) -> Any:
-        """Convert value to plain representation for comparison"""
-        if isinstance(value, BaseModel):
-            return value.model_dump(exclude_none=True)
-        if isinstance(value, dict):
-            return {k: self._to_plain(v) for k, v in value.items()}
-        if isinstance(value, (list, tuple)):
-            return [self._to_plain(v) for v in value]
-        return value
+        if before is None and self.collection.find_one({"_id": _id}, {"_id": 1}):
+            # Matched but already up to date: reported as not modified, and not written
+            return {"_id": _id, **fields}
+        return before
+
+    def delete_models(self, items: List[Any]):
+        """
+        Move applications to the archive, `BULK_WRITE_CONCURRENCY` at a time
+
+        Args:
+            items: Raw application ids, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        ids, errors = Bulk.validate_ids(items)
+        targets = [(index, _id, None) for index, _id in ids]
+        results, changed = Bulk.write_each(targets, self._delete_one)
+        self._update_counters(changed)
+        return errors + results
+
+    def _delete_one(self, _id: ObjectId, _fields: None):
+        """Move an application of a bulk delete to the archive, returning it as it was"""
+        return Archive.delete(self.collection, _id)
+
+    def _counters(self, document: dict) -> dict:
+        """Counters of its job an application contributes to"""
+        return {
+            JobModel.applicationCount: 1,
+            f"{JobModel.applicationCountByStatus}.{document[ApplicationModel.status]}": 1,
+        }
+
+    def _update_counters(self, pairs):
+        """Apply the counter changes of written applications to their jobs"""
+        increments = Counters.changes(pairs, ApplicationModel.jobId, self._counters)
+        Counters.apply(self.job_collection, increments)
+
+    def _page_result(self, page, projection):
+        """Build the result of a page read with a projection"""
+        return ApplicationModelResult(**page._replace(
+            results=Projection.validate(page.results, projection, ApplicationModel, ApplicationPartialModel)
+        )._asdict())
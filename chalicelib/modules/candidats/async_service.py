@@ -0,0 +1,266 @@
+"""Candidat async service layer used by the route handlers"""
+
+from typing import Any, List, Optional
+from datetime import datetime, timezone
+from bson import ObjectId
+from pydantic import BaseModel
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from ...common.helpers.archive import Archive
+from ...common.helpers.bulk import Bulk
+from ...common.helpers.filters import Filters
+from ...common.helpers.pagination import Pagination
+from ...common.helpers.projection import Projection
+from ...common.helpers.purge import Purge
+from ...common.helpers.typed_query import TypedQuery
+from ...config.settings import (
+    EXPORT_BATCH_SIZE, PURGE_BATCH_SIZE, PURGE_MAX_DELETES_PER_SECOND, RETENTION_DAYS_CANDIDATS
+)
+from .model import CandidatModel, CandidatPartialModel, CandidatPatchModel, CandidatModelResult
+from .schema import candidat_schema
+from ..jobs.async_service import AsyncJobService
+from ..jobs.model import OPEN_STATUS
+from ...common.exceptions.exception import CandidatAlreadyExistsException
+
+
+class AsyncCandidatService:
+    """Async service class for candidat operations"""
+
+    def __init__(self):
+        self.schema = candidat_schema
+        self.job_service = AsyncJobService()
+
+    @property
+    def collection(self):
+        """Collection of the schema on the current client"""
+        return self.schema.async_collection
+
+    async def get_all_models(self, filters: Filters):
+        """Get all candidats with filtering and pagination"""
+        query = filters.apply()
+        projection = Projection.build(filters.fields, CandidatModel, self.schema.list_projection, CandidatModel.createdAt)
+        page = await Pagination.find_page_async(self.collection, query, filters, CandidatModel.createdAt, projection)
+        return self._page_result(page, projection)
+
+    async def export_models(self, filters: Filters, user_id: Optional[str] = None):
+        """
+        Read candidats for an export, with a batched cursor instead of pages
+
+        Args:
+            filters: Filters of the list, `fields` selects the exported fields
+            user_id: Only export the candidats of this user
+
+        Returns:
+            Tuple of (projection of the read, async iterator of candidats)
+        """
+        query = filters.apply()
+        if user_id:
+            query[CandidatModel.userId] = user_id
+        query = TypedQuery.compile(CandidatModel, query)
+        projection = Projection.build(filters.fields, CandidatModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection).sort(
+            {CandidatModel.createdAt: -1}
+        ).batch_size(EXPORT_BATCH_SIZE)
+        model = Projection.model(projection, CandidatModel, CandidatPartialModel)
+        return projection, (model.model_validate(document) async for document in cursor)
+
+    async def get_model(self, _id: str, fields: Optional[List[str]] = None):
+        """Get candidat by ID"""
+        projection = Projection.build(fields, CandidatModel)
+        result = await self.collection.find_one({"_id": ObjectId(_id)}, projection)
+        if not result:
+            return None
+        return Projection.model(projection, CandidatModel, CandidatPartialModel).model_validate(result)
+
+    async def get_by_user(self, user_id: str, fields: Optional[List[str]] = None):
+        """Get candidat by user ID"""
+        projection = Projection.build(fields, CandidatModel)
+        result = await self.collection.find_one(TypedQuery.compile(CandidatModel, {
+            CandidatModel.userId: user_id
+        }), projection)
+        if not result:
+            return None
+        return Projection.model(projection, CandidatModel, CandidatPartialModel).model_validate(result)
+
+    async def get_matches(self, _id: str, filters: Filters = None):
+        """
+        Get the published jobs matching the skills of a candidat, best match first
+
+        Skills are matched whole against the normalized skills of the jobs, so the
+        jobs sharing the most skills come first, the newest first on ties.
+
+        Args:
+            _id: Candidat ID
+            filters: Filters of the list (fields, limit, cursor), the status is always published
+
+        Returns:
+            One page of jobs, or None when the candidat does not exist
+        """
+        candidat = await self.collection.find_one({"_id": ObjectId(_id)}, {CandidatModel.skills: 1})
+        if not candidat:
+            return None
+        if filters is None:
+            filters = Filters()
+        filters.status = OPEN_STATUS
+        return await self.job_service.match_skills(candidat.get(CandidatModel.skills), filters)
+
+    async def add_model(self, model: CandidatModel):
+        """Create a new candidat"""
+        serialized_data = self._serialize_new(model)
+
+        # Insert into MongoDB collection, the unique index rejects duplicates
+        try:
+            result = await self.collection.insert_one(serialized_data)
+        except DuplicateKeyError:
+            raise self._duplicate_error(serialized_data)
+
+        # Build the created object from the inserted data instead of reading it back
+        return CandidatModel.model_validate({**serialized_data, "_id": result.inserted_id})
+
+    async def add_models(self, items: List[Any]):
+        """
+        Create candidats with one unordered insert_many
+
+        Args:
+            items: Raw items, validated one by one
+
+        Returns:
+            One result per item, with the new id or the error
+        """
+        models, errors = Bulk.validate(items, CandidatModel)
+        documents = [(index, self._serialize_new(model)) for index, model in models]
+        return errors + await Bulk.insert_many_async(self.collection, documents, self._duplicate_error)
+
+    def _serialize_new(self, model: CandidatModel) -> dict:
+        """Serialize a new candidat with its creation metadata"""
+        serialized_data = TypedQuery.document(CandidatModel, model.model_dump(exclude_none=True))
+
+        # Add creation metadata
+        serialized_data[CandidatModel.createdAt] = datetime.now(timezone.utc)
+
+        return serialized_data
+
+    def _duplicate_error(self, document: dict) -> Exception:
+        """Exception reported when the unique index rejects a candidat"""
+        return CandidatAlreadyExistsException("This user already has a candidat profile")
+
+    async def patch_model(self, _id: str, patch_model: BaseModel):
+        """
+        Apply a partial update in one round trip
+
+        The filter only matches when a field differs, so the "no changes" check is
+        done by the database and an unchanged candidat is not written.
+
+        Args:
+            _id: Candidat ID
+            patch_model: Patch model, None fields are left untouched
+
+        Returns:
+            The updated candidat, or None when it does not exist or nothing changed
+        """
+        fields = TypedQuery.document(CandidatModel, patch_model.model_dump(exclude_none=True))
+        if not fields:
+            return None
+        result = await self.collection.find_one_and_update(
+            {"_id": ObjectId(_id), **Filters.changed_filter(fields)},
+            {"$set": fields},
+            return_document=ReturnDocument.AFTER
+        )
+        if not result:
+            return None
+        return CandidatModel.model_validate(result)
+
+    async def exists(self, _id: str) -> bool:
+        """Check if a candidat exists"""
+        result = await self.collection.find_one({"_id": ObjectId(_id)}, {"_id": 1})
+        return result is not None
+
+    async def delete_model(self, _id: str):
+        """Move a candidat to the archive"""
+        document = await Archive.delete_async(self.collection, ObjectId(_id))
+        return 0 if document is None else 1
+
+    async def restore_model(self, _id: str):
+        """
+        Restore a candidat from the archive
+
+        Args:
+            _id: Candidat ID
+
+        Returns:
+            The restored candidat, or None when the archive has no candidat with this id
+        """
+        document, _ = await Archive.restore_async(self.collection, _id, self._duplicate_error)
+        if not document:
+            return None
+        return CandidatModel.model_validate(document)
+
+    def purge(
+        self,
+        batch_size: int = PURGE_BATCH_SIZE,
+        max_per_second: float = PURGE_MAX_DELETES_PER_SECOND
+    ) -> Purge:
+        """
+        Purge of the candidats deleted more than RETENTION_DAYS_CANDIDATS ago, live and archived
+
+        `manage.py purge-deleted` runs it inline, `POST /candidats/purge` in the background.
+        """
+        return Purge(self.schema.schema_name, RETENTION_DAYS_CANDIDATS, batch_size, max_per_second)
+
+    async def patch_models(self, items: List[Any]):
+        """
+        Apply partial updates with one unordered bulk_write
+
+        Args:
+            items: Raw {id, patch} items, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        patches, errors = Bulk.validate_patches(items, CandidatPatchModel)
+        targets = [
+            (index, _id, TypedQuery.document(CandidatModel, patch.model_dump(exclude_none=True)))
+            for index, _id, patch in patches
+        ]
+        current = await self._current(targets)
+        operations = [
+            (index, UpdateOne({"_id": _id, **Filters.changed_filter(fields)}, {"$set": fields}))
+            for index, _id, fields in targets
+        ]
+        failed = await Bulk.write_async(self.collection, operations)
+        return errors + Bulk.write_results(targets, current, failed, self._duplicate_error)
+
+    async def delete_models(self, items: List[Any]):
+        """
+        Move candidats to the archive, `BULK_WRITE_CONCURRENCY` at a time
+
+        Args:
+            items: Raw candidat ids, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        ids, errors = Bulk.validate_ids(items)
+        targets = [(index, _id, None) for index, _id in ids]
+        results, _ = await Bulk.write_each_async(targets, self._delete_one)
+        return errors + results
+
+    async def _delete_one(self, _id: ObjectId, _fields: None):
+        """Move a candidat of a bulk delete to the archive, returning it as it was"""
+        return await Archive.delete_async(self.collection, _id)
+
+    async def _current(self, targets):
+        """Read the live candidats targeted by a bulk write, keyed by _id"""
+        if not targets:
+            return {}
+        cursor = self.collection.find(
+            {"_id": {"$in": [_id for _, _id, _ in targets]}},
+            Bulk.projection(targets)
+        )
+        return {document["_id"]: document async for document in cursor}
+
+    def _page_result(self, page, projection):
+        """Build the result of a page read with a projection"""
+        return CandidatModelResult(**page._replace(
+            results=Projection.validate(page.results, projection, CandidatModel, CandidatPartialModel)
+        )._asdict())
@@ -1,44 +1,87 @@
 from http import HTTPStatus
+from typing import Any, List
 from fastapi import APIRouter, Query, Path, Body, status
 from fastapi.responses import JSONResponse, Response
-from .service import CandidatService
+from .async_service import AsyncCandidatService
 from ...common.enums.response_type_enum import ResponseTypeEnum
 from ...common.exceptions.exception import CandidatException
+from ...common.helpers.bulk import Bulk
 from ...common.helpers.error_middleware import exception_handler
+from ...common.helpers.export import Export
 from ...common.helpers.filters import Filters
 from ...common.helpers.message_response_helper import MessageResponseHelper
+from ...config.settings import BULK_MAX_ITEMS
 from .messages import Messages
 from .model import CandidatModel, CandidatPatchModel
 
-service = CandidatService()
+service = AsyncCandidatService()
 router = APIRouter(prefix='/candidats', tags=['candidats'])
 
 
 @router.post('', status_code=status.HTTP_201_CREATED)
 @exception_handler
-def add(payload: CandidatModel):
+async def add(payload: CandidatModel):
     """Create a new candidat"""
-    inserted_model = service.add_model(payload)
+    inserted_model = await service.add_model(payload)
     return JSONResponse(
         content=inserted_model.model_dump(exclude_none=True, mode='json'),
         status_code=HTTPStatus.CREATED
     )
 
 
+@router.post('/bulk', status_code=status.HTTP_201_CREATED)
+@exception_handler
+async def add_bulk(payload: List[Any] = Body(...)):
+    """Create candidats in bulk, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise CandidatException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.add_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.CREATED)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.patch('/bulk')
+@exception_handler
+async def patch_bulk(payload: List[Any] = Body(...)):
+    """Partially update candidats in bulk from {id, patch} items, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise CandidatException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.patch_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.delete('/bulk')
+@exception_handler
+async def delete_bulk(payload: List[Any] = Body(...)):
+    """Move candidats to the archive in bulk from a list of ids, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise CandidatException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.delete_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
 @router.get('')
 @exception_handler
-def get_all_with_criteria(
+async def get_all_with_criteria(
     userId: str = Query(None),
     role: str = Query(None),
     status: str = Query(None),
     email: str = Query(None),
-    skip: int = Query(0),
-    limit: int = Query(100)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: str = Query(None),
+    includeTotal: str = Query(Filters.TOTAL_EXACT),
+    fields: str = Query(None)
 ):
     """Get all candidats with filtering and pagination"""
     # If userId is provided, get specific candidat
     if userId:
-        model = service.get_by_user(userId)
+        model = await service.get_by_user(userId, Filters.parse_fields(fields))
         if model:
             return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
         else:
@@ -47,21 +90,65 @@ def get_all_with_criteria(
                 Messages.ERROR_NOT_FOUND)
             return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
     
-    criteria = Filters(role=role, status=status, email=email, skip=skip, limit=limit)
-    models = service.get_all_models(filters=criteria)
+    criteria = Filters(
+        role=role, status=status, email=email, skip=skip, limit=limit,
+        cursor=cursor, include_total=includeTotal, fields=fields
+    )
+    models = await service.get_all_models(filters=criteria)
     return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
 
 
+@router.get('/export')
+@exception_handler
+async def export(
+    userId: str = Query(None),
+    role: str = Query(None),
+    status: str = Query(None),
+    email: str = Query(None),
+    format: str = Query(Export.NDJSON),
+    fields: str = Query(None)
+):
+    """Stream the candidats matching the filters as NDJSON or CSV"""
+    export_format = Export.check_format(format)
+    criteria = Filters(role=role, status=status, email=email, fields=fields)
+    projection, models = await service.export_models(criteria, user_id=userId)
+    return Export.response(models, export_format, Export.columns(projection, CandidatModel), 'candidats')
+
+
+@router.get('/purge')
+@exception_handler
+async def purge_progress():
+    """Progress of the purge of the candidats deleted for longer than their retention period"""
+    return JSONResponse(content=await service.purge().progress_async())
+
+
+@router.post('/purge')
+@exception_handler
+async def purge(dryRun: bool = Query(False)):
+    """Hard delete the candidats deleted for longer than their retention period, in the background"""
+    purge_run = service.purge()
+    if dryRun:
+        return JSONResponse(content=await purge_run.count_async())
+
+    if not await purge_run.start():
+        message_response = MessageResponseHelper.build(
+            ResponseTypeEnum.ERROR,
+            Messages.PURGE_RUNNING
+        )
+        return JSONResponse(content=message_response, status_code=HTTPStatus.CONFLICT)
+    return JSONResponse(content=await purge_run.progress_async(), status_code=HTTPStatus.ACCEPTED)
+
+
 @router.get('/{_id}')
 @exception_handler
-def get_by_id(_id: str = Path(...)):
+async def get_by_id(_id: str = Path(...), fields: str = Query(None)):
     """Get candidat by ID"""
     if not _id:
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.ERROR,
             Messages.REQUIRED_ID)
         return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
-    model = service.get_model(_id)
+    model = await service.get_model(_id, Filters.parse_fields(fields))
     if model:
         return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
     else:
@@ -71,45 +158,60 @@ def get_by_id(_id: str = Path(...)):
         return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
 
 
+@router.get('/{_id}/matches')
+@exception_handler
+async def get_matches(
+    _id: str = Path(...),
+    limit: int = Query(20, ge=1),
+    cursor: str = Query(None),
+    fields: str = Query(None)
+):
+    """Get the published jobs matching the skills of a candidat, best match first"""
+    criteria = Filters(limit=limit, cursor=cursor, include_total=Filters.TOTAL_NONE, fields=fields)
+    models = await service.get_matches(_id, criteria)
+    if models is None:
+        message_response = MessageResponseHelper.build(
+            ResponseTypeEnum.ERROR,
+            Messages.ERROR_NOT_FOUND)
+        return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
+    return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
+
+
 @router.patch('/{_id}')
 @exception_handler
-def patch(_id: str = Path(...), candidat_patch_model: CandidatPatchModel = Body(...)):
+async def patch(_id: str = Path(...), candidat_patch_model: CandidatPatchModel = Body(...)):
     """Partially update a candidat"""
     if not _id:
         raise CandidatException(Messages.REQUIRED_ID)
     
-    existing_candidat = service.get_model(_id)
-    if not existing_candidat:
-        message_response = MessageResponseHelper.build(
-            ResponseTypeEnum.ERROR,
-            Messages.ERROR_NOT_FOUND
-        )
-        return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
-    
     if not any(candidat_patch_model.model_dump(exclude_none=True).keys()):
         candidat_patch_model_keys = list(candidat_patch_model.model_fields.keys())
         message = Messages.UNAUTHORIZED_FIELDS.format(allowed_fields=candidat_patch_model_keys)
         raise CandidatException(message)
-    
-    if not service.check_changes(existing_candidat, candidat_patch_model):
+
+    # One round trip, matching only when a field changes
+    patched_model = await service.patch_model(_id, candidat_patch_model)
+    if patched_model:
+        return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
+
+    if await service.exists(_id):
         return Response(content="", status_code=HTTPStatus.NO_CONTENT)
-    
-    # Update fields
-    service.update_candidat(_id, candidat_patch_model)
-    
-    patched_model = service.get_model(_id)
-    
-    return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
+
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
 
 
 @router.delete('/{_id}')
 @exception_handler
-def delete_by_id(_id: str = Path(...)):
-    """Delete a candidat (soft delete)"""
+async def delete_by_id(_id: str = Path(...)):
+    """Delete a candidat, moving it to the archive"""
     if not _id:
         raise CandidatException(Messages.REQUIRED_ID)
     
-    if service.delete_model(_id):
+    if await service.delete_model(_id):
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.SUCCESS,
             Messages.SUCCESS_DELETED
@@ -122,3 +224,21 @@ def delete_by_id(_id: str = Path(...)):
         )
         status_code = HTTPStatus.NOT_FOUND
     return JSONResponse(content=message_response, status_code=status_code)
+
+
+@router.post('/{_id}/restore')
+@exception_handler
+async def restore(_id: str = Path(...)):
+    """Restore a deleted candidat from the archive"""
+    if not _id:
+        raise CandidatException(Messages.REQUIRED_ID)
+
+    restored_model = await service.restore_model(_id)
+    if restored_model:
+        return JSONResponse(content=restored_model.model_dump(exclude_none=True, mode='json'))
+
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
@@ -12,8 +12,10 @@ class Messages:
     # Error messages
     ERROR_NOT_FOUND = "Candidat not found"
     REQUIRED_ID = "Candidat ID is required"
+    PURGE_RUNNING = "A purge of the deleted candidats is already running"
     REQUIRED_USER_ID = "User ID is required"
     UNAUTHORIZED_FIELDS = "Only the following fields can be updated: {allowed_fields}"
+    BULK_SIZE = "Bulk requests take between 1 and {max_items} items"
     
     # Validation messages
     CANDIDAT_EXISTS = "This user already has a candidat profile"
@@ -2,7 +2,7 @@
 
 from datetime import datetime, timezone
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Union
 from ...common.types.type import ObjectIdStr
 
 
@@ -48,9 +48,25 @@ class CandidatPatchModel(BaseModel, metaclass=MetaModel):
     education: Optional[str] = None
 
 
+class CandidatPartialModel(BaseModel, metaclass=MetaModel):
+    """Candidat model of a document read with a projection, every field is optional"""
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
+    userId: Optional[ObjectIdStr] = None
+    cvUrl: Optional[str] = None
+    skills: Optional[List[str]] = None
+    experience: Optional[str] = None
+    education: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    deletedAt: Optional[datetime] = None
+
+
 class CandidatModelResult(BaseModel, metaclass=MetaModel):
     """Candidat result model with pagination"""
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
     
-    total: int
-    results: list[CandidatModel]
+    total: Optional[int] = None
+    totalExact: bool = True
+    results: list[Union[CandidatModel, CandidatPartialModel]]
+    nextCursor: Optional[str] = None
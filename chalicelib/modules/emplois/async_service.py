@@ -0,0 +1,245 @@
+"""Emploi async service layer used by the route handlers"""
+
+from typing import Any, List, Optional
+from datetime import datetime, timezone
+from bson import ObjectId
+from pydantic import BaseModel
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from ...common.helpers.archive import Archive
+from ...common.helpers.bulk import Bulk
+from ...common.helpers.filters import Filters
+from ...common.helpers.pagination import Pagination
+from ...common.helpers.projection import Projection
+from ...common.helpers.purge import Purge
+from ...common.helpers.typed_query import TypedQuery
+from ...config.settings import (
+    EXPORT_BATCH_SIZE, PURGE_BATCH_SIZE, PURGE_MAX_DELETES_PER_SECOND, RETENTION_DAYS_EMPLOIS
+)
+from .model import EmploiModel, EmploiPartialModel, EmploiPatchModel, EmploiModelResult
+from .schema import emploi_schema
+from ...common.exceptions.exception import EmploiAlreadyExistsException
+
+
+class AsyncEmploiService:
+    """Async service class for emploi operations"""
+
+    def __init__(self):
+        self.schema = emploi_schema
+
+    @property
+    def collection(self):
+        """Collection of the schema on the current client"""
+        return self.schema.async_collection
+
+    async def get_all_models(self, filters: Filters):
+        """Get all emplois with filtering and pagination"""
+        query = filters.apply()
+        projection = Projection.build(filters.fields, EmploiModel, self.schema.list_projection, EmploiModel.createdAt)
+        page = await Pagination.find_page_async(self.collection, query, filters, EmploiModel.createdAt, projection)
+        return self._page_result(page, projection)
+
+    async def export_models(self, filters: Filters, user_id: Optional[str] = None, entreprise_id: Optional[str] = None):
+        """
+        Read emplois for an export, with a batched cursor instead of pages
+
+        Args:
+            filters: Filters of the list, `fields` selects the exported fields
+            user_id: Only export the emplois of this user
+            entreprise_id: Only export the emplois of this entreprise
+
+        Returns:
+            Tuple of (projection of the read, async iterator of emplois)
+        """
+        query = filters.apply()
+        if user_id:
+            query[EmploiModel.userId] = user_id
+        if entreprise_id:
+            query[EmploiModel.entrepriseId] = entreprise_id
+        query = TypedQuery.compile(EmploiModel, query)
+        projection = Projection.build(filters.fields, EmploiModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection).sort(
+            {EmploiModel.createdAt: -1}
+        ).batch_size(EXPORT_BATCH_SIZE)
+        model = Projection.model(projection, EmploiModel, EmploiPartialModel)
+        return projection, (model.model_validate(document) async for document in cursor)
+
+    async def get_model(self, _id: str, fields: Optional[List[str]] = None):
+        """Get emploi by ID"""
+        projection = Projection.build(fields, EmploiModel)
+        result = await self.collection.find_one({"_id": ObjectId(_id)}, projection)
+        if not result:
+            return None
+        return Projection.model(projection, EmploiModel, EmploiPartialModel).model_validate(result)
+
+    async def get_by_user_and_entreprise(self, user_id: str, entreprise_id: str, fields: Optional[List[str]] = None):
+        """Get emploi by user ID and entreprise ID"""
+        projection = Projection.build(fields, EmploiModel)
+        result = await self.collection.find_one(TypedQuery.compile(EmploiModel, {
+            EmploiModel.userId: user_id,
+            EmploiModel.entrepriseId: entreprise_id
+        }), projection)
+        if not result:
+            return None
+        return Projection.model(projection, EmploiModel, EmploiPartialModel).model_validate(result)
+
+    async def add_model(self, model: EmploiModel):
+        """Create a new emploi"""
+        serialized_data = self._serialize_new(model)
+
+        # Insert into MongoDB collection, the unique index rejects duplicates
+        try:
+            result = await self.collection.insert_one(serialized_data)
+        except DuplicateKeyError:
+            raise self._duplicate_error(serialized_data)
+
+        # Build the created object from the inserted data instead of reading it back
+        return EmploiModel.model_validate({**serialized_data, "_id": result.inserted_id})
+
+    async def add_models(self, items: List[Any]):
+        """
+        Create emplois with one unordered insert_many
+
+        Args:
+            items: Raw items, validated one by one
+
+        Returns:
+            One result per item, with the new id or the error
+        """
+        models, errors = Bulk.validate(items, EmploiModel)
+        documents = [(index, self._serialize_new(model)) for index, model in models]
+        return errors + await Bulk.insert_many_async(self.collection, documents, self._duplicate_error)
+
+    def _serialize_new(self, model: EmploiModel) -> dict:
+        """Serialize a new emploi with its creation metadata"""
+        serialized_data = TypedQuery.document(EmploiModel, model.model_dump(exclude_none=True))
+
+        # Add creation metadata
+        serialized_data[EmploiModel.createdAt] = datetime.now(timezone.utc)
+
+        return serialized_data
+
+    def _duplicate_error(self, document: dict) -> Exception:
+        """Exception reported when the unique index rejects an emploi"""
+        return EmploiAlreadyExistsException("This user already has an emploi at this entreprise")
+
+    async def patch_model(self, _id: str, patch_model: BaseModel):
+        """
+        Apply a partial update in one round trip
+
+        The filter only matches when a field differs, so the "no changes" check is
+        done by the database and an unchanged emploi is not written.
+
+        Args:
+            _id: Emploi ID
+            patch_model: Patch model, None fields are left untouched
+
+        Returns:
+            The updated emploi, or None when it does not exist or nothing changed
+        """
+        fields = TypedQuery.document(EmploiModel, patch_model.model_dump(exclude_none=True))
+        if not fields:
+            return None
+        result = await self.collection.find_one_and_update(
+            {"_id": ObjectId(_id), **Filters.changed_filter(fields)},
+            {"$set": fields},
+            return_document=ReturnDocument.AFTER
+        )
+        if not result:
+            return None
+        return EmploiModel.model_validate(result)
+
+    async def exists(self, _id: str) -> bool:
+        """Check if an emploi exists"""
+        result = await self.collection.find_one({"_id": ObjectId(_id)}, {"_id": 1})
+        return result is not None
+
+    async def delete_model(self, _id: str):
+        """Move an emploi to the archive"""
+        document = await Archive.delete_async(self.collection, ObjectId(_id))
+        return 0 if document is None else 1
+
+    async def restore_model(self, _id: str):
+        """
+        Restore an emploi from the archive
+
+        Args:
+            _id: Emploi ID
+
+        Returns:
+            The restored emploi, or None when the archive has no emploi with this id
+        """
+        document, _ = await Archive.restore_async(self.collection, _id, self._duplicate_error)
+        if not document:
+            return None
+        return EmploiModel.model_validate(document)
+
+    def purge(
+        self,
+        batch_size: int = PURGE_BATCH_SIZE,
+        max_per_second: float = PURGE_MAX_DELETES_PER_SECOND
+    ) -> Purge:
+        """
+        Purge of the emplois deleted more than RETENTION_DAYS_EMPLOIS ago, live and archived
+
+        `manage.py purge-deleted` runs it inline, `POST /emplois/purge` in the background.
+        """
+        return Purge(self.schema.schema_name, RETENTION_DAYS_EMPLOIS, batch_size, max_per_second)
+
+    async def patch_models(self, items: List[Any]):
+        """
+        Apply partial updates with one unordered bulk_write
+
+        Args:
+            items: Raw {id, patch} items, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        patches, errors = Bulk.validate_patches(items, EmploiPatchModel)
+        targets = [
+            (index, _id, TypedQuery.document(EmploiModel, patch.model_dump(exclude_none=True)))
+            for index, _id, patch in patches
+        ]
+        current = await self._current(targets)
+        operations = [
+            (index, UpdateOne({"_id": _id, **Filters.changed_filter(fields)}, {"$set": fields}))
+            for index, _id, fields in targets
+        ]
+        failed = await Bulk.write_async(self.collection, operations)
+        return errors + Bulk.write_results(targets, current, failed, self._duplicate_error)
+
+    async def delete_models(self, items: List[Any]):
+        """
+        Move emplois to the archive, `BULK_WRITE_CONCURRENCY` at a time
+
+        Args:
+            items: Raw emploi ids, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        ids, errors = Bulk.validate_ids(items)
+        targets = [(index, _id, None) for index, _id in ids]
+        results, _ = await Bulk.write_each_async(targets, self._delete_one)
+        return errors + results
+
+    async def _delete_one(self, _id: ObjectId, _fields: None):
+        """Move an emploi of a bulk delete to the archive, returning it as it was"""
+        return await Archive.delete_async(self.collection, _id)
+
+    async def _current(self, targets):
+        """Read the live emplois targeted by a bulk write, keyed by _id"""
+        if not targets:
+            return {}
+        cursor = self.collection.find(
+            {"_id": {"$in": [_id for _, _id, _ in targets]}},
+            Bulk.projection(targets)
+        )
+        return {document["_id"]: document async for document in cursor}
+
+    def _page_result(self, page, projection):
+        """Build the result of a page read with a projection"""
+        return EmploiModelResult(**page._replace(
+            results=Projection.validate(page.results, projection, EmploiModel, EmploiPartialModel)
+        )._asdict())
@@ -1,45 +1,88 @@
 from http import HTTPStatus
+from typing import Any, List
 from fastapi import APIRouter, Query, Path, Body, status
 from fastapi.responses import JSONResponse, Response
-from .service import EmploiService
+from .async_service import AsyncEmploiService
 from ...common.enums.response_type_enum import ResponseTypeEnum
 from ...common.exceptions.exception import EmploiException
+from ...common.helpers.bulk import Bulk
 from ...common.helpers.error_middleware import exception_handler
+from ...common.helpers.export import Export
 from ...common.helpers.filters import Filters
 from ...common.helpers.message_response_helper import MessageResponseHelper
+from ...config.settings import BULK_MAX_ITEMS
 from .messages import Messages
 from .model import EmploiModel, EmploiPatchModel
 
-service = EmploiService()
+service = AsyncEmploiService()
 router = APIRouter(prefix='/emplois', tags=['emplois'])
 
 
 @router.post('', status_code=status.HTTP_201_CREATED)
 @exception_handler
-def add(payload: EmploiModel):
+async def add(payload: EmploiModel):
     """Create a new emploi"""
-    inserted_model = service.add_model(payload)
+    inserted_model = await service.add_model(payload)
     return JSONResponse(
         content=inserted_model.model_dump(exclude_none=True, mode='json'),
         status_code=HTTPStatus.CREATED
     )
 
 
+@router.post('/bulk', status_code=status.HTTP_201_CREATED)
+@exception_handler
+async def add_bulk(payload: List[Any] = Body(...)):
+    """Create emplois in bulk, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise EmploiException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.add_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.CREATED)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.patch('/bulk')
+@exception_handler
+async def patch_bulk(payload: List[Any] = Body(...)):
+    """Partially update emplois in bulk from {id, patch} items, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise EmploiException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.patch_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.delete('/bulk')
+@exception_handler
+async def delete_bulk(payload: List[Any] = Body(...)):
+    """Move emplois to the archive in bulk from a list of ids, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise EmploiException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.delete_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
 @router.get('')
 @exception_handler
-def get_all_with_criteria(
+async def get_all_with_criteria(
     userId: str = Query(None),
     entrepriseId: str = Query(None),
     role: str = Query(None),
     status: str = Query(None),
     email: str = Query(None),
-    skip: int = Query(0),
-    limit: int = Query(100)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: str = Query(None),
+    includeTotal: str = Query(Filters.TOTAL_EXACT),
+    fields: str = Query(None)
 ):
     """Get all emplois with filtering and pagination"""
     # If both userId and entrepriseId are provided, get specific emploi
     if userId and entrepriseId:
-        model = service.get_by_user_and_entreprise(userId, entrepriseId)
+        model = await service.get_by_user_and_entreprise(userId, entrepriseId, Filters.parse_fields(fields))
         if model:
             return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
         else:
@@ -48,21 +91,66 @@ def get_all_with_criteria(
                 Messages.ERROR_NOT_FOUND)
             return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
     
-    criteria = Filters(role=role, status=status, email=email, skip=skip, limit=limit)
-    models = service.get_all_models(filters=criteria)
+    criteria = Filters(
+        role=role, status=status, email=email, skip=skip, limit=limit,
+        cursor=cursor, include_total=includeTotal, fields=fields
+    )
+    models = await service.get_all_models(filters=criteria)
     return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
 
 
+@router.get('/export')
+@exception_handler
+async def export(
+    userId: str = Query(None),
+    entrepriseId: str = Query(None),
+    role: str = Query(None),
+    status: str = Query(None),
+    email: str = Query(None),
+    format: str = Query(Export.NDJSON),
+    fields: str = Query(None)
+):
+    """Stream the emplois matching the filters as NDJSON or CSV"""
+    export_format = Export.check_format(format)
+    criteria = Filters(role=role, status=status, email=email, fields=fields)
+    projection, models = await service.export_models(criteria, user_id=userId, entreprise_id=entrepriseId)
+    return Export.response(models, export_format, Export.columns(projection, EmploiModel), 'emplois')
+
+
+@router.get('/purge')
+@exception_handler
+async def purge_progress():
+    """Progress of the purge of the emplois deleted for longer than their retention period"""
+    return JSONResponse(content=await service.purge().progress_async())
+
+
+@router.post('/purge')
+@exception_handler
+async def purge(dryRun: bool = Query(False)):
+    """Hard delete the emplois deleted for longer than their retention period, in the background"""
+    purge_run = service.purge()
+    if dryRun:
+        return JSONResponse(content=await purge_run.count_async())
+
+    if not await purge_run.start():
+        message_response = MessageResponseHelper.build(
+            ResponseTypeEnum.ERROR,
+            Messages.PURGE_RUNNING
+        )
+        return JSONResponse(content=message_response, status_code=HTTPStatus.CONFLICT)
+    return JSONResponse(content=await purge_run.progress_async(), status_code=HTTPStatus.ACCEPTED)
+
+
 @router.get('/{_id}')
 @exception_handler
-def get_by_id(_id: str = Path(...)):
+async def get_by_id(_id: str = Path(...), fields: str = Query(None)):
     """Get emploi by ID"""
     if not _id:
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.ERROR,
             Messages.REQUIRED_ID)
         return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
-    model = service.get_model(_id)
+    model = await service.get_model(_id, Filters.parse_fields(fields))
     if model:
         return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
     else:
@@ -74,43 +162,39 @@ def get_by_id(_id: str = Path(...)):
 
 @router.patch('/{_id}')
 @exception_handler
-def patch(_id: str = Path(...), emploi_patch_model: EmploiPatchModel = Body(...)):
+async def patch(_id: str = Path(...), emploi_patch_model: EmploiPatchModel = Body(...)):
     """Partially update an emploi"""
     if not _id:
         raise EmploiException(Messages.REQUIRED_ID)
     
-    existing_emploi = service.get_model(_id)
-    if not existing_emploi:
-        message_response = MessageResponseHelper.build(
-            ResponseTypeEnum.ERROR,
-            Messages.ERROR_NOT_FOUND
-        )
-        return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
-    
     if not any(emploi_patch_model.model_dump(exclude_none=True).keys()):
         emploi_patch_model_keys = list(emploi_patch_model.model_fields.keys())
         message = Messages.UNAUTHORIZED_FIELDS.format(allowed_fields=emploi_patch_model_keys)
         raise EmploiException(message)
-    
-    if not service.check_changes(existing_emploi, emploi_patch_model):
+
+    # One round trip, matching only when a field changes
+    patched_model = await service.patch_model(_id, emploi_patch_model)
+    if patched_model:
+        return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
+
+    if await service.exists(_id):
         return Response(content="", status_code=HTTPStatus.NO_CONTENT)
-    
-    # Update fields
-    service.update_position(_id, emploi_patch_model.position)
-    
-    patched_model = service.get_model(_id)
-    
-    return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
+
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
 
 
 @router.delete('/{_id}')
 @exception_handler
-def delete_by_id(_id: str = Path(...)):
-    """Delete an emploi (soft delete)"""
+async def delete_by_id(_id: str = Path(...)):
+    """Delete an emploi, moving it to the archive"""
     if not _id:
         raise EmploiException(Messages.REQUIRED_ID)
     
-    if service.delete_model(_id):
+    if await service.delete_model(_id):
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.SUCCESS,
             Messages.SUCCESS_DELETED
@@ -123,3 +207,21 @@ def delete_by_id(_id: str = Path(...)):
         )
         status_code = HTTPStatus.NOT_FOUND
     return JSONResponse(content=message_response, status_code=status_code)
+
+
+@router.post('/{_id}/restore')
+@exception_handler
+async def restore(_id: str = Path(...)):
+    """Restore a deleted emploi from the archive"""
+    if not _id:
+        raise EmploiException(Messages.REQUIRED_ID)
+
+    restored_model = await service.restore_model(_id)
+    if restored_model:
+        return JSONResponse(content=restored_model.model_dump(exclude_none=True, mode='json'))
+
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
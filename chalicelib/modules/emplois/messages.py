@@ -12,10 +12,12 @@ class Messages:
     # Error messages
     ERROR_NOT_FOUND = "Emploi not found"
     REQUIRED_ID = "Emploi ID is required"
+    PURGE_RUNNING = "A purge of the deleted emplois is already running"
     REQUIRED_USER_ID = "User ID is required"
     REQUIRED_ENTREPRISE_ID = "Entreprise ID is required"
     REQUIRED_POSITION = "Position is required"
     UNAUTHORIZED_FIELDS = "Only the following fields can be updated: {allowed_fields}"
+    BULK_SIZE = "Bulk requests take between 1 and {max_items} items"
     
     # Validation messages
     EMPLOI_EXISTS = "This user already has an emploi at this entreprise"
@@ -2,7 +2,7 @@
 
 from datetime import datetime, timezone
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional
+from typing import Optional, Union
 from ...common.types.type import ObjectIdStr
 
 
@@ -43,9 +43,23 @@ class EmploiPatchModel(BaseModel, metaclass=MetaModel):
     position: Optional[str] = None
 
 
+class EmploiPartialModel(BaseModel, metaclass=MetaModel):
+    """Emploi model of a document read with a projection, every field is optional"""
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
+    userId: Optional[ObjectIdStr] = None
+    entrepriseId: Optional[ObjectIdStr] = None
+    position: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    deletedAt: Optional[datetime] = None
+
+
 class EmploiModelResult(BaseModel, metaclass=MetaModel):
     """Emploi result model with pagination"""
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
     
-    total: int
-    results: list[EmploiModel]
+    total: Optional[int] = None
+    totalExact: bool = True
+    results: list[Union[EmploiModel, EmploiPartialModel]]
+    nextCursor: Optional[str] = None
@@ -1,17 +1,33 @@
 """Emploi schema definitions for validation"""
 
-from datetime import datetime, timezone
-from bson import CodecOptions
+from datetime import datetime
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from pymongoose import methods
 from pymongoose.mongo_types import Types, Schema
 from .model import EmploiModel
-from ...config.mongodb import mongo_client
-
-methods.database = mongo_client
+from ...common.helpers.archive import Archive
+from ...config.mongodb import mongodb
 
 
 class EmploiSchema(Schema):
     schema_name = "Emploi"
+    # Indexes backing Filters.apply() and the list sort; deleted documents are in the archive.
+    # The unique index enforces one emploi per (user, entreprise).
+    indexes = [
+        IndexModel(
+            [(EmploiModel.createdAt, DESCENDING), ("_id", DESCENDING)],
+            name="createdAt",
+        ),
+        IndexModel(
+            [(EmploiModel.userId, ASCENDING), (EmploiModel.entrepriseId, ASCENDING)],
+            name="userId_entrepriseId",
+            unique=True,
+        ),
+        # Legacy documents deleted in place, before deletes moved them, for `manage.py archive-deleted`
+        Archive.index,
+    ]
+    # Default projection of list reads, leaving out deletedAt
+    list_projection = {EmploiModel.deletedAt: 0}
 
     def __init__(self, **kwargs):
         self.schema = {
@@ -42,10 +58,16 @@ class EmploiSchema(Schema):
             },
         }
         super().__init__(self.schema_name, self.schema, kwargs)
-        self.native_collection = methods.database.get_collection(
-            self.schema_name,
-            codec_options=CodecOptions(tz_aware=True, tzinfo=timezone.utc)
-        )
+
+    @property
+    def native_collection(self):
+        """Blocking collection, resolved on the current client"""
+        return mongodb.get_collection(self.schema_name)
+
+    @property
+    def async_collection(self):
+        """Asyncio collection, resolved on the current client"""
+        return mongodb.get_async_collection(self.schema_name)
 
 
 emploi_schema = EmploiSchema()
@@ -1,114 +1,245 @@
-"""Emploi service layer for business logic"""
+"""Emploi service layer for `manage.py` and scripts, on the blocking client"""
 
-from typing import Any
-from datetime import datetime
+from typing import Any, List, Optional
+from datetime import datetime, timezone
 from bson import ObjectId
 from pydantic import BaseModel
-from pymongoose import methods
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from ...common.helpers.archive import Archive
+from ...common.helpers.bulk import Bulk
 from ...common.helpers.filters import Filters
-from .model import EmploiModel, EmploiModelResult
-from .schema import emploi_schema, EmploiSchema
+from ...common.helpers.pagination import Pagination
+from ...common.helpers.projection import Projection
+from ...common.helpers.purge import Purge
+from ...common.helpers.typed_query import TypedQuery
+from ...config.settings import (
+    EXPORT_BATCH_SIZE, PURGE_BATCH_SIZE, PURGE_MAX_DELETES_PER_SECOND, RETENTION_DAYS_EMPLOIS
+)
+from .model import EmploiModel, EmploiPartialModel, EmploiPatchModel, EmploiModelResult
+from .schema import emploi_schema
 from ...common.exceptions.exception import EmploiAlreadyExistsException
 
 
 class EmploiService:
     """Service class for emploi operations"""
-    
+
     def __init__(self):
         self.schema = emploi_schema
-        self.collection = emploi_schema.native_collection
-    
+
+    @property
+    def collection(self):
+        """Collection of the schema on the current client"""
+        return self.schema.native_collection
+
     def get_all_models(self, filters: Filters):
         """Get all emplois with filtering and pagination"""
         query = filters.apply()
-        total_count = self.collection.count_documents(query)
-        cursor = self.collection.find(
-            query,
-            limit=filters.limit,
-            skip=filters.skip,
-            sort={EmploiModel.createdAt: -1}
-        )
-        return EmploiModelResult(total=total_count, results=list(cursor))
-    
-    def get_model(self, _id: str):
+        projection = Projection.build(filters.fields, EmploiModel, self.schema.list_projection, EmploiModel.createdAt)
+        page = Pagination.find_page(self.collection, query, filters, EmploiModel.createdAt, projection)
+        return self._page_result(page, projection)
+
+    def export_models(self, filters: Filters, user_id: Optional[str] = None, entreprise_id: Optional[str] = None):
+        """
+        Read emplois for an export, with a batched cursor instead of pages
+
+        Args:
+            filters: Filters of the list, `fields` selects the exported fields
+            user_id: Only export the emplois of this user
+            entreprise_id: Only export the emplois of this entreprise
+
+        Returns:
+            Tuple of (projection of the read, iterator of emplois)
+        """
+        query = filters.apply()
+        if user_id:
+            query[EmploiModel.userId] = user_id
+        if entreprise_id:
+            query[EmploiModel.entrepriseId] = entreprise_id
+        query = TypedQuery.compile(EmploiModel, query)
+        projection = Projection.build(filters.fields, EmploiModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection).sort(
+            {EmploiModel.createdAt: -1}
+        ).batch_size(EXPORT_BATCH_SIZE)
+        model = Projection.model(projection, EmploiModel, EmploiPartialModel)
+        return projection, (model.model_validate(document) for document in cursor)
+
+    def get_model(self, _id: str, fields: Optional[List[str]] = None):
         """Get emploi by ID"""
-        result = self.collection.find_one({"_id": ObjectId(_id), "deletedAt": None})
+        projection = Projection.build(fields, EmploiModel)
+        result = self.collection.find_one({"_id": ObjectId(_id)}, projection)
         if not result:
             return None
-        return EmploiModel.model_validate(result)
-    
-    def get_by_user_and_entreprise(self, user_id: str, entreprise_id: str):
+        return Projection.model(projection, EmploiModel, EmploiPartialModel).model_validate(result)
+
+    def get_by_user_and_entreprise(self, user_id: str, entreprise_id: str, fields: Optional[List[str]] = None):
         """Get emploi by user ID and entreprise ID"""
-        result = self.collection.find_one({
-            "userId": user_id,
-            "entrepriseId": entreprise_id,
-            "deletedAt": None
-        })
+        projection = Projection.build(fields, EmploiModel)
+        result = self.collection.find_one(TypedQuery.compile(EmploiModel, {
+            EmploiModel.userId: user_id,
+            EmploiModel.entrepriseId: entreprise_id
+        }), projection)
         if not result:
             return None
-        return EmploiModel.model_validate(result)
-    
+        return Projection.model(projection, EmploiModel, EmploiPartialModel).model_validate(result)
+
     def add_model(self, model: EmploiModel):
         """Create a new emploi"""
-        # Check if user already has an emploi at this entreprise
-        existing_emploi = self._get_existing_emploi(model)
-        if existing_emploi:
-            raise EmploiAlreadyExistsException("This user already has an emploi at this entreprise")
-        
-        # Serialize the model
-        serialized_data = model.model_dump(exclude_none=True)
-        
+        serialized_data = self._serialize_new(model)
+
+        # Insert into MongoDB collection, the unique index rejects duplicates
+        try:
+            result = self.collection.insert_one(serialized_data)
+        except DuplicateKeyError:
+            raise self._duplicate_error(serialized_data)
+
+        # Build the created object from the inserted data instead of reading it back
+        return EmploiModel.model_validate({**serialized_data, "_id": result.inserted_id})
+
+    def add_models(self, items: List[Any]):
+        """
+        Create emplois with one unordered insert_many
+
+        Args:
+            items: Raw items, validated one by one
+
+        Returns:
+            One result per item, with the new id or the error
+        """
+        models, errors = Bulk.validate(items, EmploiModel)
+        documents = [(index, self._serialize_new(model)) for index, model in models]
+        return errors + Bulk.insert_many(self.collection, documents, self._duplicate_error)
+
+    def _serialize_new(self, model: EmploiModel) -> dict:
+        """Serialize a new emploi with its creation metadata"""
+        serialized_data = TypedQuery.document(EmploiModel, model.model_dump(exclude_none=True))
+
         # Add creation metadata
-        serialized_data[EmploiModel.createdAt] = datetime.utcnow()
-        
-        # Insert into MongoDB collection
-        inserted_id = methods.insert_one(EmploiSchema.schema_name, serialized_data)
-        
-        # Return the complete object after insertion
-        return self.get_model(inserted_id)
-    
-    def _get_existing_emploi(self, model: EmploiModel):
-        """Check if emploi already exists for user and entreprise"""
-        return self.collection.find_one({
-            EmploiModel.userId: model.userId,
-            EmploiModel.entrepriseId: model.entrepriseId,
-            "deletedAt": None
-        })
-
-    def update_position(self, _id: str, position: str):
-        """Update emploi's position"""
-        if position is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id, "deletedAt": None},
-            {"$set": {EmploiModel.position: position}}
+        serialized_data[EmploiModel.createdAt] = datetime.now(timezone.utc)
+
+        return serialized_data
+
+    def _duplicate_error(self, document: dict) -> Exception:
+        """Exception reported when the unique index rejects an emploi"""
+        return EmploiAlreadyExistsException("This user already has an emploi at this entreprise")
+
+    def patch_model(self, _id: str, patch_model: BaseModel):
+        """
+        Apply a partial update in one round trip
+
+        The filter only matches when a field differs, so the "no changes" check is
+        done by the database and an unchanged emploi is not written.
+
+        Args:
+            _id: Emploi ID
+            patch_model: Patch model, None fields are left untouched
+
+        Returns:
+            The updated emploi, or None when it does not exist or nothing changed
+        """
+        fields = TypedQuery.document(EmploiModel, patch_model.model_dump(exclude_none=True))
+        if not fields:
+            return None
+        result = self.collection.find_one_and_update(
+            {"_id": ObjectId(_id), **Filters.changed_filter(fields)},
+            {"$set": fields},
+            return_document=ReturnDocument.AFTER
         )
+        if not result:
+            return None
+        return EmploiModel.model_validate(result)
+
+    def exists(self, _id: str) -> bool:
+        """Check if an emploi exists"""
+        result = self.collection.find_one({"_id": ObjectId(_id)}, {"_id": 1})
+        return result is not None
 
     def delete_model(self, _id: str):
-        """Soft delete an emploi"""
-        obj_id = ObjectId(_id)
-        result = self.schema.update(
-            {"_id": obj_id, "deletedAt": None},
-            {"$set": {"deletedAt": datetime.utcnow()}}
+        """Move an emploi to the archive"""
+        document = Archive.delete(self.collection, ObjectId(_id))
+        return 0 if document is None else 1
+
+    def restore_model(self, _id: str):
+        """
+        Restore an emploi from the archive
+
+        Args:
+            _id: Emploi ID
+
+        Returns:
+            The restored emploi, or None when the archive has no emploi with this id
+        """
+        document, _ = Archive.restore(self.collection, _id, self._duplicate_error)
+        if not document:
+            return None
+        return EmploiModel.model_validate(document)
+
+    def purge(
+        self,
+        batch_size: int = PURGE_BATCH_SIZE,
+        max_per_second: float = PURGE_MAX_DELETES_PER_SECOND
+    ) -> Purge:
+        """
+        Purge of the emplois deleted more than RETENTION_DAYS_EMPLOIS ago, live and archived
+
+        `manage.py purge-deleted` runs it inline, `POST /emplois/purge` in the background.
+        """
+        return Purge(self.schema.schema_name, RETENTION_DAYS_EMPLOIS, batch_size, max_per_second)
+
+    def patch_models(self, items: List[Any]):
+        """
+        Apply partial updates with one unordered bulk_write
+
+        Args:
+            items: Raw {id, patch} items, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        patches, errors = Bulk.validate_patches(items, EmploiPatchModel)
+        targets = [
+            (index, _id, TypedQuery.document(EmploiModel, patch.model_dump(exclude_none=True)))
+            for index, _id, patch in patches
+        ]
+        current = self._current(targets)
+        operations = [
+            (index, UpdateOne({"_id": _id, **Filters.changed_filter(fields)}, {"$set": fields}))
+            for index, _id, fields in targets
+        ]
+        failed = Bulk.write(self.collection, operations)
+        return errors + Bulk.write_results(targets, current, failed, self._duplicate_error)
+
+    def delete_models(self, items: List[Any]):
+        """
+        Move emplois to the archive, `BULK_WRITE_CONCURRENCY` at a time
+
+        Args:
+            items: Raw emploi ids, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        ids, errors = Bulk.validate_ids(items)
+        targets = [(index, _id, None) for index, _id in ids]
+        results, _ = Bulk.write_each(targets, self._delete_one)
+        return errors + results
+
+    def _delete_one(self, _id: ObjectId, _fields: None):
+        """Move an emploi of a bulk delete to the archive, returning it as it was"""
+        return Archive.delete(self.collection, _id)
+
+    def _current(self, targets):
+        """Read the live emplois targeted by a bulk write, keyed by _id"""
+        if not targets:
+            return {}
+        cursor = self.collection.find(
+            {"_id": {"$in": [_id for _, _id, _ in targets]}},
+            Bulk.projection(targets)
         )
-        return result.modified_count
-
-    def check_changes(self, existing_emploi_model: BaseModel, emploi_patch_model: BaseModel) -> bool:
-        """Check if there are any changes between existing and patch models"""
-        for field in emploi_patch_model.model_fields_set:
-            new_val = getattr(emploi_patch_model, field)
-            old_val = getattr(existing_emploi_model, field, None)
-            if self._to_plain(new_val) != self._to_plain(old_val):
-                return True
-        return False
-
-    def _to_plain(self, value: Any) -> Any:
-        """Convert value to plain representation for comparison"""
-        if isinstance(value, BaseModel):
-            return value.model_dump(exclude_none=True)
-        if isinstance(value, dict):
-            return {k: self._to_plain(v) for k, v in value.items()}
-        if isinstance(value, (list, tuple)):
-            return [self._to_plain(v) for v in value]
-        return value
+        return {document["_id"]: document for document in cursor}
+
+    def _page_result(self, page, projection):
+        """Build the result of a page read with a projection"""
+        return EmploiModelResult(**page._replace(
+            results=Projection.validate(page.results, projection, EmploiModel, EmploiPartialModel)
+        )._asdict())
@@ -0,0 +1,292 @@
+"""Entreprise async service layer used by the route handlers and `manage.py`"""
+
+from typing import Any, List, Optional
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pydantic import BaseModel
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from ...common.helpers.bulk import Bulk
+from ...common.helpers.cache import TTLCache
+from ...common.helpers.counters import Counters
+from ...common.helpers.filters import Filters
+from ...common.helpers.gazetteer import Gazetteer
+from ...common.helpers.pagination import Pagination
+from ...common.helpers.projection import Projection
+from ...common.helpers.typed_query import TypedQuery
+from ...config.settings import EXPORT_BATCH_SIZE, STATS_CACHE_TTL
+from .model import EntrepriseModel, EntreprisePartialModel, EntreprisePatchModel, EntrepriseStatsModel, EntrepriseModelResult
+from .schema import entreprise_schema
+from ..jobs.model import OPEN_STATUS, JobModel
+from ..jobs.schema import job_schema
+from ...common.exceptions.exception import EntrepriseAlreadyExistsException
+
+
+class AsyncEntrepriseService:
+    """Async service class for entreprise operations"""
+
+    # Longest period of the applications per day
+    STATS_MAX_DAYS = 365
+    # Stats by (entreprise, days), shared by the requests of the process
+    stats_cache = TTLCache(STATS_CACHE_TTL)
+
+    def __init__(self):
+        self.schema = entreprise_schema
+
+    @property
+    def collection(self):
+        """Collection of the schema on the current client"""
+        return self.schema.async_collection
+
+    async def get_all_models(self, filters: Filters):
+        """Get all entreprises with filtering and pagination"""
+        query = filters.apply()
+        projection = Projection.build(filters.fields, EntrepriseModel, self.schema.list_projection, EntrepriseModel.createdAt)
+        page = await Pagination.find_page_async(self.collection, query, filters, EntrepriseModel.createdAt, projection)
+        return self._page_result(page, projection)
+
+    async def export_models(self, filters: Filters):
+        """
+        Read entreprises for an export, with a batched cursor instead of pages
+
+        Args:
+            filters: Filters of the list, `fields` selects the exported fields
+
+        Returns:
+            Tuple of (projection of the read, async iterator of entreprises)
+        """
+        query = filters.apply()
+        projection = Projection.build(filters.fields, EntrepriseModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection).sort(
+            {EntrepriseModel.createdAt: -1}
+        ).batch_size(EXPORT_BATCH_SIZE)
+        model = Projection.model(projection, EntrepriseModel, EntreprisePartialModel)
+        return projection, (model.model_validate(document) async for document in cursor)
+
+    async def get_model(self, _id: str, fields: Optional[List[str]] = None):
+        """Get entreprise by ID"""
+        projection = Projection.build(fields, EntrepriseModel)
+        result = await self.collection.find_one({"_id": ObjectId(_id)}, projection)
+        if not result:
+            return None
+        return Projection.model(projection, EntrepriseModel, EntreprisePartialModel).model_validate(result)
+
+    async def get_stats(self, _id: str, days: int = 30):
+        """
+        Get the recruiting stats of an entreprise, cached for STATS_CACHE_TTL seconds
+
+        Args:
+            _id: Entreprise ID
+            days: Number of days of applications per day, today included
+
+        Returns:
+            The stats, or None when the entreprise does not exist
+        """
+        if not 1 <= days <= self.STATS_MAX_DAYS:
+            raise ValueError(f"days must be between 1 and {self.STATS_MAX_DAYS}")
+        key = (_id, days)
+        stats = self.stats_cache.get(key)
+        if stats is not None:
+            return stats
+        if not await self.exists(_id):
+            return None
+
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        since = today - timedelta(days=days - 1)
+        pipeline = job_schema.entreprise_stats_pipeline(_id, since)
+        aggregation = await job_schema.async_collection.aggregate(pipeline)
+        facets = await aggregation.to_list(1)
+        stats = self._stats_result(_id, days, since, facets[0] if facets else {})
+        self.stats_cache.set(key, stats)
+        return stats
+
+    def _stats_result(self, _id: str, days: int, since: datetime, facet: dict) -> EntrepriseStatsModel:
+        """Build the stats from the `$facet` document, with a zero for days without applications"""
+        counts = {
+            name: {group["_id"]: group["count"] for group in facet.get(name, []) if group["_id"] is not None}
+            for name in ("jobsByStatus", "jobsByContractType", "applicationsByStatus", "applicationsPerDay")
+        }
+        dates = [(since + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(days)]
+        return EntrepriseStatsModel(
+            entrepriseId=_id,
+            days=days,
+            jobsByStatus=counts["jobsByStatus"],
+            jobsByContractType=counts["jobsByContractType"],
+            applicationsByStatus=counts["applicationsByStatus"],
+            applicationsPerDay=[{"date": date, "count": counts["applicationsPerDay"].get(date, 0)} for date in dates],
+            generatedAt=datetime.now(timezone.utc),
+        )
+
+    async def get_by_name(self, name: str, fields: Optional[List[str]] = None):
+        """Get entreprise by name"""
+        projection = Projection.build(fields, EntrepriseModel)
+        result = await self.collection.find_one({"name": name}, projection)
+        if not result:
+            return None
+        return Projection.model(projection, EntrepriseModel, EntreprisePartialModel).model_validate(result)
+
+    async def add_model(self, model: EntrepriseModel):
+        """Create a new entreprise"""
+        serialized_data = self._serialize_new(model)
+
+        # Insert into MongoDB collection, the unique index rejects duplicates
+        try:
+            result = await self.collection.insert_one(serialized_data)
+        except DuplicateKeyError:
+            raise self._duplicate_error(serialized_data)
+
+        # Build the created object from the inserted data instead of reading it back
+        return EntrepriseModel.model_validate({**serialized_data, "_id": result.inserted_id})
+
+    async def add_models(self, items: List[Any]):
+        """
+        Create entreprises with one unordered insert_many
+
+        Args:
+            items: Raw items, validated one by one
+
+        Returns:
+            One result per item, with the new id or the error
+        """
+        models, errors = Bulk.validate(items, EntrepriseModel)
+        documents = [(index, self._serialize_new(model)) for index, model in models]
+        return errors + await Bulk.insert_many_async(self.collection, documents, self._duplicate_error)
+
+    def _serialize_new(self, model: EntrepriseModel) -> dict:
+        """Serialize a new entreprise with its creation metadata"""
+        serialized_data = TypedQuery.document(EntrepriseModel, model.model_dump(exclude_none=True))
+
+        # Geocoded with the bundled gazetteer, None when the location names no known place
+        self.schema.derive(serialized_data)
+
+        # Add creation metadata
+        serialized_data[EntrepriseModel.createdAt] = datetime.now(timezone.utc)
+
+        # The counter starts empty and only follows job writes
+        serialized_data[EntrepriseModel.openJobCount] = 0
+
+        return serialized_data
+
+    def _patch_fields(self, patch_model: BaseModel) -> dict:
+        """Serialize the fields set by a patch, a changed location is geocoded again"""
+        fields = TypedQuery.document(EntrepriseModel, patch_model.model_dump(exclude_none=True))
+        return Gazetteer.document(fields, EntrepriseModel.location, self.schema.LOCATION_POINT)
+
+    def _duplicate_error(self, document: dict) -> Exception:
+        """Exception reported when the unique index rejects an entreprise"""
+        return EntrepriseAlreadyExistsException(document[EntrepriseModel.name])
+
+    async def patch_model(self, _id: str, patch_model: BaseModel):
+        """
+        Apply a partial update in one round trip
+
+        The filter only matches when a field differs, so the "no changes" check is
+        done by the database and an unchanged entreprise is not written.
+
+        Args:
+            _id: Entreprise ID
+            patch_model: Patch model, None fields are left untouched
+
+        Returns:
+            The updated entreprise, or None when it does not exist or nothing changed
+        """
+        fields = self._patch_fields(patch_model)
+        if not fields:
+            return None
+        try:
+            result = await self.collection.find_one_and_update(
+                {"_id": ObjectId(_id), **Filters.changed_filter(fields)},
+                {"$set": fields},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            raise EntrepriseAlreadyExistsException(fields[EntrepriseModel.name])
+        if not result:
+            return None
+        return EntrepriseModel.model_validate(result)
+
+    async def exists(self, _id: str) -> bool:
+        """Check if an entreprise exists"""
+        result = await self.collection.find_one({"_id": ObjectId(_id)}, {"_id": 1})
+        return result is not None
+
+    async def delete_model(self, _id: str):
+        """Hard delete an entreprise"""
+        obj_id = ObjectId(_id)
+        result = await self.collection.delete_one({"_id": obj_id})
+        return result.deleted_count
+
+    async def patch_models(self, items: List[Any]):
+        """
+        Apply partial updates with one unordered bulk_write
+
+        Args:
+            items: Raw {id, patch} items, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        patches, errors = Bulk.validate_patches(items, EntreprisePatchModel)
+        targets = [(index, _id, self._patch_fields(patch)) for index, _id, patch in patches]
+        current = await self._current(targets)
+        operations = [
+            (index, UpdateOne({"_id": _id, **Filters.changed_filter(fields)}, {"$set": fields}))
+            for index, _id, fields in targets
+        ]
+        failed = await Bulk.write_async(self.collection, operations)
+        return errors + Bulk.write_results(targets, current, failed, self._duplicate_error)
+
+    async def delete_models(self, items: List[Any]):
+        """
+        Hard delete entreprises with one unordered bulk_write
+
+        Args:
+            items: Raw entreprise ids, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        ids, errors = Bulk.validate_ids(items)
+        targets = [(index, _id, None) for index, _id in ids]
+        current = await self._current(targets)
+        operations = [(index, DeleteOne({"_id": _id})) for index, _id, _ in targets]
+        failed = await Bulk.write_async(self.collection, operations)
+        return errors + Bulk.write_results(targets, current, failed)
+
+    async def _current(self, targets):
+        """Read the live entreprises targeted by a bulk write, keyed by _id"""
+        if not targets:
+            return {}
+        cursor = self.collection.find(
+            {"_id": {"$in": [_id for _, _id, _ in targets]}},
+            Bulk.projection(targets)
+        )
+        return {document["_id"]: document async for document in cursor}
+
+    async def reconcile_counters(self, batch_size: int = 500, dry_run: bool = False):
+        """Recompute the open job counter of every entreprise, rewriting the drifted ones"""
+        fields = [EntrepriseModel.openJobCount]
+        return await Counters.reconcile_async(self.collection, fields, self._recount, batch_size, dry_run)
+
+    async def _recount(self, entreprise_ids: List[ObjectId]) -> dict:
+        """Open job counters of entreprises, grouped from their published jobs"""
+        counts = {entreprise_id: 0 for entreprise_id in entreprise_ids}
+        aggregation = await job_schema.async_collection.aggregate([
+            {"$match": {
+                JobModel.entrepriseId: {"$in": entreprise_ids},
+                JobModel.status: OPEN_STATUS,
+            }},
+            {"$group": {"_id": f"${JobModel.entrepriseId}", "count": {"$sum": 1}}},
+        ])
+        async for group in aggregation:
+            counts[group["_id"]] = group["count"]
+        return {
+            entreprise_id: {EntrepriseModel.openJobCount: count}
+            for entreprise_id, count in counts.items()
+        }
+
+    def _page_result(self, page, projection):
+        """Build the result of a page read with a projection"""
+        return EntrepriseModelResult(**page._replace(
+            results=Projection.validate(page.results, projection, EntrepriseModel, EntreprisePartialModel)
+        )._asdict())
@@ -1,44 +1,87 @@
 from http import HTTPStatus
+from typing import Any, List
 from fastapi import APIRouter, Query, Path, Body, status
 from fastapi.responses import JSONResponse, Response
-from .service import EntrepriseService
+from .async_service import AsyncEntrepriseService
 from ...common.enums.response_type_enum import ResponseTypeEnum
 from ...common.exceptions.exception import EntrepriseException
+from ...common.helpers.bulk import Bulk
 from ...common.helpers.error_middleware import exception_handler
+from ...common.helpers.export import Export
 from ...common.helpers.filters import Filters
 from ...common.helpers.message_response_helper import MessageResponseHelper
+from ...config.settings import BULK_MAX_ITEMS
 from .messages import Messages
 from .model import EntrepriseModel, EntreprisePatchModel
 
-service = EntrepriseService()
+service = AsyncEntrepriseService()
 router = APIRouter(prefix='/entreprises', tags=['entreprises'])
 
 
 @router.post('', status_code=status.HTTP_201_CREATED)
 @exception_handler
-def add(payload: EntrepriseModel):
+async def add(payload: EntrepriseModel):
     """Create a new entreprise"""
-    inserted_model = service.add_model(payload)
+    inserted_model = await service.add_model(payload)
     return JSONResponse(
         content=inserted_model.model_dump(exclude_none=True, mode='json'),
         status_code=HTTPStatus.CREATED
     )
 
 
+@router.post('/bulk', status_code=status.HTTP_201_CREATED)
+@exception_handler
+async def add_bulk(payload: List[Any] = Body(...)):
+    """Create entreprises in bulk, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise EntrepriseException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.add_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.CREATED)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.patch('/bulk')
+@exception_handler
+async def patch_bulk(payload: List[Any] = Body(...)):
+    """Partially update entreprises in bulk from {id, patch} items, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise EntrepriseException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.patch_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.delete('/bulk')
+@exception_handler
+async def delete_bulk(payload: List[Any] = Body(...)):
+    """Delete entreprises in bulk from a list of ids, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise EntrepriseException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.delete_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
 @router.get('')
 @exception_handler
-def get_all_with_criteria(
+async def get_all_with_criteria(
     name: str = Query(None),
     role: str = Query(None),
     status: str = Query(None),
     email: str = Query(None),
-    skip: int = Query(0),
-    limit: int = Query(100)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: str = Query(None),
+    includeTotal: str = Query(Filters.TOTAL_EXACT),
+    fields: str = Query(None)
 ):
     """Get all entreprises with filtering and pagination"""
     # If name is provided, get specific entreprise
     if name:
-        model = service.get_by_name(name)
+        model = await service.get_by_name(name, Filters.parse_fields(fields))
         if model:
             return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
         else:
@@ -47,21 +90,40 @@ def get_all_with_criteria(
                 Messages.ERROR_NOT_FOUND)
             return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
     
-    criteria = Filters(role=role, status=status, email=email, skip=skip, limit=limit)
-    models = service.get_all_models(filters=criteria)
+    criteria = Filters(
+        role=role, status=status, email=email, skip=skip, limit=limit,
+        cursor=cursor, include_total=includeTotal, fields=fields
+    )
+    models = await service.get_all_models(filters=criteria)
     return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
 
 
+@router.get('/export')
+@exception_handler
+async def export(
+    role: str = Query(None),
+    status: str = Query(None),
+    email: str = Query(None),
+    format: str = Query(Export.NDJSON),
+    fields: str = Query(None)
+):
+    """Stream the entreprises matching the filters as NDJSON or CSV"""
+    export_format = Export.check_format(format)
+    criteria = Filters(role=role, status=status, email=email, fields=fields)
+    projection, models = await service.export_models(criteria)
+    return Export.response(models, export_format, Export.columns(projection, EntrepriseModel), 'entreprises')
+
+
 @router.get('/{_id}')
 @exception_handler
-def get_by_id(_id: str = Path(...)):
+async def get_by_id(_id: str = Path(...), fields: str = Query(None)):
     """Get entreprise by ID"""
     if not _id:
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.ERROR,
             Messages.REQUIRED_ID)
         return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
-    model = service.get_model(_id)
+    model = await service.get_model(_id, Filters.parse_fields(fields))
     if model:
         return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
     else:
@@ -71,49 +133,55 @@ def get_by_id(_id: str = Path(...)):
         return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
 
 
+@router.get('/{_id}/stats')
+@exception_handler
+async def get_stats(_id: str = Path(...), days: int = Query(30)):
+    """Get the recruiting stats of an entreprise: jobs, applications and applications per day"""
+    stats = await service.get_stats(_id, days)
+    if stats:
+        return JSONResponse(content=stats.model_dump(mode='json'))
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
+
+
 @router.patch('/{_id}')
 @exception_handler
-def patch(_id: str = Path(...), entreprise_patch_model: EntreprisePatchModel = Body(...)):
+async def patch(_id: str = Path(...), entreprise_patch_model: EntreprisePatchModel = Body(...)):
     """Partially update an entreprise"""
     if not _id:
         raise EntrepriseException(Messages.REQUIRED_ID)
     
-    existing_entreprise = service.get_model(_id)
-    if not existing_entreprise:
-        message_response = MessageResponseHelper.build(
-            ResponseTypeEnum.ERROR,
-            Messages.ERROR_NOT_FOUND
-        )
-        return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
-    
     if not any(entreprise_patch_model.model_dump(exclude_none=True).keys()):
         entreprise_patch_model_keys = list(entreprise_patch_model.model_fields.keys())
         message = Messages.UNAUTHORIZED_FIELDS.format(allowed_fields=entreprise_patch_model_keys)
         raise EntrepriseException(message)
 
-    if not service.check_changes(existing_entreprise, entreprise_patch_model):
-        return Response(content="", status_code=HTTPStatus.NO_CONTENT)
-
-    # Update fields
-    service.update_name(_id, entreprise_patch_model.name)
-    service.update_description(_id, entreprise_patch_model.description)
-    service.update_logo(_id, entreprise_patch_model.logo)
-    service.update_website(_id, entreprise_patch_model.website)
-    service.update_location(_id, entreprise_patch_model.location)
+    # One round trip, matching only when a field changes
+    patched_model = await service.patch_model(_id, entreprise_patch_model)
+    if patched_model:
+        return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
 
-    patched_model = service.get_model(_id)
+    if await service.exists(_id):
+        return Response(content="", status_code=HTTPStatus.NO_CONTENT)
 
-    return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
 
 
 @router.delete('/{_id}')
 @exception_handler
-def delete_by_id(_id: str = Path(...)):
+async def delete_by_id(_id: str = Path(...)):
     """Delete an entreprise"""
     if not _id:
         raise EntrepriseException(Messages.REQUIRED_ID)
     
-    if service.delete_model(_id):
+    if await service.delete_model(_id):
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.SUCCESS,
             Messages.SUCCESS_DELETED
@@ -15,6 +15,7 @@ class Messages:
     REQUIRED_NAME = "Name is required"
     REQUIRED_CREATED_BY = "Created by user ID is required"
     UNAUTHORIZED_FIELDS = "Only the following fields can be updated: {allowed_fields}"
+    BULK_SIZE = "Bulk requests take between 1 and {max_items} items"
     
     # Validation messages
     NAME_EXISTS = "Entreprise with this name already exists"
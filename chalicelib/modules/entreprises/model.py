@@ -2,7 +2,7 @@
 
 from datetime import datetime, timezone
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional
+from typing import Dict, List, Optional, Union
 from ...common.types.type import ObjectIdStr
 
 
@@ -36,6 +36,7 @@ class EntrepriseModel(BaseModel, metaclass=MetaModel):
     location: Optional[str] = None
     createdAt: Optional[datetime] = Field(default_factory=lambda: datetime.now(timezone.utc))
     createdBy: ObjectIdStr  # User ENTREPRISE
+    openJobCount: int = 0  # Published jobs, maintained on job writes
 
 
 class EntreprisePatchModel(BaseModel, metaclass=MetaModel):
@@ -49,9 +50,45 @@ class EntreprisePatchModel(BaseModel, metaclass=MetaModel):
     location: Optional[str] = None
 
 
+class EntreprisePartialModel(BaseModel, metaclass=MetaModel):
+    """Entreprise model of a document read with a projection, every field is optional"""
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
+    name: Optional[str] = None
+    description: Optional[str] = None
+    logo: Optional[str] = None
+    website: Optional[str] = None
+    location: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    createdBy: Optional[ObjectIdStr] = None
+    openJobCount: Optional[int] = None
+
+
+class EntrepriseDailyCount(BaseModel, metaclass=MetaModel):
+    """Number of applications received on a day"""
+    date: str
+    count: int = 0
+
+
+class EntrepriseStatsModel(BaseModel, metaclass=MetaModel):
+    """Recruiting stats of an entreprise"""
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
+    entrepriseId: ObjectIdStr
+    days: int
+    jobsByStatus: Dict[str, int] = Field(default_factory=dict)
+    jobsByContractType: Dict[str, int] = Field(default_factory=dict)
+    applicationsByStatus: Dict[str, int] = Field(default_factory=dict)
+    applicationsPerDay: List[EntrepriseDailyCount] = Field(default_factory=list)
+    generatedAt: datetime
+
+
 class EntrepriseModelResult(BaseModel, metaclass=MetaModel):
     """Entreprise result model with pagination"""
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
     
-    total: int
-    results: list[EntrepriseModel]
+    total: Optional[int] = None
+    totalExact: bool = True
+    results: list[Union[EntrepriseModel, EntreprisePartialModel]]
+    nextCursor: Optional[str] = None
@@ -1,17 +1,39 @@
 """Entreprise schema definitions for validation"""
 
-from datetime import datetime, timezone
-from bson import CodecOptions
+from datetime import datetime
+from typing import Any, Dict
+from pymongo import IndexModel, ASCENDING, DESCENDING, GEOSPHERE
 from pymongoose import methods
 from pymongoose.mongo_types import Types, Schema
 from .model import EntrepriseModel
-from ...config.mongodb import mongo_client
-
-methods.database = mongo_client
+from ...common.helpers.gazetteer import Gazetteer
+from ...config.mongodb import mongodb
 
 
 class EntrepriseSchema(Schema):
     schema_name = "Entreprise"
+    # GeoJSON point of the location, geocoded on write with the bundled gazetteer
+    LOCATION_POINT = "locationPoint"
+
+    # Indexes backing Filters.apply() and the list sort, the name is unique
+    indexes = [
+        IndexModel(
+            [(EntrepriseModel.createdAt, DESCENDING), ("_id", DESCENDING)],
+            name="createdAt",
+        ),
+        IndexModel(
+            [(EntrepriseModel.name, ASCENDING)],
+            name="name",
+            unique=True,
+        ),
+        # Entreprises whose location is not in the gazetteer are left out
+        IndexModel(
+            [(LOCATION_POINT, GEOSPHERE)],
+            name="locationPoint",
+        ),
+    ]
+    # Default projection of list reads, leaving out the description
+    list_projection = {EntrepriseModel.description: 0, LOCATION_POINT: 0}
 
     def __init__(self, **kwargs):
         self.schema = {
@@ -48,12 +70,38 @@ class EntrepriseSchema(Schema):
                 "type": Types.ObjectId,
                 "required": True,
             },
+            EntrepriseModel.openJobCount: {
+                "type": Types.Number,
+                "default": 0,
+                "required": False,
+            },
+            # Not part of the API models, geocoded from the location
+            self.LOCATION_POINT: {
+                "required": False,
+            },
         }
         super().__init__(self.schema_name, self.schema, kwargs)
-        self.native_collection = methods.database.get_collection(
-            self.schema_name,
-            codec_options=CodecOptions(tz_aware=True, tzinfo=timezone.utc)
-        )
+
+    @staticmethod
+    def derive(document: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Set the fields derived from a new serialized entreprise, in place, before it is written
+
+        The location is geocoded with the bundled gazetteer, None when it names no known
+        place. Shared by the create path and `manage.py import`.
+        """
+        document[EntrepriseSchema.LOCATION_POINT] = Gazetteer.geocode(document.get(EntrepriseModel.location))
+        return document
+
+    @property
+    def native_collection(self):
+        """Blocking collection, resolved on the current client"""
+        return mongodb.get_collection(self.schema_name)
+
+    @property
+    def async_collection(self):
+        """Asyncio collection, resolved on the current client"""
+        return mongodb.get_async_collection(self.schema_name)
 
 
 entreprise_schema = EntrepriseSchema()
@@ -1,131 +1,213 @@
-"""Entreprise service layer for business logic"""
+"""Entreprise service layer for `manage.py` and scripts, on the blocking client"""
 
-from typing import Any
-from datetime import datetime
+from typing import Any, List, Optional
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
 from pydantic import BaseModel
-from pymongoose import methods
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from ...common.helpers.bulk import Bulk
+from ...common.helpers.cache import TTLCache
+from ...common.helpers.counters import Counters
 from ...common.helpers.filters import Filters
-from .model import EntrepriseModel, EntrepriseModelResult
-from .schema import entreprise_schema, EntrepriseSchema
+from ...common.helpers.gazetteer import Gazetteer
+from ...common.helpers.pagination import Pagination
+from ...common.helpers.projection import Projection
+from ...common.helpers.typed_query import TypedQuery
+from ...config.settings import EXPORT_BATCH_SIZE, STATS_CACHE_TTL
+from .model import EntrepriseModel, EntreprisePartialModel, EntreprisePatchModel, EntrepriseStatsModel, EntrepriseModelResult
+from .schema import entreprise_schema
+from ..jobs.model import OPEN_STATUS, JobModel
+from ..jobs.schema import job_schema
 from ...common.exceptions.exception import EntrepriseAlreadyExistsException
 
 
 class EntrepriseService:
     """Service class for entreprise operations"""
-    
+
+    # Longest period of the applications per day
+    STATS_MAX_DAYS = 365
+    # Stats by (entreprise, days), shared by the requests of the process
+    stats_cache = TTLCache(STATS_CACHE_TTL)
+
     def __init__(self):
         self.schema = entreprise_schema
-        self.collection = entreprise_schema.native_collection
+
+    @property
+    def collection(self):
+        """Collection of the schema on the current client"""
+        return self.schema.native_collection
 
     def get_all_models(self, filters: Filters):
         """Get all entreprises with filtering and pagination"""
         query = filters.apply()
-        total_count = self.collection.count_documents(query)
-        cursor = self.collection.find(
-            query,
-            limit=filters.limit,
-            skip=filters.skip,
-            sort={EntrepriseModel.createdAt: -1}
-        )
-        return EntrepriseModelResult(total=total_count, results=list(cursor))
+        projection = Projection.build(filters.fields, EntrepriseModel, self.schema.list_projection, EntrepriseModel.createdAt)
+        page = Pagination.find_page(self.collection, query, filters, EntrepriseModel.createdAt, projection)
+        return self._page_result(page, projection)
+
+    def export_models(self, filters: Filters):
+        """
+        Read entreprises for an export, with a batched cursor instead of pages
+
+        Args:
+            filters: Filters of the list, `fields` selects the exported fields
 
-    def get_model(self, _id: str):
+        Returns:
+            Tuple of (projection of the read, iterator of entreprises)
+        """
+        query = filters.apply()
+        projection = Projection.build(filters.fields, EntrepriseModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection).sort(
+            {EntrepriseModel.createdAt: -1}
+        ).batch_size(EXPORT_BATCH_SIZE)
+        model = Projection.model(projection, EntrepriseModel, EntreprisePartialModel)
+        return projection, (model.model_validate(document) for document in cursor)
+
+    def get_model(self, _id: str, fields: Optional[List[str]] = None):
         """Get entreprise by ID"""
-        result = self.collection.find_one({"_id": ObjectId(_id)})
+        projection = Projection.build(fields, EntrepriseModel)
+        result = self.collection.find_one({"_id": ObjectId(_id)}, projection)
         if not result:
             return None
-        return EntrepriseModel.model_validate(result)
+        return Projection.model(projection, EntrepriseModel, EntreprisePartialModel).model_validate(result)
+
+    def get_stats(self, _id: str, days: int = 30):
+        """
+        Get the recruiting stats of an entreprise, cached for STATS_CACHE_TTL seconds
+
+        Args:
+            _id: Entreprise ID
+            days: Number of days of applications per day, today included
+
+        Returns:
+            The stats, or None when the entreprise does not exist
+        """
+        if not 1 <= days <= self.STATS_MAX_DAYS:
+            raise ValueError(f"days must be between 1 and {self.STATS_MAX_DAYS}")
+        key = (_id, days)
+        stats = self.stats_cache.get(key)
+        if stats is not None:
+            return stats
+        if not self.exists(_id):
+            return None
 
-    def get_by_name(self, name: str):
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        since = today - timedelta(days=days - 1)
+        pipeline = job_schema.entreprise_stats_pipeline(_id, since)
+        aggregation = job_schema.native_collection.aggregate(pipeline)
+        stats = self._stats_result(_id, days, since, next(aggregation, None) or {})
+        self.stats_cache.set(key, stats)
+        return stats
+
+    def _stats_result(self, _id: str, days: int, since: datetime, facet: dict) -> EntrepriseStatsModel:
+        """Build the stats from the `$facet` document, with a zero for days without applications"""
+        counts = {
+            name: {group["_id"]: group["count"] for group in facet.get(name, []) if group["_id"] is not None}
+            for name in ("jobsByStatus", "jobsByContractType", "applicationsByStatus", "applicationsPerDay")
+        }
+        dates = [(since + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(days)]
+        return EntrepriseStatsModel(
+            entrepriseId=_id,
+            days=days,
+            jobsByStatus=counts["jobsByStatus"],
+            jobsByContractType=counts["jobsByContractType"],
+            applicationsByStatus=counts["applicationsByStatus"],
+            applicationsPerDay=[{"date": date, "count": counts["applicationsPerDay"].get(date, 0)} for date in dates],
+            generatedAt=datetime.now(timezone.utc),
+        )
+
+    def get_by_name(self, name: str, fields: Optional[List[str]] = None):
         """Get entreprise by name"""
-        result = self.collection.find_one({"name": name})
+        projection = Projection.build(fields, EntrepriseModel)
+        result = self.collection.find_one({"name": name}, projection)
         if not result:
             return None
-        return EntrepriseModel.model_validate(result)
+        return Projection.model(projection, EntrepriseModel, EntreprisePartialModel).model_validate(result)
 
     def add_model(self, model: EntrepriseModel):
         """Create a new entreprise"""
-        # Check if entreprise with name already exists
-        existing_entreprise = self._get_existing_entreprise(model)
-        if existing_entreprise:
-            raise EntrepriseAlreadyExistsException(model.name)
+        serialized_data = self._serialize_new(model)
+
+        # Insert into MongoDB collection, the unique index rejects duplicates
+        try:
+            result = self.collection.insert_one(serialized_data)
+        except DuplicateKeyError:
+            raise self._duplicate_error(serialized_data)
+
+        # Build the created object from the inserted data instead of reading it back
+        return EntrepriseModel.model_validate({**serialized_data, "_id": result.inserted_id})
+
+    def add_models(self, items: List[Any]):
+        """
+        Create entreprises with one unordered insert_many
 
-        # Serialize the model
-        serialized_data = model.model_dump(exclude_none=True)
+        Args:
+            items: Raw items, validated one by one
+
+        Returns:
+            One result per item, with the new id or the error
+        """
+        models, errors = Bulk.validate(items, EntrepriseModel)
+        documents = [(index, self._serialize_new(model)) for index, model in models]
+        return errors + Bulk.insert_many(self.collection, documents, self._duplicate_error)
+
+    def _serialize_new(self, model: EntrepriseModel) -> dict:
+        """Serialize a new entreprise with its creation metadata"""
+        serialized_data = TypedQuery.document(EntrepriseModel, model.model_dump(exclude_none=True))
+
+        # Geocoded with the bundled gazetteer, None when the location names no known place
+        self.schema.derive(serialized_data)
 
         # Add creation metadata
-        serialized_data[EntrepriseModel.createdAt] = datetime.utcnow()
-        
-        # Insert into MongoDB collection
-        inserted_id = methods.insert_one(EntrepriseSchema.schema_name, serialized_data)
-
-        # Return the complete object after insertion
-        return self.get_model(inserted_id)
-
-    def _get_existing_entreprise(self, model: EntrepriseModel):
-        """Check if entreprise with name already exists"""
-        return self.collection.find_one({
-            EntrepriseModel.name: model.name
-        })
-
-    def update_name(self, _id: str, name: str):
-        """Update entreprise's name"""
-        if not name:
-            return
-        obj_id = ObjectId(_id)
-        # Check if name already exists for another entreprise
-        existing = self.collection.find_one({
-            EntrepriseModel.name: name,
-            "_id": {"$ne": obj_id}
-        })
-        if existing:
-            raise EntrepriseAlreadyExistsException(name)
-        
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {EntrepriseModel.name: name}}
-        )
+        serialized_data[EntrepriseModel.createdAt] = datetime.now(timezone.utc)
 
-    def update_description(self, _id: str, description: str):
-        """Update entreprise's description"""
-        if description is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {EntrepriseModel.description: description}}
-        )
+        # The counter starts empty and only follows job writes
+        serialized_data[EntrepriseModel.openJobCount] = 0
 
-    def update_logo(self, _id: str, logo: str):
-        """Update entreprise's logo"""
-        if logo is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {EntrepriseModel.logo: logo}}
-        )
+        return serialized_data
 
-    def update_website(self, _id: str, website: str):
-        """Update entreprise's website"""
-        if website is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {EntrepriseModel.website: website}}
-        )
+    def _patch_fields(self, patch_model: BaseModel) -> dict:
+        """Serialize the fields set by a patch, a changed location is geocoded again"""
+        fields = TypedQuery.document(EntrepriseModel, patch_model.model_dump(exclude_none=True))
+        return Gazetteer.document(fields, EntrepriseModel.location, self.schema.LOCATION_POINT)
 
-    def update_location(self, _id: str, location: str):
-        """Update entreprise's location"""
-        if location is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {EntrepriseModel.location: location}}
-        )
+    def _duplicate_error(self, document: dict) -> Exception:
+        """Exception reported when the unique index rejects an entreprise"""
+        return EntrepriseAlreadyExistsException(document[EntrepriseModel.name])
+
+    def patch_model(self, _id: str, patch_model: BaseModel):
+        """
+        Apply a partial update in one round trip
+
+        The filter only matches when a field differs, so the "no changes" check is
+        done by the database and an unchanged entreprise is not written.
+
+        Args:
+            _id: Entreprise ID
+            patch_model: Patch model, None fields are left untouched
+
+        Returns:
+            The updated entreprise, or None when it does not exist or nothing changed
+        """
+        fields = self._patch_fields(patch_model)
+        if not fields:
+            return None
+        try:
+            result = self.collection.find_one_and_update(
+                {"_id": ObjectId(_id), **Filters.changed_filter(fields)},
+                {"$set": fields},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            raise EntrepriseAlreadyExistsException(fields[EntrepriseModel.name])
+        if not result:
+            return None
+        return EntrepriseModel.model_validate(result)
+
+    def exists(self, _id: str) -> bool:
+        """Check if an entreprise exists"""
+        result = self.collection.find_one({"_id": ObjectId(_id)}, {"_id": 1})
+        return result is not None
 
     def delete_model(self, _id: str):
         """Hard delete an entreprise"""
@@ -133,21 +215,77 @@ class EntrepriseService:
         result = self.collection.delete_one({"_id": obj_id})
         return result.deleted_count
 
-    def check_changes(self, existing_entreprise_model: BaseModel, entreprise_patch_model: BaseModel) -> bool:
-        """Check if there are any changes between existing and patch models"""
-        for field in entreprise_patch_model.model_fields_set:
-            new_val = getattr(entreprise_patch_model, field)
-            old_val = getattr(existing_entreprise_model, field, None)
-            if self._to_plain(new_val) != self._to_plain(old_val):
-                return True
-        return False
-
-    def _to_plain(self, value: Any) -> Any:
-        """Convert value to plain representation for comparison"""
-        if isinstance(value, BaseModel):
-            return value.model_dump(exclude_none=True)
-        if isinstance(value, dict):
-            return {k: self._to_plain(v) for k, v in value.items()}
-        if isinstance(value, (list, tuple)):
-            return [self._to_plain(v) for v in value]
-        return value
+    def patch_models(self, items: List[Any]):
+        """
+        Apply partial updates with one unordered bulk_write
+
+        Args:
+            items: Raw {id, patch} items, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        patches, errors = Bulk.validate_patches(items, EntreprisePatchModel)
+        targets = [(index, _id, self._patch_fields(patch)) for index, _id, patch in patches]
+        current = self._current(targets)
+        operations = [
+            (index, UpdateOne({"_id": _id, **Filters.changed_filter(fields)}, {"$set": fields}))
+            for index, _id, fields in targets
+        ]
+        failed = Bulk.write(self.collection, operations)
+        return errors + Bulk.write_results(targets, current, failed, self._duplicate_error)
+
+    def delete_models(self, items: List[Any]):
+        """
+        Hard delete entreprises with one unordered bulk_write
+
+        Args:
+            items: Raw entreprise ids, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        ids, errors = Bulk.validate_ids(items)
+        targets = [(index, _id, None) for index, _id in ids]
+        current = self._current(targets)
+        operations = [(index, DeleteOne({"_id": _id})) for index, _id, _ in targets]
+        failed = Bulk.write(self.collection, operations)
+        return errors + Bulk.write_results(targets, current, failed)
+
+    def _current(self, targets):
+        """Read the live entreprises targeted by a bulk write, keyed by _id"""
+        if not targets:
+            return {}
+        cursor = self.collection.find(
+            {"_id": {"$in": [_id for _, _id, _ in targets]}},
+            Bulk.projection(targets)
+        )
+        return {document["_id"]: document for document in cursor}
+
+    def reconcile_counters(self, batch_size: int = 500, dry_run: bool = False):
+        """Recompute the open job counter of every entreprise, rewriting the drifted ones"""
+        fields = [EntrepriseModel.openJobCount]
+        return Counters.reconcile(self.collection, fields, self._recount, batch_size, dry_run)
+
+    def _recount(self, entreprise_ids: List[ObjectId]) -> dict:
+        """Open job counters of entreprises, grouped from their published jobs"""
+        counts = {entreprise_id: 0 for entreprise_id in entreprise_ids}
+        aggregation = job_schema.native_collection.aggregate([
+            {"$match": {
+                JobModel.entrepriseId: {"$in": entreprise_ids},
+                JobModel.status: OPEN_STATUS,
+            }},
+            {"$group": {"_id": f"${JobModel.entrepriseId}", "count": {"$sum": 1}}},
+        ])
+        for group in aggregation:
+            counts[group["_id"]] = group["count"]
+        return {
+            entreprise_id: {EntrepriseModel.openJobCount: count}
+            for entreprise_id, count in counts.items()
+        }
+
+    def _page_result(self, page, projection):
+        """Build the result of a page read with a projection"""
+        return EntrepriseModelResult(**page._replace(
+            results=Projection.validate(page.results, projection, EntrepriseModel, EntreprisePartialModel)
+        )._asdict())
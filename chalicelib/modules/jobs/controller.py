@@ -1,68 +1,172 @@
 from http import HTTPStatus
+from typing import Any, List
 from fastapi import APIRouter, Query, Path, Body, status
 from fastapi.responses import JSONResponse, Response
-from .service import JobService
+from .async_service import AsyncJobService
 from ...common.enums.response_type_enum import ResponseTypeEnum
 from ...common.exceptions.exception import JobException
+from ...common.helpers.bulk import Bulk
 from ...common.helpers.error_middleware import exception_handler
+from ...common.helpers.export import Export
 from ...common.helpers.filters import Filters
 from ...common.helpers.message_response_helper import MessageResponseHelper
+from ...config.settings import BULK_MAX_ITEMS, SIMILAR_JOBS_COUNT
 from .messages import Messages
 from .model import JobModel, JobPatchModel
 
-service = JobService()
+service = AsyncJobService()
 router = APIRouter(prefix='/jobs', tags=['jobs'])
 
 
 @router.post('', status_code=status.HTTP_201_CREATED)
 @exception_handler
-def add(payload: JobModel):
+async def add(payload: JobModel):
     """Create a new job"""
-    inserted_model = service.add_model(payload)
+    inserted_model = await service.add_model(payload)
     return JSONResponse(
         content=inserted_model.model_dump(exclude_none=True, mode='json'),
         status_code=HTTPStatus.CREATED
     )
 
 
+@router.post('/bulk', status_code=status.HTTP_201_CREATED)
+@exception_handler
+async def add_bulk(payload: List[Any] = Body(...)):
+    """Create jobs in bulk, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise JobException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.add_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.CREATED)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.patch('/bulk')
+@exception_handler
+async def patch_bulk(payload: List[Any] = Body(...)):
+    """Partially update jobs in bulk from {id, patch} items, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise JobException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.patch_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.delete('/bulk')
+@exception_handler
+async def delete_bulk(payload: List[Any] = Body(...)):
+    """Delete jobs in bulk from a list of ids, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise JobException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.delete_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
 @router.get('')
 @exception_handler
-def get_all_with_criteria(
+async def get_all_with_criteria(
     entrepriseId: str = Query(None),
     status: str = Query(None),
     role: str = Query(None),
     email: str = Query(None),
-    skip: int = Query(0),
-    limit: int = Query(100)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: str = Query(None),
+    includeTotal: str = Query(Filters.TOTAL_EXACT),
+    fields: str = Query(None),
+    near: str = Query(None),
+    radiusKm: float = Query(None)
 ):
-    """Get all jobs with filtering and pagination"""
-    criteria = Filters(role=role, status=status, email=email, skip=skip, limit=limit)
+    """Get all jobs with filtering and pagination, `near=` lists them by distance"""
+    criteria = Filters(
+        role=role, status=status, email=email, skip=skip, limit=limit,
+        cursor=cursor, include_total=includeTotal, fields=fields
+    )
+
+    # If near is provided, the jobs within radiusKm of it, nearest first
+    if near:
+        models = await service.get_near(near, radiusKm, criteria, entreprise_id=entrepriseId)
+        return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
     
     # If entrepriseId is provided, filter by entreprise
     if entrepriseId:
-        models = service.get_by_entreprise(entrepriseId, criteria)
+        models = await service.get_by_entreprise(entrepriseId, criteria)
         return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
     
     # If status is provided (and no entrepriseId), filter by status
     if status:
-        models = service.get_by_status(status, criteria)
+        models = await service.get_by_status(status, criteria)
         return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
     
     # Otherwise get all jobs
-    models = service.get_all_models(filters=criteria)
+    models = await service.get_all_models(filters=criteria)
+    return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
+
+
+@router.get('/export')
+@exception_handler
+async def export(
+    entrepriseId: str = Query(None),
+    role: str = Query(None),
+    status: str = Query(None),
+    email: str = Query(None),
+    format: str = Query(Export.NDJSON),
+    fields: str = Query(None)
+):
+    """Stream the jobs matching the filters as NDJSON or CSV"""
+    export_format = Export.check_format(format)
+    criteria = Filters(role=role, status=status, email=email, fields=fields)
+    projection, models = await service.export_models(criteria, entreprise_id=entrepriseId)
+    return Export.response(models, export_format, Export.columns(projection, JobModel), 'jobs')
+
+
+@router.get('/facets')
+@exception_handler
+async def get_facets(
+    entrepriseId: str = Query(None),
+    status: str = Query(None),
+    role: str = Query(None),
+    email: str = Query(None)
+):
+    """Count the jobs matching the list filters by contract type, remote, location and status"""
+    criteria = Filters(role=role, status=status, email=email)
+    facets = await service.get_facets(criteria, entreprise_id=entrepriseId)
+    return JSONResponse(content=facets.model_dump(exclude_none=True, mode='json'))
+
+
+@router.get('/search')
+@exception_handler
+async def search(
+    q: str = Query(...),
+    entrepriseId: str = Query(None),
+    status: str = Query(None),
+    limit: int = Query(20, ge=1),
+    cursor: str = Query(None),
+    fields: str = Query(None)
+):
+    """Search jobs by title, location and description, best match first"""
+    criteria = Filters(status=status, limit=limit, cursor=cursor, include_total=Filters.TOTAL_NONE, fields=fields)
+    models = await service.search(q, criteria, entreprise_id=entrepriseId)
     return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
 
 
 @router.get('/{_id}')
 @exception_handler
-def get_by_id(_id: str = Path(...)):
-    """Get job by ID"""
+async def get_by_id(_id: str = Path(...), fields: str = Query(None), expand: str = Query(None)):
+    """Get job by ID, `expand=entreprise,stats` embeds its entreprise and application counts"""
     if not _id:
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.ERROR,
             Messages.REQUIRED_ID)
         return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
-    model = service.get_model(_id)
+    expansions = Filters.parse_fields(expand)
+    if expansions:
+        model = await service.get_expanded(_id, expansions, Filters.parse_fields(fields))
+    else:
+        model = await service.get_model(_id, Filters.parse_fields(fields))
     if model:
         return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
     else:
@@ -72,53 +176,54 @@ def get_by_id(_id: str = Path(...)):
         return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
 
 
+@router.get('/{_id}/similar')
+@exception_handler
+async def get_similar(_id: str = Path(...), limit: int = Query(SIMILAR_JOBS_COUNT), fields: str = Query(None)):
+    """Get the published jobs most similar to a job, best first"""
+    models = await service.get_similar(_id, limit, Filters.parse_fields(fields))
+    if models is None:
+        message_response = MessageResponseHelper.build(
+            ResponseTypeEnum.ERROR,
+            Messages.ERROR_NOT_FOUND)
+        return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
+    return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
+
+
 @router.patch('/{_id}')
 @exception_handler
-def patch(_id: str = Path(...), job_patch_model: JobPatchModel = Body(...)):
+async def patch(_id: str = Path(...), job_patch_model: JobPatchModel = Body(...)):
     """Partially update a job"""
     if not _id:
         raise JobException(Messages.REQUIRED_ID)
 
-    existing_job = service.get_model(_id)
-    if not existing_job:
-        message_response = MessageResponseHelper.build(
-            ResponseTypeEnum.ERROR,
-            Messages.ERROR_NOT_FOUND
-        )
-        return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
-
     if not any(job_patch_model.model_dump(exclude_none=True).keys()):
         job_patch_model_keys = list(job_patch_model.model_fields.keys())
         message = Messages.UNAUTHORIZED_FIELDS.format(allowed_fields=job_patch_model_keys)
         raise JobException(message)
 
-    if not service.check_changes(existing_job, job_patch_model):
-        return Response(content="", status_code=HTTPStatus.NO_CONTENT)
+    # One round trip, matching only when a field changes
+    patched_model = await service.patch_model(_id, job_patch_model)
+    if patched_model:
+        return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
 
-    # Update fields
-    service.update_title(_id, job_patch_model.title)
-    service.update_description(_id, job_patch_model.description)
-    service.update_location(_id, job_patch_model.location)
-    service.update_contract_type(_id, job_patch_model.contractType)
-    service.update_remote(_id, job_patch_model.remote)
-    service.update_salary_range(_id, job_patch_model.salaryRange)
-    service.update_entreprise_id(_id, job_patch_model.entrepriseId)
-    service.update_status(_id, job_patch_model.status)
-    service.update_expires_at(_id, job_patch_model.expiresAt)
-
-    patched_model = service.get_model(_id)
+    if await service.exists(_id):
+        return Response(content="", status_code=HTTPStatus.NO_CONTENT)
 
-    return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
 
 
 @router.delete('/{_id}')
 @exception_handler
-def delete_by_id(_id: str = Path(...)):
+async def delete_by_id(_id: str = Path(...)):
     """Delete a job"""
     if not _id:
         raise JobException(Messages.REQUIRED_ID)
 
-    if service.delete_model(_id):
+    if await service.delete_model(_id):
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.SUCCESS,
             Messages.SUCCESS_DELETED
@@ -17,6 +17,7 @@ class Messages:
     REQUIRED_STATUS = "Status is required"
     REQUIRED_CREATED_BY = "Created by user ID is required"
     UNAUTHORIZED_FIELDS = "Only the following fields can be updated: {allowed_fields}"
+    BULK_SIZE = "Bulk requests take between 1 and {max_items} items"
 
     # Validation messages
     INVALID_CONTRACT_TYPE = "Invalid contract type"
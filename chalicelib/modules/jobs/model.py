@@ -2,9 +2,15 @@
 
 from datetime import datetime, timezone
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional
+from typing import Dict, List, Optional, Union
 from ...common.types.type import ObjectIdStr
 
+# Status of the jobs counted in Entreprise.openJobCount
+OPEN_STATUS = "published"
+# Statuses a job leaves on its publishAt and expiresAt
+DRAFT_STATUS = "draft"
+CLOSED_STATUS = "closed"
+
 
 class MetaModel(type(BaseModel)):
     def __getattr__(cls, item):
@@ -35,11 +41,15 @@ class JobModel(BaseModel, metaclass=MetaModel):
     contractType: str  # CDI, CDD, Freelance, Stage, Alternance, Temps partiel
     remote: bool = False
     salaryRange: Optional[str] = None
+    skills: List[str] = Field(default_factory=list)  # Matched whole against the candidat skills
     entrepriseId: ObjectIdStr  # Reference to Entreprise
     createdBy: ObjectIdStr  # User (Emploi or User type)
     status: str = "draft"  # draft, published, closed
     createdAt: Optional[datetime] = Field(default_factory=lambda: datetime.now(timezone.utc))
-    expiresAt: Optional[datetime] = None
+    publishAt: Optional[datetime] = None  # A draft is published at this time
+    expiresAt: Optional[datetime] = None  # A published job is closed at this time
+    applicationCount: int = 0  # Maintained on application writes
+    applicationCountByStatus: Dict[str, int] = Field(default_factory=dict)
 
 
 class JobPatchModel(BaseModel, metaclass=MetaModel):
@@ -52,14 +62,94 @@ class JobPatchModel(BaseModel, metaclass=MetaModel):
     contractType: Optional[str] = None
     remote: Optional[bool] = None
     salaryRange: Optional[str] = None
+    skills: Optional[List[str]] = None
+    entrepriseId: Optional[ObjectIdStr] = None
+    status: Optional[str] = None
+    publishAt: Optional[datetime] = None
+    expiresAt: Optional[datetime] = None
+
+
+class JobPartialModel(BaseModel, metaclass=MetaModel):
+    """Job model of a document read with a projection, every field is optional"""
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
+    title: Optional[str] = None
+    description: Optional[str] = None
+    location: Optional[str] = None
+    contractType: Optional[str] = None
+    remote: Optional[bool] = None
+    salaryRange: Optional[str] = None
+    skills: Optional[List[str]] = None
     entrepriseId: Optional[ObjectIdStr] = None
+    createdBy: Optional[ObjectIdStr] = None
     status: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    publishAt: Optional[datetime] = None
     expiresAt: Optional[datetime] = None
+    applicationCount: Optional[int] = None
+    applicationCountByStatus: Optional[Dict[str, int]] = None
+
+
+class JobEntrepriseSummary(BaseModel, metaclass=MetaModel):
+    """Summary of the entreprise of a job, embedded by `expand=entreprise`"""
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
+    name: Optional[str] = None
+    logo: Optional[str] = None
+    website: Optional[str] = None
+    location: Optional[str] = None
+
+
+class JobApplicationStats(BaseModel, metaclass=MetaModel):
+    """Application counts of a job, embedded by `expand=stats`"""
+    model_config = ConfigDict(populate_by_name=True)
+
+    total: int = 0
+    byStatus: Dict[str, int] = Field(default_factory=dict)
+
+
+class JobExpandedModel(BaseModel, metaclass=MetaModel):
+    """Job read with its expansions, every job field is optional to allow projections"""
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
+    title: Optional[str] = None
+    description: Optional[str] = None
+    location: Optional[str] = None
+    contractType: Optional[str] = None
+    remote: Optional[bool] = None
+    salaryRange: Optional[str] = None
+    skills: Optional[List[str]] = None
+    entrepriseId: Optional[ObjectIdStr] = None
+    createdBy: Optional[ObjectIdStr] = None
+    status: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    publishAt: Optional[datetime] = None
+    expiresAt: Optional[datetime] = None
+    applicationCount: Optional[int] = None
+    applicationCountByStatus: Optional[Dict[str, int]] = None
+    entreprise: Optional[JobEntrepriseSummary] = None
+    stats: Optional[JobApplicationStats] = None
+
+
+class JobFacetsModel(BaseModel, metaclass=MetaModel):
+    """Counts of the jobs matching a filter, by value of each facet"""
+    model_config = ConfigDict(populate_by_name=True)
+
+    total: int = 0
+    contractType: Dict[str, int] = Field(default_factory=dict)
+    remote: Dict[str, int] = Field(default_factory=dict)
+    location: Dict[str, int] = Field(default_factory=dict)
+    status: Dict[str, int] = Field(default_factory=dict)
 
 
 class JobModelResult(BaseModel, metaclass=MetaModel):
     """Job result model with pagination"""
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
 
-    total: int
-    results: list[JobModel]
+    total: Optional[int] = None
+    totalExact: bool = True
+    results: list[Union[JobModel, JobPartialModel]]
+    nextCursor: Optional[str] = None
@@ -1,17 +1,142 @@
 """Job schema definitions for validation"""
 
-from datetime import datetime, timezone
-from bson import CodecOptions
+import math
+import re
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from pymongo import IndexModel, ASCENDING, DESCENDING, GEOSPHERE, TEXT
 from pymongoose import methods
 from pymongoose.mongo_types import Types, Schema
-from .model import JobModel
-from ...config.mongodb import mongo_client
-
-methods.database = mongo_client
+from .model import OPEN_STATUS, JobModel
+from ...common.helpers.filters import Filters
+from ...common.helpers.gazetteer import Gazetteer
+from ...common.helpers.pagination import Pagination
+from ...common.helpers.typed_query import TypedQuery
+from ...config.mongodb import mongodb
+from ...config.settings import (
+    FACETS_MAX_VALUES, MATCH_CANDIDATES, SEARCH_FRESHNESS_HALF_LIFE_DAYS, SIMILAR_JOBS_CANDIDATES,
+    SIMILAR_JOBS_MAX_TERMS
+)
+from ..applications.model import ApplicationModel
+from ..applications.schema import application_schema
+from ..entreprises.model import EntrepriseModel
+from ..entreprises.schema import entreprise_schema
 
 
 class JobSchema(Schema):
     schema_name = "Job"
+    # GeoJSON point of the location, geocoded on write with the bundled gazetteer
+    LOCATION_POINT = "locationPoint"
+    # Normalized skills, set on write and matched against the candidat skills
+    SKILL_TERMS = "skillTerms"
+    # Terms of the title and description and their weights, set on write for the similar jobs
+    SIMILAR_TERMS = "similarTerms"
+    SIMILAR_TF = "similarTf"
+
+    # Indexes backing Filters.apply() and the list sort
+    indexes = [
+        IndexModel(
+            [(JobModel.createdAt, DESCENDING), ("_id", DESCENDING)],
+            name="createdAt",
+        ),
+        IndexModel(
+            [(JobModel.status, ASCENDING), (JobModel.createdAt, DESCENDING), ("_id", DESCENDING)],
+            name="status_createdAt",
+        ),
+        IndexModel(
+            [(JobModel.entrepriseId, ASCENDING), (JobModel.createdAt, DESCENDING), ("_id", DESCENDING)],
+            name="entrepriseId_createdAt",
+        ),
+        IndexModel(
+            [
+                (JobModel.entrepriseId, ASCENDING),
+                (JobModel.status, ASCENDING),
+                (JobModel.createdAt, DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="entrepriseId_status_createdAt",
+        ),
+        # Full-text search, French stemming; version 3 text indexes also fold accents
+        IndexModel(
+            [(JobModel.title, TEXT), (JobModel.location, TEXT), (JobModel.description, TEXT)],
+            weights={JobModel.title: 10, JobModel.location: 5, JobModel.description: 1},
+            default_language="french",
+            name="text_search",
+        ),
+        # Lifecycle transitions, published jobs past expiresAt and drafts past publishAt
+        IndexModel(
+            [(JobModel.status, ASCENDING), (JobModel.expiresAt, ASCENDING)],
+            name="status_expiresAt",
+        ),
+        IndexModel(
+            [(JobModel.status, ASCENDING), (JobModel.publishAt, ASCENDING)],
+            name="status_publishAt",
+        ),
+        # `GET /jobs?near=`, jobs whose location is not in the gazetteer are left out
+        IndexModel(
+            [(LOCATION_POINT, GEOSPHERE), (JobModel.status, ASCENDING)],
+            name="locationPoint_status",
+        ),
+        # `GET /candidats/{id}/matches` and the skill weights, multikey on the normalized skills
+        IndexModel(
+            [
+                (SKILL_TERMS, ASCENDING),
+                (JobModel.status, ASCENDING),
+                (JobModel.createdAt, DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="skillTerms_status_createdAt",
+        ),
+        # Similar job candidates and the term document frequencies, multikey on the terms
+        IndexModel(
+            [
+                (SIMILAR_TERMS, ASCENDING),
+                (JobModel.status, ASCENDING),
+                (JobModel.createdAt, DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="similarTerms_status_createdAt",
+        ),
+    ]
+    # Stored ids of the most similar published jobs, when they were computed, and the
+    # norm of the TF-IDF vector of the job at that time
+    SIMILAR_IDS = "similarJobIds"
+    SIMILAR_AT = "similarAt"
+    SIMILAR_NORM = "similarNorm"
+    SIMILAR_SCORE = "similarScore"
+    # Title words count this many times in the term frequencies
+    SIMILAR_TITLE_WEIGHT = 3
+    # Words too common in job offers to tell two of them apart, after folding
+    SIMILAR_STOP_WORDS = frozenset("""
+        and are but for from has have not our that the their this will with you your
+        aux avec ces cet cette dans des donc du elle est etre les leur mais nos notre nous
+        ont par pas plus pour que qui sans ses son sont sur une vos votre vous
+    """.split())
+
+    # Default projection of list reads, leaving out the description
+    list_projection = {
+        JobModel.description: 0, SIMILAR_IDS: 0, LOCATION_POINT: 0, SKILL_TERMS: 0,
+        SIMILAR_TERMS: 0, SIMILAR_TF: 0, SIMILAR_NORM: 0,
+    }
+
+    # Expansions of `GET /jobs/{id}?expand=`
+    EXPAND_ENTREPRISE = "entreprise"
+    EXPAND_STATS = "stats"
+    expansions = (EXPAND_ENTREPRISE, EXPAND_STATS)
+
+    # Fields counted by `GET /jobs/facets`
+    facets = (JobModel.contractType, JobModel.remote, JobModel.location, JobModel.status)
+
+    # Computed field `GET /jobs/search` is ordered by
+    SEARCH_RANK = "rank"
+
+    # Computed field `GET /candidats/{id}/matches` is ordered by, the weight of the shared skills
+    MATCH_RANK = "matchRank"
+
+    # Computed field `GET /jobs?near=` is ordered by
+    NEAR_DISTANCE = "distanceKm"
 
     def __init__(self, **kwargs):
         self.schema = {
@@ -44,6 +169,9 @@ class JobSchema(Schema):
                 "type": Types.String,
                 "required": False,
             },
+            JobModel.skills: {
+                "required": False,
+            },
             JobModel.entrepriseId: {
                 "type": Types.ObjectId,
                 "required": True,
@@ -62,16 +190,449 @@ class JobSchema(Schema):
                 "default": datetime.now,
                 "required": False
             },
+            JobModel.publishAt: {
+                "type": Types.Date,
+                "required": False,
+            },
             JobModel.expiresAt: {
                 "type": Types.Date,
                 "required": False,
             },
+            # applicationCountByStatus maps each application status to its count
+            JobModel.applicationCount: {
+                "type": Types.Number,
+                "default": 0,
+                "required": False,
+            },
+            # Not part of the API models, queried by `GET /jobs?near=` only
+            self.LOCATION_POINT: {
+                "required": False,
+            },
+            # Not part of the API models, queried by `GET /candidats/{id}/matches` only
+            self.SKILL_TERMS: {
+                "required": False,
+            },
+            # Not part of the API models, read by `GET /jobs/{id}/similar` only
+            self.SIMILAR_IDS: {
+                "required": False,
+            },
+            self.SIMILAR_AT: {
+                "type": Types.Date,
+                "required": False,
+            },
+            self.SIMILAR_TERMS: {
+                "required": False,
+            },
+            self.SIMILAR_TF: {
+                "required": False,
+            },
+            self.SIMILAR_NORM: {
+                "type": Types.Number,
+                "required": False,
+            },
         }
         super().__init__(self.schema_name, self.schema, kwargs)
-        self.native_collection = methods.database.get_collection(
-            self.schema_name,
-            codec_options=CodecOptions(tz_aware=True, tzinfo=timezone.utc)
-        )
+
+    def expand_stages(self, expand: List[str]) -> List[Dict[str, Any]]:
+        """
+        Build the aggregation stages embedding the expansions of a job
+
+        References are stored as ObjectId, so the lookups match the indexed `_id` and
+        `jobId` fields with a plain equality.
+
+        Args:
+            expand: Requested expansions
+
+        Returns:
+            Stages adding an `entreprise` summary and/or the application `stats`
+        """
+        unknown = [name for name in expand if name not in self.expansions]
+        if unknown:
+            raise ValueError(
+                f"Unknown expansions: {', '.join(unknown)}. Allowed expansions: {', '.join(self.expansions)}"
+            )
+
+        stages = []
+        if self.EXPAND_ENTREPRISE in expand:
+            stages += [
+                {"$lookup": {
+                    "from": entreprise_schema.schema_name,
+                    "let": {"entrepriseId": f"${JobModel.entrepriseId}"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$_id", "$$entrepriseId"]}}},
+                        {"$project": {
+                            EntrepriseModel.name: 1,
+                            EntrepriseModel.logo: 1,
+                            EntrepriseModel.website: 1,
+                            EntrepriseModel.location: 1,
+                        }},
+                    ],
+                    "as": self.EXPAND_ENTREPRISE,
+                }},
+                {"$unwind": {"path": f"${self.EXPAND_ENTREPRISE}", "preserveNullAndEmptyArrays": True}},
+            ]
+        if self.EXPAND_STATS in expand:
+            # Counts are grouped on the server, no application is sent back
+            stages += [
+                {"$lookup": {
+                    "from": application_schema.schema_name,
+                    "let": {"jobId": "$_id"},
+                    "pipeline": [
+                        {"$match": {
+                            "$expr": {"$eq": [f"${ApplicationModel.jobId}", "$$jobId"]},
+                        }},
+                        {"$group": {"_id": f"${ApplicationModel.status}", "count": {"$sum": 1}}},
+                    ],
+                    "as": self.EXPAND_STATS,
+                }},
+                # Applications without a status count in the total only, their null group
+                # would make $arrayToObject fail the whole read
+                {"$addFields": {self.EXPAND_STATS: {
+                    "total": {"$sum": f"${self.EXPAND_STATS}.count"},
+                    "byStatus": {"$arrayToObject": {"$map": {
+                        "input": {"$filter": {
+                            "input": f"${self.EXPAND_STATS}",
+                            "cond": {"$ne": ["$$this._id", None]},
+                        }},
+                        "in": {"k": "$$this._id", "v": "$$this.count"},
+                    }}},
+                }}},
+            ]
+        return stages
+
+    def search_pipeline(
+        self,
+        text: str,
+        query: Dict[str, Any],
+        limit: int,
+        cursor: Optional[str] = None,
+        projection: Optional[Dict[str, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Build the aggregation of one page of a full-text search
+
+        Matches are ranked by `ln(textScore) + createdAt / tau`, which orders them like
+        the text score halved every SEARCH_FRESHNESS_HALF_LIFE_DAYS of age. Unlike a
+        decay computed from the current time, the rank of a job never changes, so
+        pages are seeked on (rank, _id) like the other keyset lists.
+
+        Args:
+            text: Search terms, in the `$text` syntax (phrases, negations)
+            query: Other filters, on the same `$match` as the text search
+            limit: Page size, one more document is read to build the next cursor
+            cursor: Keyset cursor, None or empty for the first page
+            projection: Projection of the returned documents, it must keep the rank
+
+        Returns:
+            Pipeline returning up to limit + 1 jobs with their rank
+        """
+        tau = SEARCH_FRESHNESS_HALF_LIFE_DAYS * 86400000 / math.log(2)
+        pipeline = [
+            {"$match": {"$text": {"$search": text}, **query}},
+            {"$addFields": {self.SEARCH_RANK: {"$add": [
+                {"$ln": {"$meta": "textScore"}},
+                {"$divide": [{"$toLong": {"$ifNull": [f"${JobModel.createdAt}", 0]}}, tau]},
+            ]}}},
+        ]
+        # Projecting before the sort keeps the descriptions out of its memory
+        if projection:
+            pipeline.append({"$project": projection})
+        pipeline.append({"$sort": dict(Pagination.sort(self.SEARCH_RANK))})
+        if cursor:
+            pipeline.append({"$match": Pagination.seek(self.SEARCH_RANK, cursor)})
+        pipeline.append({"$limit": limit + 1})
+        return pipeline
+
+    @staticmethod
+    def derive(document: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Set the fields derived from a new serialized job, in place, before it is written
+
+        The location is geocoded with the bundled gazetteer, None when it names no known
+        place, the skills are normalized for matching and the title and description
+        terms weighed for the similar jobs. Shared by the create path, `manage.py import`
+        and `manage.py seed-jobs`.
+        """
+        document[JobSchema.LOCATION_POINT] = Gazetteer.geocode(document.get(JobModel.location))
+        document[JobSchema.SKILL_TERMS] = JobSchema.skill_terms(document.get(JobModel.skills))
+        terms = JobSchema.similar_terms(document)
+        document[JobSchema.SIMILAR_TERMS] = list(terms)
+        document[JobSchema.SIMILAR_TF] = terms
+        return document
+
+    @staticmethod
+    def fold(text: str) -> str:
+        """Fold the accents and the case of a text"""
+        folded = unicodedata.normalize("NFKD", text)
+        return "".join(char for char in folded if not unicodedata.combining(char)).casefold()
+
+    @staticmethod
+    def skill_terms(skills: Optional[List[str]]) -> List[str]:
+        """
+        Normalize skills for an exact match, each skill kept whole
+
+        Accents and case are folded and whitespace collapsed, punctuation is kept so
+        `C++`, `C#` and `C` stay three different skills.
+
+        Args:
+            skills: Skills as written by the job author or the candidat
+
+        Returns:
+            Normalized skills, deduplicated, in their first order
+        """
+        terms = []
+        for skill in skills or []:
+            term = " ".join(JobSchema.fold(str(skill)).split())
+            if term and term not in terms:
+                terms.append(term)
+        return terms
+
+    def match_pipeline(
+        self,
+        weights: Dict[str, float],
+        query: Dict[str, Any],
+        limit: int,
+        cursor: Optional[str] = None,
+        projection: Optional[Dict[str, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Build the aggregation of one page of the jobs sharing skills with a candidat
+
+        The `$in` walks the multikey (skillTerms, status, createdAt) index newest first
+        and stops after MATCH_CANDIDATES jobs, so a request scores a bounded set however
+        common its skills are. Each job is ranked by the summed weights of the skills it
+        shares, rare skills weighing more, and pages are seeked on (rank, _id).
+
+        Args:
+            weights: Weight of each normalized skill of the candidat, see skill_terms
+            query: Other filters, on the same `$match`
+            limit: Page size, one more document is read to build the next cursor
+            cursor: Keyset cursor, None or empty for the first page
+            projection: Projection of the returned documents, it must keep the rank
+
+        Returns:
+            Pipeline returning up to limit + 1 jobs with their match rank
+        """
+        pipeline = [
+            {"$match": {self.SKILL_TERMS: {"$in": list(weights)}, **query}},
+            {"$sort": {JobModel.createdAt: -1, "_id": -1}},
+            {"$limit": MATCH_CANDIDATES},
+            {"$addFields": {self.MATCH_RANK: {"$add": [
+                {"$cond": [{"$in": [{"$literal": term}, f"${self.SKILL_TERMS}"]}, weight, 0]}
+                for term, weight in weights.items()
+            ]}}},
+        ]
+        if projection:
+            pipeline.append({"$project": projection})
+        pipeline.append({"$sort": dict(Pagination.sort(self.MATCH_RANK))})
+        if cursor:
+            pipeline.append({"$match": Pagination.seek(self.MATCH_RANK, cursor)})
+        pipeline.append({"$limit": limit + 1})
+        return pipeline
+
+    def near_pipeline(
+        self,
+        point: Dict[str, Any],
+        radius_km: float,
+        query: Dict[str, Any],
+        filters: Filters,
+        projection: Optional[Dict[str, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Build the aggregation of one page of the jobs within a radius, nearest first
+
+        `$geoNear` walks the 2dsphere index outwards from the point. Jobs of the same
+        place share its point, so `_id` breaks the ties and the pages are seeked on
+        (distance ascending, _id descending).
+
+        Args:
+            point: GeoJSON point to search around
+            radius_km: Largest distance, in kilometers
+            query: Other filters, applied by `$geoNear` on the index scan
+            filters: Filters holding skip, limit, the optional cursor and the total mode
+            projection: Projection of the returned documents, it must keep the distance
+
+        Returns:
+            Pipeline returning up to limit + 1 jobs, with the total in a `$facet` when exact
+        """
+        distance = self.NEAR_DISTANCE
+        pipeline = [
+            {"$geoNear": {
+                "near": point,
+                "key": self.LOCATION_POINT,
+                "distanceField": distance,
+                "distanceMultiplier": 0.001,
+                "maxDistance": radius_km * 1000,
+                "spherical": True,
+                "query": query,
+            }},
+        ]
+        if projection:
+            pipeline.append({"$project": projection})
+        pipeline.append({"$sort": {distance: ASCENDING, "_id": DESCENDING}})
+
+        results = []
+        if filters.cursor:
+            value, _id = Pagination.decode_cursor(filters.cursor)
+            results.append({"$match": {"$or": [
+                {distance: {"$gt": value}},
+                {distance: value, "_id": {"$lt": _id}},
+            ]}})
+        if Pagination.skip(filters):
+            results.append({"$skip": Pagination.skip(filters)})
+        results.append({"$limit": filters.limit + 1})
+
+        if filters.include_total == Filters.TOTAL_EXACT:
+            return pipeline + [{"$facet": {"total": [{"$count": "count"}], "results": results}}]
+        return pipeline + results
+
+    def facets_pipeline(self, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Build the aggregation counting the jobs matching a query by value of each facet
+
+        The jobs are matched once and every facet is grouped in the same `$facet`,
+        most frequent values first and at most FACETS_MAX_VALUES of them.
+
+        Args:
+            query: Filters of the list
+
+        Returns:
+            Pipeline returning one document with the total and the groups of each facet
+        """
+        branches = {
+            facet: [
+                {"$group": {"_id": f"${facet}", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}},
+                {"$limit": FACETS_MAX_VALUES},
+            ]
+            for facet in self.facets
+        }
+        return [
+            {"$match": query},
+            {"$project": {facet: 1 for facet in self.facets}},
+            {"$facet": {"total": [{"$count": "count"}], **branches}},
+        ]
+
+    @staticmethod
+    def similar_terms(job: Dict[str, Any]) -> Dict[str, float]:
+        """
+        Weigh the terms of the title and description of a job
+
+        Words are folded like the skills, split on anything but letters and digits so a
+        term is a valid field name, and the stop words and words under three characters
+        are dropped. Title words count SIMILAR_TITLE_WEIGHT times; the weight of a term is
+        the sublinear frequency `1 + ln(tf)`.
+
+        Args:
+            job: Job document, with its title and description
+
+        Returns:
+            Weight by term, for the SIMILAR_JOBS_MAX_TERMS most frequent terms
+        """
+        counts = Counter()
+        texts = ((job.get(JobModel.title), JobSchema.SIMILAR_TITLE_WEIGHT), (job.get(JobModel.description), 1))
+        for text, weight in texts:
+            for term in re.findall(r"[a-z0-9]{3,}", JobSchema.fold(text or "")):
+                if term not in JobSchema.SIMILAR_STOP_WORDS:
+                    counts[term] += weight
+        return {term: round(1 + math.log(count), 4) for term, count in counts.most_common(SIMILAR_JOBS_MAX_TERMS)}
+
+    def similar_pipeline(self, job_id: Any, weights: Dict[str, float], norm: float, limit: int) -> List[Dict[str, Any]]:
+        """
+        Build the aggregation of the published jobs most similar to a job
+
+        The `$in` walks the multikey (similarTerms, status, createdAt) index newest first
+        and stops after SIMILAR_JOBS_CANDIDATES jobs sharing a term. Each candidate is
+        scored by the cosine of the TF-IDF vectors: the dot product sums the stored term
+        weights of the candidate times their coefficient, divided by both norms. A
+        candidate whose similar jobs were never computed has no norm yet and is given
+        the norm of the job.
+
+        Args:
+            job_id: ID of the job, left out of the results
+            weights: Coefficient of each term of the job, its TF-IDF weight times its idf
+            norm: Norm of the TF-IDF vector of the job
+            limit: Number of similar jobs
+
+        Returns:
+            Pipeline returning the ids of the similar jobs, best first
+        """
+        return [
+            {"$match": {
+                self.SIMILAR_TERMS: {"$in": list(weights)},
+                JobModel.status: OPEN_STATUS,
+                "_id": {"$ne": job_id},
+            }},
+            {"$sort": {JobModel.createdAt: -1, "_id": -1}},
+            {"$limit": SIMILAR_JOBS_CANDIDATES},
+            {"$project": {self.SIMILAR_SCORE: {"$divide": [
+                {"$add": [
+                    {"$multiply": [weight, {"$ifNull": [f"${self.SIMILAR_TF}.{term}", 0]}]}
+                    for term, weight in weights.items()
+                ]},
+                {"$multiply": [norm, {"$ifNull": [f"${self.SIMILAR_NORM}", norm]}]},
+            ]}}},
+            {"$sort": {self.SIMILAR_SCORE: -1, "_id": -1}},
+            {"$limit": limit},
+            {"$project": {"_id": 1}},
+        ]
+
+    def entreprise_stats_pipeline(self, entreprise_id: str, since: datetime) -> List[Dict[str, Any]]:
+        """
+        Build the aggregation of the recruiting stats of an entreprise
+
+        One `$facet` over the jobs of the entreprise (`entrepriseId` index); the
+        application branches group on the server inside `$lookup`s matching the
+        `jobId` index, so no job or application is sent back.
+
+        Args:
+            entreprise_id: Entreprise ID
+            since: Start of the applications per day
+
+        Returns:
+            Pipeline returning one document of grouped counts
+        """
+        def lookup_applications(match: Dict[str, Any], group_key: Any) -> List[Dict[str, Any]]:
+            return [
+                {"$project": {"_id": 1}},
+                {"$lookup": {
+                    "from": application_schema.schema_name,
+                    "let": {"jobId": "$_id"},
+                    "pipeline": [
+                        {"$match": {
+                            "$expr": {"$eq": [f"${ApplicationModel.jobId}", "$$jobId"]},
+                            **match,
+                        }},
+                        {"$group": {"_id": group_key, "count": {"$sum": 1}}},
+                    ],
+                    "as": "groups",
+                }},
+                {"$unwind": "$groups"},
+                {"$group": {"_id": "$groups._id", "count": {"$sum": "$groups.count"}}},
+            ]
+
+        return [
+            {"$match": TypedQuery.compile(JobModel, {JobModel.entrepriseId: entreprise_id})},
+            {"$facet": {
+                "jobsByStatus": [{"$group": {"_id": f"${JobModel.status}", "count": {"$sum": 1}}}],
+                "jobsByContractType": [{"$group": {"_id": f"${JobModel.contractType}", "count": {"$sum": 1}}}],
+                "applicationsByStatus": lookup_applications({}, f"${ApplicationModel.status}"),
+                "applicationsPerDay": lookup_applications(
+                    {ApplicationModel.appliedAt: {"$gte": since}},
+                    {"$dateToString": {"format": "%Y-%m-%d", "date": f"${ApplicationModel.appliedAt}"}}
+                ),
+            }},
+        ]
+
+    @property
+    def native_collection(self):
+        """Blocking collection, resolved on the current client"""
+        return mongodb.get_collection(self.schema_name)
+
+    @property
+    def async_collection(self):
+        """Asyncio collection, resolved on the current client"""
+        return mongodb.get_async_collection(self.schema_name)
 
 
 job_schema = JobSchema()
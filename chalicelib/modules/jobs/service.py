@@ -1,41 +1,250 @@
-"""Job service layer for business logic"""
+"""Job service layer for `manage.py` and scripts, on the blocking client"""
 
-from typing import Any
-from datetime import datetime
-from bson import ObjectId
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId, json_util
 from pydantic import BaseModel
-from pymongoose import methods
+from pymongo import ReturnDocument, UpdateOne
+from ...common.helpers.bulk import Bulk
+from ...common.helpers.cache import TTLCache
+from ...common.helpers.counters import Counters
 from ...common.helpers.filters import Filters
-from .model import JobModel, JobModelResult
-from .schema import job_schema, JobSchema
-from ...common.exceptions.exception import JobAlreadyExistsException
+from ...common.helpers.gazetteer import Gazetteer
+from ...common.helpers.pagination import Page, Pagination
+from ...common.helpers.projection import Projection
+from ...common.helpers.typed_query import TypedQuery
+from ...config.settings import (
+    EXPORT_BATCH_SIZE, FACETS_CACHE_TTL, GEO_DEFAULT_RADIUS_KM, GEO_MAX_RADIUS_KM, LIFECYCLE_BATCH_SIZE,
+    SIMILAR_IDF_TTL, SIMILAR_JOBS_COUNT, SIMILAR_JOBS_TTL, SKILL_WEIGHTS_TTL
+)
+from .model import (
+    CLOSED_STATUS, DRAFT_STATUS, OPEN_STATUS,
+    JobModel, JobPartialModel, JobPatchModel, JobExpandedModel, JobFacetsModel, JobModelResult
+)
+from .schema import job_schema
+from ..applications.model import ApplicationModel
+from ..applications.schema import application_schema
+from ..entreprises.model import EntrepriseModel
+from ..entreprises.schema import entreprise_schema
+
+logger = logging.getLogger(__name__)
 
 
 class JobService:
     """Service class for job operations"""
 
+    # Facet counts by normalized query, dropped by every job write of the process
+    facets_cache = TTLCache(FACETS_CACHE_TTL)
+    # Job counts by query and skill, the document frequencies of the match weights
+    skill_weights_cache = TTLCache(SKILL_WEIGHTS_TTL, max_entries=16384)
+    # Published job counts by term, the document frequencies of the similar jobs TF-IDF vectors
+    similar_idf_cache = TTLCache(SIMILAR_IDF_TTL, max_entries=65536)
+
     def __init__(self):
         self.schema = job_schema
-        self.collection = job_schema.native_collection
+
+    @property
+    def collection(self):
+        """Collection of the schema on the current client"""
+        return self.schema.native_collection
+
+    @property
+    def entreprise_collection(self):
+        """Collection of the entreprises holding the open job counters"""
+        return entreprise_schema.native_collection
 
     def get_all_models(self, filters: Filters):
         """Get all jobs with filtering and pagination"""
         query = filters.apply()
-        total_count = self.collection.count_documents(query)
-        cursor = self.collection.find(
-            query,
-            limit=filters.limit,
-            skip=filters.skip,
-            sort={JobModel.createdAt: -1}
-        )
-        return JobModelResult(total=total_count, results=list(cursor))
+        projection = Projection.build(filters.fields, JobModel, self.schema.list_projection, JobModel.createdAt)
+        page = Pagination.find_page(self.collection, query, filters, JobModel.createdAt, projection)
+        return self._page_result(page, projection)
+
+    def export_models(self, filters: Filters, entreprise_id: Optional[str] = None):
+        """
+        Read jobs for an export, with a batched cursor instead of pages
+
+        Args:
+            filters: Filters of the list, `fields` selects the exported fields
+            entreprise_id: Only export the jobs of this entreprise
+
+        Returns:
+            Tuple of (projection of the read, iterator of jobs)
+        """
+        query = filters.apply()
+        if entreprise_id:
+            query[JobModel.entrepriseId] = entreprise_id
+        query = TypedQuery.compile(JobModel, query)
+        projection = Projection.build(filters.fields, JobModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection).sort(
+            {JobModel.createdAt: -1}
+        ).batch_size(EXPORT_BATCH_SIZE)
+        model = Projection.model(projection, JobModel, JobPartialModel)
+        return projection, (model.model_validate(document) for document in cursor)
 
-    def get_model(self, _id: str):
+    def get_model(self, _id: str, fields: Optional[List[str]] = None):
         """Get job by ID"""
-        result = self.collection.find_one({"_id": ObjectId(_id)})
+        projection = Projection.build(fields, JobModel)
+        result = self.collection.find_one({"_id": ObjectId(_id)}, projection)
         if not result:
             return None
-        return JobModel.model_validate(result)
+        return Projection.model(projection, JobModel, JobPartialModel).model_validate(result)
+
+    def get_expanded(self, _id: str, expand: List[str], fields: Optional[List[str]] = None):
+        """
+        Get a job with its expansions in one aggregation
+
+        Args:
+            _id: Job ID
+            expand: Expansions to embed (entreprise, stats)
+            fields: Job fields to return, None for all
+
+        Returns:
+            The expanded job, or None when it does not exist
+        """
+        projection = Projection.build(fields, JobModel)
+        pipeline = [{"$match": {"_id": ObjectId(_id)}}, *self.schema.expand_stages(expand)]
+        if projection:
+            pipeline.append({"$project": {**projection, **{name: 1 for name in expand}}})
+        aggregation = self.collection.aggregate(pipeline)
+        result = next(aggregation, None)
+        if not result:
+            return None
+        return JobExpandedModel.model_validate(result)
+
+    def get_facets(self, filters: Filters = None, entreprise_id: Optional[str] = None):
+        """
+        Count the jobs matching the list filters by contract type, remote, location and status
+
+        Args:
+            filters: Filters of the list
+            entreprise_id: Only count the jobs of this entreprise
+
+        Returns:
+            The counts of every facet, from one aggregation or the cache
+        """
+        if filters is None:
+            filters = Filters()
+        query = filters.apply()
+        if entreprise_id:
+            query[JobModel.entrepriseId] = entreprise_id
+        query = TypedQuery.compile(JobModel, query)
+
+        key = json_util.dumps(query, sort_keys=True)
+        facets = self.facets_cache.get(key)
+        if facets is not None:
+            return facets
+        aggregation = self.collection.aggregate(self.schema.facets_pipeline(query))
+        facets = self._facets_result(next(aggregation, None) or {})
+        self.facets_cache.set(key, facets)
+        return facets
+
+    def _facets_result(self, facet: dict) -> JobFacetsModel:
+        """Build the facet counts from the `$facet` document, booleans are keyed true and false"""
+        total = facet.get("total") or [{"count": 0}]
+        return JobFacetsModel(total=total[0]["count"], **{
+            name: {
+                json_util.dumps(group["_id"]) if isinstance(group["_id"], bool) else str(group["_id"]): group["count"]
+                for group in facet.get(name, []) if group["_id"] is not None
+            }
+            for name in self.schema.facets
+        })
+
+    def get_similar(self, _id: str, limit: int = SIMILAR_JOBS_COUNT, fields: Optional[List[str]] = None):
+        """
+        Get the published jobs most similar to a job, best first
+
+        The ids of the similar jobs are computed once by TF-IDF cosine, see
+        _similar_fields, and stored on the job, then served until they are older than
+        SIMILAR_JOBS_TTL, so a request costs two reads by _id. `manage.py refresh-similar`
+        computes them ahead.
+
+        Args:
+            _id: Job ID
+            limit: Number of similar jobs, at most SIMILAR_JOBS_COUNT
+            fields: Fields of the similar jobs to return
+
+        Returns:
+            The similar jobs, or None when the job does not exist
+        """
+        if not 1 <= limit <= SIMILAR_JOBS_COUNT:
+            raise ValueError(f"limit must be between 1 and {SIMILAR_JOBS_COUNT}")
+        job = self.collection.find_one({"_id": ObjectId(_id)}, self._similar_projection())
+        if not job:
+            return None
+        similar_ids = job.get(self.schema.SIMILAR_IDS)
+        if similar_ids is None or self._similar_stale(job):
+            similar = self._similar_fields(job)
+            similar_ids = similar[self.schema.SIMILAR_IDS]
+            self.collection.update_one(
+                {"_id": job["_id"]},
+                {"$set": {**similar, self.schema.SIMILAR_AT: datetime.now(timezone.utc)}}
+            )
+
+        # Jobs closed since the ids were stored are left out
+        similar_ids = similar_ids[:limit]
+        query = {"_id": {"$in": similar_ids}, JobModel.status: OPEN_STATUS}
+        projection = Projection.build(fields, JobModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection)
+        documents = {document["_id"]: document for document in cursor}
+        results = [documents[similar_id] for similar_id in similar_ids if similar_id in documents]
+        return self._page_result(Page(None, False, results, None), projection)
+
+    def _similar_projection(self) -> dict:
+        """Fields read to compute the similar jobs of a job, or to serve the stored ones"""
+        return {
+            JobModel.title: 1,
+            JobModel.description: 1,
+            self.schema.SIMILAR_IDS: 1,
+            self.schema.SIMILAR_AT: 1,
+        }
+
+    def _similar_stale(self, job: dict) -> bool:
+        """Tell stored similar jobs older than SIMILAR_JOBS_TTL"""
+        computed_at = job.get(self.schema.SIMILAR_AT)
+        if computed_at is None:
+            return True
+        if computed_at.tzinfo is None:
+            computed_at = computed_at.replace(tzinfo=timezone.utc)
+        return computed_at < datetime.now(timezone.utc) - timedelta(seconds=SIMILAR_JOBS_TTL)
+
+    def _similar_fields(self, job: dict) -> dict:
+        """
+        Compute the published jobs most similar to a job, with its term weights and norm
+
+        The terms are weighed again from the title and description, so a patched job is
+        stored and scored with its new text. A term weighs its sublinear frequency times
+        its idf among the published jobs, counted on the similarTerms index and cached
+        for SIMILAR_IDF_TTL seconds, so only the refreshed jobs are computed again while
+        the frequencies follow the writes.
+
+        Returns:
+            Fields to set on the job, but similarAt
+        """
+        terms = self.schema.similar_terms(job)
+        total, frequencies = self._frequencies(
+            self.similar_idf_cache, self.schema.SIMILAR_TERMS, list(terms), {JobModel.status: OPEN_STATUS}
+        )
+        idf = {term: self._idf(total, count) for term, count in frequencies.items()}
+        norm = math.sqrt(sum((weight * idf[term]) ** 2 for term, weight in terms.items()))
+
+        # A term no published job carries adds nothing to the dot products
+        coefficients = {term: weight * idf[term] ** 2 for term, weight in terms.items() if frequencies[term]}
+        similar_ids = []
+        if coefficients:
+            pipeline = self.schema.similar_pipeline(job["_id"], coefficients, norm, SIMILAR_JOBS_COUNT)
+            aggregation = self.collection.aggregate(pipeline)
+            similar_ids = [document["_id"] for document in aggregation]
+        return {
+            self.schema.SIMILAR_IDS: similar_ids,
+            self.schema.SIMILAR_TERMS: list(terms),
+            self.schema.SIMILAR_TF: terms,
+            self.schema.SIMILAR_NORM: norm,
+        }
 
     def get_by_entreprise(self, entreprise_id: str, filters: Filters = None):
         """Get all jobs for a specific entreprise"""
@@ -43,17 +252,12 @@ class JobService:
             filters = Filters()
         # Add entreprise filter to existing filters
         query = filters.apply()
-        # Store as string since ObjectIdStr serializes to string in MongoDB
         query[JobModel.entrepriseId] = entreprise_id
-        
-        total_count = self.collection.count_documents(query)
-        cursor = self.collection.find(
-            query,
-            limit=filters.limit,
-            skip=filters.skip,
-            sort={JobModel.createdAt: -1}
-        )
-        return JobModelResult(total=total_count, results=list(cursor))
+        query = TypedQuery.compile(JobModel, query)
+
+        projection = Projection.build(filters.fields, JobModel, self.schema.list_projection, JobModel.createdAt)
+        page = Pagination.find_page(self.collection, query, filters, JobModel.createdAt, projection)
+        return self._page_result(page, projection)
 
     def get_by_status(self, status: str, filters: Filters = None):
         """Get all jobs with a specific status"""
@@ -61,141 +265,487 @@ class JobService:
             filters = Filters()
         query = filters.apply()
         query[JobModel.status] = status
-        
-        total_count = self.collection.count_documents(query)
-        cursor = self.collection.find(
-            query,
-            limit=filters.limit,
-            skip=filters.skip,
-            sort={JobModel.createdAt: -1}
-        )
-        return JobModelResult(total=total_count, results=list(cursor))
+
+        projection = Projection.build(filters.fields, JobModel, self.schema.list_projection, JobModel.createdAt)
+        page = Pagination.find_page(self.collection, query, filters, JobModel.createdAt, projection)
+        return self._page_result(page, projection)
+
+    def get_near(
+        self,
+        near: str,
+        radius_km: Optional[float] = None,
+        filters: Filters = None,
+        entreprise_id: Optional[str] = None
+    ):
+        """
+        Get the jobs located within a radius of a place, nearest first
+
+        Args:
+            near: "latitude,longitude" or a place name of the gazetteer
+            radius_km: Largest distance, GEO_DEFAULT_RADIUS_KM when None
+            filters: Filters of the list
+            entreprise_id: Only get the jobs of this entreprise
+
+        Returns:
+            One page of jobs
+        """
+        point = Gazetteer.parse(near)
+        if radius_km is None:
+            radius_km = GEO_DEFAULT_RADIUS_KM
+        if not 0 < radius_km <= GEO_MAX_RADIUS_KM:
+            raise ValueError(f"radiusKm must be greater than 0 and at most {GEO_MAX_RADIUS_KM:g}")
+        if filters is None:
+            filters = Filters()
+        query = filters.apply()
+        if entreprise_id:
+            query[JobModel.entrepriseId] = entreprise_id
+        query = TypedQuery.compile(JobModel, query)
+
+        distance = self.schema.NEAR_DISTANCE
+        projection = Projection.build(filters.fields, JobModel, self.schema.list_projection, distance)
+        pipeline = self.schema.near_pipeline(point, radius_km, query, filters, projection)
+        aggregation = self.collection.aggregate(pipeline)
+        if filters.include_total == Filters.TOTAL_EXACT:
+            page = Pagination.facet_page(next(aggregation, None), filters, distance)
+        else:
+            documents, next_cursor = Pagination.split_page(list(aggregation), filters, distance)
+            total_count = None
+            if filters.include_total == Filters.TOTAL_ESTIMATED:
+                within = Gazetteer.within(self.schema.LOCATION_POINT, point, radius_km)
+                total_count = Pagination.estimated_total(self.collection, {**query, **within})
+            page = Page(total_count, False, documents, next_cursor)
+        return self._page_result(page, projection)
+
+    def search(self, text: str, filters: Filters = None, entreprise_id: Optional[str] = None):
+        """
+        Full-text search of jobs, by relevance boosted by freshness
+
+        Pages are always keyset pages on the rank and come without total, counting
+        every match would cost as much as ranking them.
+
+        Args:
+            text: Search terms
+            filters: Filters of the list (status, fields, limit, cursor)
+            entreprise_id: Only search the jobs of this entreprise
+
+        Returns:
+            One page of jobs, best match first
+        """
+        if not text or not text.strip():
+            raise ValueError("q is required")
+        if filters is None:
+            filters = Filters()
+        query = filters.apply()
+        if entreprise_id:
+            query[JobModel.entrepriseId] = entreprise_id
+        query = TypedQuery.compile(JobModel, query)
+
+        rank = self.schema.SEARCH_RANK
+        projection = Projection.build(filters.fields, JobModel, self.schema.list_projection, rank)
+        pipeline = self.schema.search_pipeline(text.strip(), query, filters.limit, filters.cursor, projection)
+        aggregation = self.collection.aggregate(pipeline)
+        documents, next_cursor = Pagination.split_page(list(aggregation), filters, rank)
+        return self._page_result(Page(None, False, documents, next_cursor), projection)
+
+    def match_skills(self, skills: Optional[List[str]], filters: Filters = None):
+        """
+        Jobs sharing skills with a list, the jobs sharing the most and the rarest first
+
+        Skills are compared whole once normalized, pages are keyset pages on the summed
+        weights of the matched skills and come without total.
+
+        Args:
+            skills: Skills to match, as written
+            filters: Filters of the list (status, fields, limit, cursor)
+
+        Returns:
+            One page of jobs, best match first
+        """
+        if filters is None:
+            filters = Filters()
+        query = TypedQuery.compile(JobModel, filters.apply())
+        weights = self.skill_weights(self.schema.skill_terms(skills), query)
+        if not weights:
+            return JobModelResult(totalExact=False, results=[])
+
+        rank = self.schema.MATCH_RANK
+        projection = Projection.build(filters.fields, JobModel, self.schema.list_projection, rank)
+        pipeline = self.schema.match_pipeline(weights, query, filters.limit, filters.cursor, projection)
+        aggregation = self.collection.aggregate(pipeline)
+        documents, next_cursor = Pagination.split_page(list(aggregation), filters, rank)
+        return self._page_result(Page(None, False, documents, next_cursor), projection)
+
+    def skill_weights(self, terms: List[str], query: dict) -> dict:
+        """
+        Rarity weight of normalized skills among the jobs of a query
+
+        The weight is the smoothed inverse document frequency of the skill, see _idf,
+        counted on the skillTerms index and cached for SKILL_WEIGHTS_TTL seconds.
+
+        Returns:
+            Weight by skill, without the skills no job carries
+        """
+        total, frequencies = self._frequencies(self.skill_weights_cache, self.schema.SKILL_TERMS, terms, query)
+        return {term: self._idf(total, count) for term, count in frequencies.items() if count}
+
+    def _frequencies(self, cache: TTLCache, field: str, terms: List[str], query: dict):
+        """
+        Count the jobs of a query, and among them the jobs carrying each term of a multikey field
+
+        Each count runs on the index of the field and is cached.
+
+        Returns:
+            Number of jobs, and number of jobs by term
+        """
+        base = json_util.dumps(query, sort_keys=True)
+
+        def frequency(term: Optional[str]) -> int:
+            key = (base, term)
+            count = cache.get(key)
+            if count is None:
+                counted = {**query, field: term} if term else query
+                count = self.collection.count_documents(counted)
+                cache.set(key, count)
+            return count
+
+        return frequency(None), {term: frequency(term) for term in terms}
+
+    @staticmethod
+    def _idf(total: int, count: int) -> float:
+        """Smoothed inverse document frequency `ln((N + 1) / (df + 1)) + 1` of a term carried by count of total jobs"""
+        return math.log((total + 1) / (count + 1)) + 1
 
     def add_model(self, model: JobModel):
         """Create a new job"""
-        # Serialize the model
-        serialized_data = model.model_dump(exclude_none=True)
+        serialized_data = self._serialize_new(model)
+
+        # Insert into MongoDB collection
+        result = self.collection.insert_one(serialized_data)
+        self._update_counters([(None, serialized_data)])
+
+        # Build the created object from the inserted data instead of reading it back
+        return JobModel.model_validate({**serialized_data, "_id": result.inserted_id})
+
+    def add_models(self, items: List[Any]):
+        """
+        Create jobs with one unordered insert_many
+
+        Args:
+            items: Raw items, validated one by one
+
+        Returns:
+            One result per item, with the new id or the error
+        """
+        models, errors = Bulk.validate(items, JobModel)
+        documents = [(index, self._serialize_new(model)) for index, model in models]
+        results = Bulk.insert_many(self.collection, documents)
+        inserted = {result["index"] for result in results if "id" in result}
+        self._update_counters([(None, document) for index, document in documents if index in inserted])
+        return errors + results
+
+    def _serialize_new(self, model: JobModel) -> dict:
+        """Serialize a new job with its creation metadata"""
+        serialized_data = TypedQuery.document(JobModel, model.model_dump(exclude_none=True))
+
+        # Geocoded location and normalized skills
+        self.schema.derive(serialized_data)
 
         # Add creation metadata
-        serialized_data[JobModel.createdAt] = datetime.utcnow()
+        serialized_data[JobModel.createdAt] = datetime.now(timezone.utc)
 
-        # Insert into MongoDB collection
-        inserted_id = methods.insert_one(JobSchema.schema_name, serialized_data)
-
-        # Return the complete object after insertion
-        return self.get_model(inserted_id)
-
-    def update_title(self, _id: str, title: str):
-        """Update job's title"""
-        if not title:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {JobModel.title: title}}
-        )
+        # Counters start empty and only follow application writes
+        serialized_data[JobModel.applicationCount] = 0
+        serialized_data[JobModel.applicationCountByStatus] = {}
 
-    def update_description(self, _id: str, description: str):
-        """Update job's description"""
-        if description is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {JobModel.description: description}}
-        )
+        return serialized_data
 
-    def update_location(self, _id: str, location: str):
-        """Update job's location"""
-        if location is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {JobModel.location: location}}
-        )
+    def _patch_fields(self, patch_model: BaseModel) -> dict:
+        """Serialize the fields set by a patch, a changed location is geocoded again and changed skills normalized"""
+        fields = TypedQuery.document(JobModel, patch_model.model_dump(exclude_none=True))
+        if JobModel.skills in fields:
+            fields[self.schema.SKILL_TERMS] = self.schema.skill_terms(fields[JobModel.skills])
+        return Gazetteer.document(fields, JobModel.location, self.schema.LOCATION_POINT)
 
-    def update_contract_type(self, _id: str, contract_type: str):
-        """Update job's contract type"""
-        if contract_type is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {JobModel.contractType: contract_type}}
-        )
+    def _patch_update(self, fields: dict) -> list:
+        """
+        Update pipeline applying a patch
 
-    def update_remote(self, _id: str, remote: bool):
-        """Update job's remote status"""
-        if remote is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {JobModel.remote: remote}}
-        )
+        A title or description that actually changes makes the stored similar jobs
+        stale, so similarAt is dropped, compared against the values before the `$set`.
+        Values are wrapped in `$literal`, a string starting with `$` is not a field path.
+        """
+        update = [{"$set": {field: {"$literal": value} for field, value in fields.items()}}]
+        text_fields = [field for field in (JobModel.title, JobModel.description) if field in fields]
+        if text_fields:
+            similar_at = self.schema.SIMILAR_AT
+            changed = {"$or": [{"$ne": [f"${field}", {"$literal": fields[field]}]} for field in text_fields]}
+            update.insert(0, {"$set": {similar_at: {"$cond": [changed, "$$REMOVE", f"${similar_at}"]}}})
+        return update
+
+    def patch_model(self, _id: str, patch_model: BaseModel):
+        """
+        Apply a partial update in one round trip
 
-    def update_salary_range(self, _id: str, salary_range: str):
-        """Update job's salary range"""
-        if salary_range is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {JobModel.salaryRange: salary_range}}
+        The filter only matches when a field differs, so the "no changes" check is
+        done by the database and an unchanged job is not written.
+
+        Args:
+            _id: Job ID
+            patch_model: Patch model, None fields are left untouched
+
+        Returns:
+            The updated job, or None when it does not exist or nothing changed
+        """
+        # The document is read before the update, so the counters follow the change
+        fields = self._patch_fields(patch_model)
+        if not fields:
+            return None
+        before = self.collection.find_one_and_update(
+            {"_id": ObjectId(_id), **Filters.changed_filter(fields)},
+            self._patch_update(fields),
+            return_document=ReturnDocument.BEFORE
         )
+        if not before:
+            return None
+        result = {**before, **fields}
+        self._update_counters([(before, result)])
+        return JobModel.model_validate(result)
+
+    def exists(self, _id: str) -> bool:
+        """Check if a job exists"""
+        result = self.collection.find_one({"_id": ObjectId(_id)}, {"_id": 1})
+        return result is not None
 
-    def update_entreprise_id(self, _id: str, entreprise_id: str):
-        """Update job's entreprise"""
-        if entreprise_id is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {JobModel.entrepriseId: entreprise_id}}
+    def delete_model(self, _id: str):
+        """Hard delete a job"""
+        before = self.collection.find_one_and_delete(
+            {"_id": ObjectId(_id)},
+            projection=Bulk.projection([], [JobModel.entrepriseId, JobModel.status])
         )
+        if not before:
+            return 0
+        self._update_counters([(before, None)])
+        return 1
+
+    def patch_models(self, items: List[Any]):
+        """
+        Apply partial updates, one find_one_and_update per job
+
+        Args:
+            items: Raw {id, patch} items, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        patches, errors = Bulk.validate_patches(items, JobPatchModel)
+        targets = [(index, _id, self._patch_fields(patch)) for index, _id, patch in patches]
+        results, changed = Bulk.write_each(targets, self._patch_one)
+        self._update_counters(changed)
+        return errors + results
 
-    def update_status(self, _id: str, status: str):
-        """Update job's status"""
-        if status is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {JobModel.status: status}}
+    def _patch_one(self, _id: ObjectId, fields: dict):
+        """Patch a job of a bulk patch, returning the fields it had before"""
+        before = self.collection.find_one_and_update(
+            {"_id": _id, **Filters.changed_filter(fields)},
+            self._patch_update(fields),
+            projection=Bulk.projection([(None, _id, fields)], [JobModel.entrepriseId, JobModel.status])
         )
+        if before is None and self.exists(str(_id)):
+            # Matched but already up to date: reported as not modified, and not written
+            return {"_id": _id, **fields}
+        return before
 
-    def update_expires_at(self, _id: str, expires_at: datetime):
-        """Update job's expiration date"""
-        if expires_at is None:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id},
-            {"$set": {JobModel.expiresAt: expires_at}}
+    def delete_models(self, items: List[Any]):
+        """
+        Hard delete jobs, one find_one_and_delete per job
+
+        Args:
+            items: Raw job ids, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        ids, errors = Bulk.validate_ids(items)
+        targets = [(index, _id, None) for index, _id in ids]
+        results, changed = Bulk.write_each(targets, self._delete_one)
+        self._update_counters(changed)
+        return errors + results
+
+    def _delete_one(self, _id: ObjectId, _fields: None):
+        """Delete a job of a bulk delete, returning the fields its counters need"""
+        return self.collection.find_one_and_delete(
+            {"_id": _id},
+            projection=Bulk.projection([], [JobModel.entrepriseId, JobModel.status])
         )
 
-    def delete_model(self, _id: str):
-        """Hard delete a job"""
-        obj_id = ObjectId(_id)
-        result = self.collection.delete_one({"_id": obj_id})
-        return result.deleted_count
-
-    def check_changes(self, existing_job_model: BaseModel, job_patch_model: BaseModel) -> bool:
-        """Check if there are any changes between existing and patch models"""
-        for field in job_patch_model.model_fields_set:
-            new_val = getattr(job_patch_model, field)
-            old_val = getattr(existing_job_model, field, None)
-            if self._to_plain(new_val) != self._to_plain(old_val):
-                return True
-        return False
-
-    def _to_plain(self, value: Any) -> Any:
-        """Convert value to plain representation for comparison"""
-        if isinstance(value, BaseModel):
-            return value.model_dump(exclude_none=True)
-        if isinstance(value, dict):
-            return {k: self._to_plain(v) for k, v in value.items()}
-        if isinstance(value, (list, tuple)):
-            return [self._to_plain(v) for v in value]
-        return value
+    def _counters(self, document: dict) -> dict:
+        """Counters of its entreprise a job contributes to"""
+        if document.get(JobModel.status) != OPEN_STATUS:
+            return {}
+        return {EntrepriseModel.openJobCount: 1}
+
+    def _update_counters(self, pairs):
+        """Apply the counter changes of written jobs to their entreprises, and drop the cached facets"""
+        if pairs:
+            self.facets_cache.clear()
+        increments = Counters.changes(pairs, JobModel.entrepriseId, self._counters)
+        Counters.apply(self.entreprise_collection, increments)
+
+    def refresh_similar(self, batch_size: int = 500, workers: int = 8, refresh_all: bool = False):
+        """
+        Compute and store the similar jobs of the published jobs
+
+        Jobs are walked in `_id` order; the scoring aggregations of a batch run in a
+        pool of `workers` threads, and their results are written with one unordered
+        bulk_write. Without refresh_all only the jobs without fresh similar
+        jobs are computed: the new ones, the patched ones and the stale ones.
+
+        Args:
+            batch_size: Jobs read and written per batch
+            workers: Scoring aggregations run in parallel
+            refresh_all: Also refresh the jobs whose similar jobs are not stale yet
+
+        Returns:
+            Number of refreshed jobs, elapsed seconds and jobs per second
+        """
+        started = time.monotonic()
+        query = {JobModel.status: OPEN_STATUS}
+        if not refresh_all:
+            stale_before = datetime.now(timezone.utc) - timedelta(seconds=SIMILAR_JOBS_TTL)
+            query["$or"] = [{self.schema.SIMILAR_AT: None}, {self.schema.SIMILAR_AT: {"$lt": stale_before}}]
+        refreshed, last_id = 0, None
+        with ThreadPoolExecutor(workers) as pool:
+            while True:
+                batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+                cursor = self.collection.find(
+                    batch_query, self._similar_projection(), sort=[("_id", 1)], limit=batch_size
+                )
+                jobs = list(cursor)
+                if not jobs:
+                    break
+                last_id = jobs[-1]["_id"]
+                results = list(pool.map(self._similar_fields, jobs))
+                now = datetime.now(timezone.utc)
+                self.collection.bulk_write([
+                    UpdateOne({"_id": job["_id"]}, {"$set": {**fields, self.schema.SIMILAR_AT: now}})
+                    for job, fields in zip(jobs, results)
+                ], ordered=False)
+                refreshed += len(jobs)
+        elapsed = time.monotonic() - started
+        per_second = round(refreshed / elapsed, 1) if elapsed else 0.0
+        return {"refreshed": refreshed, "seconds": round(elapsed, 1), "perSecond": per_second}
+
+    def normalize_skills(self, batch_size: int = 1000, refresh_all: bool = False):
+        """
+        Store the normalized skills of the jobs written without them
+
+        Jobs are walked in `_id` order and each batch is written with one unordered
+        bulk_write, like `Gazetteer.backfill` for the location points.
+
+        Args:
+            batch_size: Jobs read and written per batch
+            refresh_all: Also normalize the jobs that already went through it
+
+        Returns:
+            Number of jobs checked, and of those with skills
+        """
+        query = {} if refresh_all else {self.schema.SKILL_TERMS: {"$exists": False}}
+        checked, with_skills, last_id = 0, 0, None
+        while True:
+            batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+            cursor = self.collection.find(batch_query, {JobModel.skills: 1}, sort=[("_id", 1)], limit=batch_size)
+            jobs = list(cursor)
+            if not jobs:
+                break
+            last_id = jobs[-1]["_id"]
+            operations = []
+            for job in jobs:
+                terms = self.schema.skill_terms(job.get(JobModel.skills))
+                with_skills += bool(terms)
+                operations.append(UpdateOne({"_id": job["_id"]}, {"$set": {self.schema.SKILL_TERMS: terms}}))
+            self.collection.bulk_write(operations, ordered=False)
+            checked += len(jobs)
+        return {"checked": checked, "withSkills": with_skills}
+
+    def run_lifecycle(self, batch_size: int = LIFECYCLE_BATCH_SIZE) -> dict:
+        """
+        Publish the drafts whose publishAt has come, then close the published jobs past expiresAt
+
+        Drafts are published first, so one already past its expiresAt is closed by the
+        same run.
+
+        Args:
+            batch_size: Jobs moved per update_many
+
+        Returns:
+            Number of jobs published and expired
+        """
+        now = datetime.now(timezone.utc)
+        published = self._transition(DRAFT_STATUS, JobModel.publishAt, OPEN_STATUS, now, batch_size)
+        expired = self._transition(OPEN_STATUS, JobModel.expiresAt, CLOSED_STATUS, now, batch_size)
+        return {"published": published, "expired": expired}
+
+    def _transition(self, status: str, time_field: str, new_status: str, now: datetime, batch_size: int) -> int:
+        """
+        Move the jobs of a status whose time field has passed to a new status
+
+        Each batch is read on the (status, time field) index, then each job is moved
+        with its own find_one_and_update repeating the predicate, `BULK_WRITE_CONCURRENCY`
+        at a time. A job changed in between, e.g. closed by a PATCH, is left alone, and
+        the counters of the entreprises only follow the jobs actually moved.
+
+        Returns:
+            Number of jobs moved
+        """
+        query = {JobModel.status: status, time_field: {"$lte": now}}
+        projection = {JobModel.entrepriseId: 1, JobModel.status: 1}
+
+        def move(_id: ObjectId, fields: dict):
+            return self.collection.find_one_and_update(
+                {"_id": _id, **query}, {"$set": fields}, projection=projection
+            )
+
+        moved = 0
+        while True:
+            cursor = self.collection.find(query, {"_id": 1}, sort=[(time_field, 1)], limit=batch_size)
+            jobs = list(cursor)
+            if not jobs:
+                return moved
+            targets = [(index, job["_id"], {JobModel.status: new_status}) for index, job in enumerate(jobs)]
+            results, changed = Bulk.write_each(targets, move)
+            moved += len(changed)
+            self._update_counters(changed)
+            failed = [result for result in results if "error" in result]
+            for result in failed:
+                logger.error("Job %s not moved to %s: %s", jobs[result["index"]]["_id"], new_status, result["error"])
+            # Failed jobs would be read again by the next batch
+            if len(jobs) < batch_size or failed:
+                return moved
+
+    def reconcile_counters(self, batch_size: int = 500, dry_run: bool = False):
+        """Recompute the application counters of every job, rewriting the drifted ones"""
+        fields = [JobModel.applicationCount, JobModel.applicationCountByStatus]
+        return Counters.reconcile(self.collection, fields, self._recount, batch_size, dry_run)
+
+    def _recount(self, job_ids: List[ObjectId]) -> dict:
+        """Application counters of jobs, grouped from their live applications"""
+        by_status = {job_id: {} for job_id in job_ids}
+        aggregation = application_schema.native_collection.aggregate([
+            {"$match": {ApplicationModel.jobId: {"$in": job_ids}}},
+            {"$group": {
+                "_id": {"jobId": f"${ApplicationModel.jobId}", "status": f"${ApplicationModel.status}"},
+                "count": {"$sum": 1},
+            }},
+        ])
+        for group in aggregation:
+            by_status[group["_id"]["jobId"]][group["_id"]["status"]] = group["count"]
+        return {
+            job_id: {JobModel.applicationCount: sum(counts.values()), JobModel.applicationCountByStatus: counts}
+            for job_id, counts in by_status.items()
+        }
+
+    def _page_result(self, page, projection):
+        """Build the result of a page read with a projection"""
+        return JobModelResult(**page._replace(
+            results=Projection.validate(page.results, projection, JobModel, JobPartialModel)
+        )._asdict())
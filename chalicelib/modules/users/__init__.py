@@ -3,6 +3,7 @@
 from .model import UserModel, UserPatchModel, UserModelResult, Role, Status
 from .schema import user_schema, UserSchema
 from .service import UserService
+from .async_service import AsyncUserService
 from .controller import router as user_router
 
 __all__ = [
@@ -14,5 +15,6 @@ __all__ = [
     'user_schema',
     'UserSchema',
     'UserService',
+    'AsyncUserService',
     'user_router'
 ]
@@ -1,45 +1,88 @@
 """User controller for handling HTTP requests"""
 
 from http import HTTPStatus
+from typing import Any, List
 from fastapi import APIRouter, Query, Path, Body, status
 from fastapi.responses import JSONResponse, Response
-from .service import UserService
+from .async_service import AsyncUserService
 from ...common.enums.response_type_enum import ResponseTypeEnum
 from ...common.exceptions.exception import UserException
+from ...common.helpers.bulk import Bulk
 from ...common.helpers.error_middleware import exception_handler
+from ...common.helpers.export import Export
 from ...common.helpers.filters import Filters
 from ...common.helpers.message_response_helper import MessageResponseHelper
+from ...config.settings import BULK_MAX_ITEMS
 from .messages import Messages
-from .model import UserModel, UserPatchModel
+from .model import UserModel, UserPatchModel, Status
 
-service = UserService()
+service = AsyncUserService()
 router = APIRouter(prefix='/users', tags=['users'])
 
 
 @router.post('', status_code=status.HTTP_201_CREATED)
 @exception_handler
-def add(payload: UserModel):
+async def add(payload: UserModel):
     """Create a new user"""
-    inserted_model = service.add_model(payload)
+    inserted_model = await service.add_model(payload)
     return JSONResponse(
         content=inserted_model.model_dump(exclude_none=True, mode='json'),
         status_code=HTTPStatus.CREATED
     )
 
 
+@router.post('/bulk', status_code=status.HTTP_201_CREATED)
+@exception_handler
+async def add_bulk(payload: List[Any] = Body(...)):
+    """Create users in bulk, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise UserException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.add_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.CREATED)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.patch('/bulk')
+@exception_handler
+async def patch_bulk(payload: List[Any] = Body(...)):
+    """Partially update users in bulk from {id, patch} items, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise UserException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.patch_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
+@router.delete('/bulk')
+@exception_handler
+async def delete_bulk(payload: List[Any] = Body(...)):
+    """Move users to the archive in bulk from a list of ids, with a result per item"""
+    if not payload or len(payload) > BULK_MAX_ITEMS:
+        raise UserException(Messages.BULK_SIZE.format(max_items=BULK_MAX_ITEMS))
+
+    results = await service.delete_models(payload)
+    content, status_code = Bulk.response(results, HTTPStatus.OK)
+    return JSONResponse(content=content, status_code=status_code)
+
+
 @router.get('')
 @exception_handler
-def get_all_with_criteria(
+async def get_all_with_criteria(
     email: str = Query(None),
     role: str = Query(None),
     status: str = Query(None),
-    skip: int = Query(0),
-    limit: int = Query(100)
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: str = Query(None),
+    includeTotal: str = Query(Filters.TOTAL_EXACT),
+    fields: str = Query(None)
 ):
     """Get all users with filtering and pagination"""
     # If email is provided, get specific user
     if email:
-        model = service.get_by_email(email)
+        model = await service.get_by_email(email, Filters.parse_fields(fields))
         if model:
             return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
         else:
@@ -48,21 +91,64 @@ def get_all_with_criteria(
                 Messages.ERROR_NOT_FOUND)
             return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
     
-    criteria = Filters(role=role, status=status, email=email, skip=skip, limit=limit)
-    models = service.get_all_models(filters=criteria)
+    criteria = Filters(
+        role=role, status=status, email=email, skip=skip, limit=limit,
+        cursor=cursor, include_total=includeTotal, fields=fields
+    )
+    models = await service.get_all_models(filters=criteria)
     return JSONResponse(content=models.model_dump(exclude_none=True, mode='json'))
 
 
+@router.get('/export')
+@exception_handler
+async def export(
+    role: str = Query(None),
+    status: str = Query(None),
+    email: str = Query(None),
+    format: str = Query(Export.NDJSON),
+    fields: str = Query(None)
+):
+    """Stream the users matching the filters as NDJSON or CSV"""
+    export_format = Export.check_format(format)
+    criteria = Filters(role=role, status=status, email=email, fields=fields)
+    projection, models = await service.export_models(criteria)
+    return Export.response(models, export_format, Export.columns(projection, UserModel), 'users')
+
+
+@router.get('/purge')
+@exception_handler
+async def purge_progress():
+    """Progress of the purge of the users deleted for longer than their retention period"""
+    return JSONResponse(content=await service.purge().progress_async())
+
+
+@router.post('/purge')
+@exception_handler
+async def purge(dryRun: bool = Query(False)):
+    """Hard delete the users deleted for longer than their retention period, in the background"""
+    purge_run = service.purge()
+    if dryRun:
+        return JSONResponse(content=await purge_run.count_async())
+
+    if not await purge_run.start():
+        message_response = MessageResponseHelper.build(
+            ResponseTypeEnum.ERROR,
+            Messages.PURGE_RUNNING
+        )
+        return JSONResponse(content=message_response, status_code=HTTPStatus.CONFLICT)
+    return JSONResponse(content=await purge_run.progress_async(), status_code=HTTPStatus.ACCEPTED)
+
+
 @router.get('/{_id}')
 @exception_handler
-def get_by_id(_id: str = Path(...)):
+async def get_by_id(_id: str = Path(...), fields: str = Query(None)):
     """Get user by ID"""
     if not _id:
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.ERROR,
             Messages.REQUIRED_ID)
         return JSONResponse(content=message_response, status_code=HTTPStatus.BAD_REQUEST)
-    model = service.get_model(_id)
+    model = await service.get_model(_id, Filters.parse_fields(fields))
     if model:
         return JSONResponse(content=model.model_dump(exclude_none=True, mode='json'))
     else:
@@ -74,51 +160,39 @@ def get_by_id(_id: str = Path(...)):
 
 @router.patch('/{_id}')
 @exception_handler
-def patch(_id: str = Path(...), user_patch_model: UserPatchModel = Body(...)):
+async def patch(_id: str = Path(...), user_patch_model: UserPatchModel = Body(...)):
     """Partially update a user"""
     if not _id:
         raise UserException(Messages.REQUIRED_ID)
     
-    existing_user = service.get_model(_id)
-    if not existing_user:
-        message_response = MessageResponseHelper.build(
-            ResponseTypeEnum.ERROR,
-            Messages.ERROR_NOT_FOUND
-        )
-        return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
-    
     if not any(user_patch_model.model_dump(exclude_none=True).keys()):
         user_patch_model_keys = list(user_patch_model.model_fields.keys())
         message = Messages.UNAUTHORIZED_FIELDS.format(allowed_fields=user_patch_model_keys)
         raise UserException(message)
 
-    if not service.check_changes(existing_user, user_patch_model):
-        return Response(content="", status_code=HTTPStatus.NO_CONTENT)
-
-    # Update full name
-    service.update_full_name(_id, user_patch_model.fullName)
-    # Update email
-    service.update_email(_id, user_patch_model.email)
-    # Update phone
-    service.update_phone(_id, user_patch_model.phone)
-    # Update role
-    service.update_role(_id, user_patch_model.role)
-    # Update status
-    service.update_status(_id, user_patch_model.status)
+    # One round trip, matching only when a field changes
+    patched_model = await service.patch_model(_id, user_patch_model)
+    if patched_model:
+        return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
 
-    patched_model = service.get_model(_id)
+    if await service.exists(_id):
+        return Response(content="", status_code=HTTPStatus.NO_CONTENT)
 
-    return JSONResponse(content=patched_model.model_dump(exclude_none=True, mode='json'))
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
 
 
 @router.delete('/{_id}')
 @exception_handler
-def delete_by_id(_id: str = Path(...)):
-    """Soft delete a user"""
+async def delete_by_id(_id: str = Path(...)):
+    """Delete a user, moving it to the archive"""
     if not _id:
         raise UserException(Messages.REQUIRED_ID)
     
-    if service.delete_model(_id):
+    if await service.delete_model(_id):
         message_response = MessageResponseHelper.build(
             ResponseTypeEnum.SUCCESS,
             Messages.SUCCESS_DELETED
@@ -135,13 +209,13 @@ def delete_by_id(_id: str = Path(...)):
 
 @router.patch('/{_id}/suspend')
 @exception_handler
-def suspend(_id: str = Path(...)):
+async def suspend(_id: str = Path(...)):
     """Suspend a user"""
     if not _id:
         raise UserException(Messages.REQUIRED_ID)
     
-    service.update_status(_id, "suspended")
-    model = service.get_model(_id)
+    # Unchanged when the user already has this status, then read it as is
+    model = await service.patch_model(_id, UserPatchModel(status=Status.SUSPENDED)) or await service.get_model(_id)
     
     if model:
         message_response = MessageResponseHelper.build(
@@ -159,13 +233,13 @@ def suspend(_id: str = Path(...)):
 
 @router.patch('/{_id}/activate')
 @exception_handler
-def activate(_id: str = Path(...)):
+async def activate(_id: str = Path(...)):
     """Activate a user"""
     if not _id:
         raise UserException(Messages.REQUIRED_ID)
     
-    service.update_status(_id, "active")
-    model = service.get_model(_id)
+    # Unchanged when the user already has this status, then read it as is
+    model = await service.patch_model(_id, UserPatchModel(status=Status.ACTIVE)) or await service.get_model(_id)
     
     if model:
         message_response = MessageResponseHelper.build(
@@ -179,3 +253,21 @@ def activate(_id: str = Path(...)):
             Messages.ERROR_NOT_FOUND
         )
         return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
+
+
+@router.post('/{_id}/restore')
+@exception_handler
+async def restore(_id: str = Path(...)):
+    """Restore a deleted user from the archive"""
+    if not _id:
+        raise UserException(Messages.REQUIRED_ID)
+
+    restored_model = await service.restore_model(_id)
+    if restored_model:
+        return JSONResponse(content=restored_model.model_dump(exclude_none=True, mode='json'))
+
+    message_response = MessageResponseHelper.build(
+        ResponseTypeEnum.ERROR,
+        Messages.ERROR_NOT_FOUND
+    )
+    return JSONResponse(content=message_response, status_code=HTTPStatus.NOT_FOUND)
@@ -14,11 +14,13 @@ class Messages:
     # Error messages
     ERROR_NOT_FOUND = "User not found"
     REQUIRED_ID = "User ID is required"
+    PURGE_RUNNING = "A purge of the deleted users is already running"
     REQUIRED_EMAIL = "Email is required"
     INVALID_EMAIL = "Invalid email format"
     INVALID_ROLE = "Invalid role value"
     INVALID_STATUS = "Invalid status value"
     UNAUTHORIZED_FIELDS = "Only the following fields can be updated: {allowed_fields}"
+    BULK_SIZE = "Bulk requests take between 1 and {max_items} items"
     
     # Validation messages
     EMAIL_EXISTS = "User with this email already exists"
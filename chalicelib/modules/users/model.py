@@ -2,7 +2,7 @@
 
 from datetime import datetime, timezone
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional
+from typing import Optional, Union
 from enum import Enum
 from ...common.types.type import ObjectIdStr
 
@@ -66,9 +66,27 @@ class UserPatchModel(BaseModel, metaclass=MetaModel):
     status: Optional[Status] = None
 
 
+class UserPartialModel(BaseModel, metaclass=MetaModel):
+    """User model of a document read with a projection, every field is optional"""
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
+
+    id: Optional[ObjectIdStr] = Field(alias="_id", default=None)
+    fullName: Optional[str] = None
+    email: Optional[str] = None
+    passwordHash: Optional[str] = None
+    role: Optional[Role] = None
+    phone: Optional[str] = None
+    status: Optional[Status] = None
+    createdAt: Optional[datetime] = None
+    updatedAt: Optional[datetime] = None
+    deletedAt: Optional[datetime] = None
+
+
 class UserModelResult(BaseModel, metaclass=MetaModel):
     """User result model with pagination"""
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
     
-    total: int
-    results: list[UserModel]
+    total: Optional[int] = None
+    totalExact: bool = True
+    results: list[Union[UserModel, UserPartialModel]]
+    nextCursor: Optional[str] = None
@@ -1,17 +1,41 @@
 """User schema definitions for validation"""
 
-from datetime import datetime, timezone
-from bson import CodecOptions
+from datetime import datetime
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from pymongoose import methods
 from pymongoose.mongo_types import Types, Schema
 from .model import UserModel
-from ...config.mongodb import mongo_client
-
-methods.database = mongo_client
+from ...common.helpers.archive import Archive
+from ...config.mongodb import mongodb
 
 
 class UserSchema(Schema):
     schema_name = "User"
+    # Indexes backing Filters.apply() and the list sort; deleted documents are in the archive.
+    # The unique index enforces one user per email.
+    indexes = [
+        IndexModel(
+            [(UserModel.createdAt, DESCENDING), ("_id", DESCENDING)],
+            name="createdAt",
+        ),
+        IndexModel(
+            [(UserModel.email, ASCENDING)],
+            name="email",
+            unique=True,
+        ),
+        IndexModel(
+            [(UserModel.role, ASCENDING), (UserModel.createdAt, DESCENDING), ("_id", DESCENDING)],
+            name="role_createdAt",
+        ),
+        IndexModel(
+            [(UserModel.status, ASCENDING), (UserModel.createdAt, DESCENDING), ("_id", DESCENDING)],
+            name="status_createdAt",
+        ),
+        # Legacy documents deleted in place, before deletes moved them, for `manage.py archive-deleted`
+        Archive.index,
+    ]
+    # Default projection of list reads, leaving out the password hash
+    list_projection = {UserModel.passwordHash: 0, UserModel.deletedAt: 0}
 
     def __init__(self, **kwargs):
         self.schema = {
@@ -61,10 +85,16 @@ class UserSchema(Schema):
             },
         }
         super().__init__(self.schema_name, self.schema, kwargs)
-        self.native_collection = methods.database.get_collection(
-            self.schema_name,
-            codec_options=CodecOptions(tz_aware=True, tzinfo=timezone.utc)
-        )
+
+    @property
+    def native_collection(self):
+        """Blocking collection, resolved on the current client"""
+        return mongodb.get_collection(self.schema_name)
+
+    @property
+    def async_collection(self):
+        """Asyncio collection, resolved on the current client"""
+        return mongodb.get_async_collection(self.schema_name)
 
 
 user_schema = UserSchema()
@@ -1,162 +1,250 @@
-"""User service layer for business logic"""
+"""User service layer for `manage.py` and scripts, on the blocking client"""
 
-from typing import Any
-from datetime import datetime
+from typing import Any, List, Optional
+from datetime import datetime, timezone
 from bson import ObjectId
 from pydantic import BaseModel
-from pymongoose import methods
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from ...common.helpers.archive import Archive
+from ...common.helpers.bulk import Bulk
 from ...common.helpers.filters import Filters
-from .model import UserModel, UserModelResult
-from .schema import user_schema, UserSchema
+from ...common.helpers.pagination import Pagination
+from ...common.helpers.projection import Projection
+from ...common.helpers.purge import Purge
+from ...config.settings import (
+    EXPORT_BATCH_SIZE, PURGE_BATCH_SIZE, PURGE_MAX_DELETES_PER_SECOND, RETENTION_DAYS_USERS
+)
+from .model import UserModel, UserPartialModel, UserPatchModel, UserModelResult
+from .schema import user_schema
 from ...common.exceptions.exception import UserAlreadyExistsException
 
 
 class UserService:
     """Service class for user operations"""
-    
+
     def __init__(self):
         self.schema = user_schema
-        self.collection = user_schema.native_collection
+
+    @property
+    def collection(self):
+        """Collection of the schema on the current client"""
+        return self.schema.native_collection
 
     def get_all_models(self, filters: Filters):
         """Get all users with filtering and pagination"""
         query = filters.apply()
-        total_count = self.collection.count_documents(query)
-        cursor = self.collection.find(
-            query,
-            limit=filters.limit,
-            skip=filters.skip,
-            sort={UserModel.createdAt: -1}
-        )
-        return UserModelResult(total=total_count, results=list(cursor))
+        projection = Projection.build(filters.fields, UserModel, self.schema.list_projection, UserModel.createdAt)
+        page = Pagination.find_page(self.collection, query, filters, UserModel.createdAt, projection)
+        return self._page_result(page, projection)
 
-    def get_model(self, _id: str):
+    def export_models(self, filters: Filters):
+        """
+        Read users for an export, with a batched cursor instead of pages
+
+        Args:
+            filters: Filters of the list, `fields` selects the exported fields
+
+        Returns:
+            Tuple of (projection of the read, iterator of users)
+        """
+        query = filters.apply()
+        projection = Projection.build(filters.fields, UserModel, self.schema.list_projection)
+        cursor = self.collection.find(query, projection).sort(
+            {UserModel.createdAt: -1}
+        ).batch_size(EXPORT_BATCH_SIZE)
+        model = Projection.model(projection, UserModel, UserPartialModel)
+        return projection, (model.model_validate(document) for document in cursor)
+
+    def get_model(self, _id: str, fields: Optional[List[str]] = None):
         """Get user by ID"""
-        result = self.collection.find_one({"_id": ObjectId(_id), **Filters.deleted_at_filter})
+        projection = Projection.build(fields, UserModel)
+        result = self.collection.find_one({"_id": ObjectId(_id)}, projection)
         if not result:
             return None
-        return UserModel.model_validate(result)
+        return Projection.model(projection, UserModel, UserPartialModel).model_validate(result)
 
-    def get_by_email(self, email: str):
+    def get_by_email(self, email: str, fields: Optional[List[str]] = None):
         """Get user by email"""
-        result = self.collection.find_one({"email": email.lower(), **Filters.deleted_at_filter})
+        projection = Projection.build(fields, UserModel)
+        result = self.collection.find_one({"email": email.lower()}, projection)
         if not result:
             return None
-        return UserModel.model_validate(result)
+        return Projection.model(projection, UserModel, UserPartialModel).model_validate(result)
 
     def add_model(self, model: UserModel):
         """Create a new user"""
-        # Check if user with email already exists
-        existing_user = self._get_existing_user(model)
-        if existing_user:
-            raise UserAlreadyExistsException(model.email)
+        serialized_data = self._serialize_new(model)
+
+        # Insert into MongoDB collection, the unique index rejects duplicates
+        try:
+            result = self.collection.insert_one(serialized_data)
+        except DuplicateKeyError:
+            raise self._duplicate_error(serialized_data)
+
+        # Build the created object from the inserted data instead of reading it back
+        return UserModel.model_validate({**serialized_data, "_id": result.inserted_id})
+
+    def add_models(self, items: List[Any]):
+        """
+        Create users with one unordered insert_many
+
+        Args:
+            items: Raw items, validated one by one
+
+        Returns:
+            One result per item, with the new id or the error
+        """
+        models, errors = Bulk.validate(items, UserModel)
+        documents = [(index, self._serialize_new(model)) for index, model in models]
+        return errors + Bulk.insert_many(self.collection, documents, self._duplicate_error)
 
-        # Serialize the model
+    def _serialize_new(self, model: UserModel) -> dict:
+        """Serialize a new user with its creation metadata"""
         serialized_data = model.model_dump(exclude_none=True)
 
         # Add creation/update metadata
-        serialized_data[UserModel.createdAt] = datetime.utcnow()
-        serialized_data[UserModel.updatedAt] = datetime.utcnow()
-        
+        now = datetime.now(timezone.utc)
+        serialized_data[UserModel.createdAt] = now
+        serialized_data[UserModel.updatedAt] = now
+
         # Convert email to lowercase
         serialized_data[UserModel.email] = serialized_data[UserModel.email].lower()
 
-        # Insert into MongoDB collection
-        inserted_id = methods.insert_one(UserSchema.schema_name, serialized_data)
-
-        # Return the complete object after insertion
-        return self.get_model(inserted_id)
-
-    def _get_existing_user(self, model: UserModel):
-        """Check if user with email already exists"""
-        return self.collection.find_one({
-            UserModel.email: model.email.lower(),
-            **Filters.deleted_at_filter
-        })
-
-    def update_full_name(self, _id: str, fullName: str):
-        """Update user's full name"""
-        if not fullName:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id, **Filters.deleted_at_filter},
-            {"$set": {UserModel.fullName: fullName, UserModel.updatedAt: datetime.utcnow()}}
-        )
+        return serialized_data
 
-    def update_email(self, _id: str, email: str):
-        """Update user's email"""
-        if not email:
-            return
-        obj_id = ObjectId(_id)
-        # Check if email already exists for another user
-        existing = self.collection.find_one({
-            UserModel.email: email.lower(),
-            "_id": {"$ne": obj_id},
-            **Filters.deleted_at_filter
-        })
-        if existing:
-            raise UserAlreadyExistsException(email)
-        
-        self.schema.update(
-            {"_id": obj_id, **Filters.deleted_at_filter},
-            {"$set": {UserModel.email: email.lower(), UserModel.updatedAt: datetime.utcnow()}}
-        )
+    def _duplicate_error(self, document: dict) -> Exception:
+        """Exception reported when the unique index rejects a user"""
+        return UserAlreadyExistsException(document[UserModel.email])
 
-    def update_phone(self, _id: str, phone: str):
-        """Update user's phone"""
-        if not phone:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id, **Filters.deleted_at_filter},
-            {"$set": {UserModel.phone: phone, UserModel.updatedAt: datetime.utcnow()}}
-        )
+    def patch_model(self, _id: str, patch_model: BaseModel):
+        """
+        Apply a partial update in one round trip
 
-    def update_role(self, _id: str, role: str):
-        """Update user's role"""
-        if not role:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id, **Filters.deleted_at_filter},
-            {"$set": {UserModel.role: role, UserModel.updatedAt: datetime.utcnow()}}
-        )
+        The filter only matches when a field differs, so the "no changes" check is
+        done by the database and an unchanged user is not written.
 
-    def update_status(self, _id: str, status: str):
-        """Update user's status"""
-        if not status:
-            return
-        obj_id = ObjectId(_id)
-        self.schema.update(
-            {"_id": obj_id, **Filters.deleted_at_filter},
-            {"$set": {UserModel.status: status, UserModel.updatedAt: datetime.utcnow()}}
-        )
+        Args:
+            _id: User ID
+            patch_model: Patch model, None fields are left untouched
+
+        Returns:
+            The updated user, or None when it does not exist or nothing changed
+        """
+        fields = self._patch_fields(patch_model)
+        if not fields:
+            return None
+        try:
+            result = self.collection.find_one_and_update(
+                {"_id": ObjectId(_id), **Filters.changed_filter(fields)},
+                {"$set": {**fields, UserModel.updatedAt: datetime.now(timezone.utc)}},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            raise UserAlreadyExistsException(fields[UserModel.email])
+        if not result:
+            return None
+        return UserModel.model_validate(result)
+
+    def exists(self, _id: str) -> bool:
+        """Check if a user exists"""
+        result = self.collection.find_one({"_id": ObjectId(_id)}, {"_id": 1})
+        return result is not None
 
     def delete_model(self, _id: str):
-        """Soft delete a user"""
-        obj_id = ObjectId(_id)
-        count = self.schema.update(
-            {"_id": obj_id, **Filters.deleted_at_filter},
-            {"$set": {UserModel.deletedAt: datetime.utcnow()}}
+        """Move a user to the archive"""
+        document = Archive.delete(self.collection, ObjectId(_id))
+        return 0 if document is None else 1
+
+    def restore_model(self, _id: str):
+        """
+        Restore a user from the archive
+
+        Args:
+            _id: User ID
+
+        Returns:
+            The restored user, or None when the archive has no user with this id
+        """
+        document, _ = Archive.restore(self.collection, _id, self._duplicate_error)
+        if not document:
+            return None
+        return UserModel.model_validate(document)
+
+    def purge(
+        self,
+        batch_size: int = PURGE_BATCH_SIZE,
+        max_per_second: float = PURGE_MAX_DELETES_PER_SECOND
+    ) -> Purge:
+        """
+        Purge of the users deleted more than RETENTION_DAYS_USERS ago, live and archived
+
+        `manage.py purge-deleted` runs it inline, `POST /users/purge` in the background.
+        """
+        return Purge(self.schema.schema_name, RETENTION_DAYS_USERS, batch_size, max_per_second)
+
+    def patch_models(self, items: List[Any]):
+        """
+        Apply partial updates with one unordered bulk_write
+
+        Args:
+            items: Raw {id, patch} items, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        patches, errors = Bulk.validate_patches(items, UserPatchModel)
+        targets = [(index, _id, self._patch_fields(patch)) for index, _id, patch in patches]
+        current = self._current(targets)
+        now = datetime.now(timezone.utc)
+        operations = [
+            (index, UpdateOne(
+                {"_id": _id, **Filters.changed_filter(fields)},
+                {"$set": {**fields, UserModel.updatedAt: now}}
+            ))
+            for index, _id, fields in targets
+        ]
+        failed = Bulk.write(self.collection, operations)
+        return errors + Bulk.write_results(targets, current, failed, self._duplicate_error)
+
+    def delete_models(self, items: List[Any]):
+        """
+        Move users to the archive, `BULK_WRITE_CONCURRENCY` at a time
+
+        Args:
+            items: Raw user ids, validated one by one
+
+        Returns:
+            One result per item, with the matched and modified counts or the error
+        """
+        ids, errors = Bulk.validate_ids(items)
+        targets = [(index, _id, None) for index, _id in ids]
+        results, _ = Bulk.write_each(targets, self._delete_one)
+        return errors + results
+
+    def _delete_one(self, _id: ObjectId, _fields: None):
+        """Move a user of a bulk delete to the archive, returning it as it was"""
+        return Archive.delete(self.collection, _id)
+
+    def _current(self, targets):
+        """Read the live users targeted by a bulk write, keyed by _id"""
+        if not targets:
+            return {}
+        cursor = self.collection.find(
+            {"_id": {"$in": [_id for _, _id, _ in targets]}},
+            Bulk.projection(targets)
         )
-        return count
-
-    def check_changes(self, existing_user_model: BaseModel, user_patch_model: BaseModel) -> bool:
-        """Check if there are any changes between existing and patch models"""
-        for field in user_patch_model.model_fields_set:
-            new_val = getattr(user_patch_model, field)
-            old_val = getattr(existing_user_model, field, None)
-            if self._to_plain(new_val) != self._to_plain(old_val):
-                return True
-        return False
-
-    def _to_plain(self, value: Any) -> Any:
-        """Convert value to plain representation for comparison"""
-        if isinstance(value, BaseModel):
-            return value.model_dump(exclude_none=True)
-        if isinstance(value, dict):
-            return {k: self._to_plain(v) for k, v in value.items()}
-        if isinstance(value, (list, tuple)):
-            return [self._to_plain(v) for v in value]
-        return value
+        return {document["_id"]: document for document in cursor}
+
+    def _patch_fields(self, patch_model: BaseModel) -> dict:
+        """Fields set by a patch, with the email lowercased"""
+        fields = patch_model.model_dump(exclude_none=True)
+        if UserModel.email in fields:
+            fields[UserModel.email] = fields[UserModel.email].lower()
+        return fields
+
+    def _page_result(self, page, projection):
+        """Build the result of a page read with a projection"""
+        return UserModelResult(**page._replace(
+            results=Projection.validate(page.results, projection, UserModel, UserPartialModel)
+        )._asdict())
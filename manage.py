@@ -0,0 +1,478 @@
+"""Command line entry point for maintenance tasks"""
+
+import argparse
+import asyncio
+import functools
+import logging
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+from chalicelib.common.helpers.archive import Archive
+from chalicelib.common.helpers.filters import Filters
+from chalicelib.common.helpers.gazetteer import Gazetteer
+from chalicelib.common.helpers.import_helper import ImportHelper
+from chalicelib.common.helpers.index_helper import IndexHelper
+from chalicelib.common.helpers.scheduler import Scheduler
+from chalicelib.common.helpers.typed_query import TypedQuery
+from chalicelib.config.mongodb import mongodb
+from chalicelib.config.settings import (
+    LIFECYCLE_INTERVAL_SECONDS, LIFECYCLE_LEASE_SECONDS, PURGE_BATCH_SIZE, PURGE_MAX_DELETES_PER_SECOND
+)
+from chalicelib.modules.users.schema import user_schema
+from chalicelib.modules.jobs.schema import job_schema, JobSchema
+from chalicelib.modules.entreprises.schema import entreprise_schema, EntrepriseSchema
+from chalicelib.modules.emplois.schema import emploi_schema
+from chalicelib.modules.candidats.schema import candidat_schema
+from chalicelib.modules.applications.schema import application_schema
+from chalicelib.modules.users.model import UserModel
+from chalicelib.modules.jobs.model import JobModel
+from chalicelib.modules.entreprises.model import EntrepriseModel
+from chalicelib.modules.emplois.model import EmploiModel
+from chalicelib.modules.candidats.model import CandidatModel
+from chalicelib.modules.applications.model import ApplicationModel
+from chalicelib.modules.jobs.model import OPEN_STATUS
+from chalicelib.modules.jobs.service import JobService
+from chalicelib.modules.jobs.async_service import AsyncJobService
+from chalicelib.modules.entreprises.async_service import AsyncEntrepriseService
+from chalicelib.modules.users.async_service import AsyncUserService
+from chalicelib.modules.emplois.async_service import AsyncEmploiService
+from chalicelib.modules.candidats.async_service import AsyncCandidatService
+from chalicelib.modules.applications.async_service import AsyncApplicationService
+
+schemas = [
+    user_schema,
+    job_schema,
+    entreprise_schema,
+    emploi_schema,
+    candidat_schema,
+    application_schema,
+]
+
+# Schema, model and lowercased fields of the collections accepted by `import` and `migrate-references`
+importable = {
+    'users': (user_schema, UserModel, (UserModel.email,), None),
+    'jobs': (job_schema, JobModel, (), JobSchema.derive),
+    'entreprises': (entreprise_schema, EntrepriseModel, (), EntrepriseSchema.derive),
+    'emplois': (emploi_schema, EmploiModel, (), None),
+    'candidats': (candidat_schema, CandidatModel, (), None),
+    'applications': (application_schema, ApplicationModel, (), None),
+}
+
+# Reads of `benchmark-services`, the same call on the blocking and on the async job service
+benchmark_reads = {
+    'get': lambda service, job_id: service.get_model(job_id),
+    'list': lambda service, job_id: service.get_all_models(
+        Filters(limit=20, cursor="", include_total=Filters.TOTAL_ESTIMATED)
+    ),
+}
+
+# Collections whose deletes move documents to their archive, `archive-deleted` moves the legacy deletes made in place
+archived = {
+    'users': user_schema,
+    'emplois': emploi_schema,
+    'candidats': candidat_schema,
+    'applications': application_schema,
+}
+
+# Services purging the archived collections with the retention period of their module
+purgeable = {
+    'users': AsyncUserService,
+    'emplois': AsyncEmploiService,
+    'candidats': AsyncCandidatService,
+    'applications': AsyncApplicationService,
+}
+
+# Words of the synthetic jobs inserted by `seed-jobs`
+seed_titles = [
+    'Développeur', 'Ingénieur', 'Technicien', 'Comptable', 'Commercial', 'Chef de projet',
+    'Analyste', 'Consultant', 'Designer', 'Responsable', 'Assistant', 'Administrateur',
+]
+seed_skills = [
+    'python', 'java', 'javascript', 'react', 'angular', 'django', 'spring', 'sql', 'mongodb',
+    'devops', 'docker', 'kubernetes', 'aws', 'azure', 'php', 'laravel', 'flutter', 'android',
+    'ios', 'sap', 'excel', 'marketing', 'vente', 'finance', 'audit', 'réseau', 'sécurité',
+    'data', 'cloud', 'mobile', 'web', 'qualité', 'logistique', 'achats', 'support', 'paie',
+]
+seed_levels = ['junior', 'confirmé', 'senior', 'stagiaire', 'lead']
+seed_locations = ['Tunis', 'Sfax', 'Sousse', 'Ariana', 'Ben Arous', 'Nabeul', 'Monastir', 'Bizerte', 'Remote']
+seed_contracts = ['CDI', 'CDD', 'Freelance', 'Stage', 'Alternance', 'Temps partiel']
+
+
+async def run_async(command):
+    """Await a command calling the async services, then close the clients it used"""
+    try:
+        return await command
+    finally:
+        await mongodb.close()
+
+
+def ensure_indexes(args):
+    """Create or reconcile the indexes declared on every schema"""
+    results = IndexHelper.ensure(schemas, dry_run=args.dry_run, prune=args.prune)
+    for action in results:
+        print(IndexHelper.describe(action))
+    if not results:
+        print("Indexes are up to date")
+    return 1 if any(action["status"] == "failed" for action in results) else 0
+
+
+def import_file(args):
+    """Load an NDJSON or CSV file into a collection"""
+    schema, model, lowercase, derive = importable[args.collection]
+    helper = ImportHelper(
+        schema.native_collection, model, args.file,
+        file_format=args.format, batch_size=args.batch_size, workers=args.workers,
+        writers=args.writers, checkpoint=args.checkpoint, lowercase=lowercase, derive=derive
+    )
+    totals = helper.run()
+    for error in helper.errors[:args.show_errors]:
+        print(f"record {error['index']}: {error['error']}")
+    print(", ".join(f"{name}: {count}" for name, count in totals.items()))
+    return 1 if totals["failed"] else 0
+
+
+async def reconcile_counters(args):
+    """Recompute the denormalized job and entreprise counters"""
+    for name, service in (('jobs', AsyncJobService()), ('entreprises', AsyncEntrepriseService())):
+        totals = await service.reconcile_counters(batch_size=args.batch_size, dry_run=args.dry_run)
+        action = "drifted" if args.dry_run else "fixed"
+        print(f"{name}: {totals['checked']} checked, {totals['drifted']} {action}")
+    return 0
+
+
+async def refresh_similar(args):
+    """Compute the similar jobs of the published jobs, then time GET /jobs/{id}/similar reads"""
+    service = AsyncJobService()
+    totals = await service.refresh_similar(batch_size=args.batch_size, workers=args.workers, refresh_all=args.all)
+    print(f"refreshed: {totals['refreshed']} jobs in {totals['seconds']}s ({totals['perSecond']} jobs/s)")
+    if not args.benchmark:
+        return 0
+
+    sample = await service.collection.aggregate([
+        {"$match": {JobModel.status: OPEN_STATUS}},
+        {"$sample": {"size": args.benchmark}},
+        {"$project": {"_id": 1}},
+    ])
+    timings = []
+    async for job in sample:
+        started = time.perf_counter()
+        await service.get_similar(str(job["_id"]))
+        timings.append((time.perf_counter() - started) * 1000)
+    if not timings:
+        print("No published job to benchmark")
+        return 0
+    print(f"similar reads: {len(timings)}, {latencies(timings)}")
+    return 0
+
+
+def latencies(timings):
+    """Median, 95th percentile and maximum of request timings in milliseconds"""
+    timings = sorted(timings)
+    p50, p95 = timings[len(timings) // 2], timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    return f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, max {timings[-1]:.1f} ms"
+
+
+def seed_jobs(args):
+    """Insert synthetic published jobs, to benchmark the job reads at a given size"""
+    collection = job_schema.native_collection
+    if not args.append and collection.estimated_document_count():
+        print(f"{job_schema.schema_name} is not empty, use a scratch DATABASE_NAME or --append")
+        return 1
+    rng = random.Random(args.seed)
+    # Description words follow a Zipf distribution over a vocabulary of skills and filler terms
+    vocabulary = seed_skills + [f"terme{rank}" for rank in range(args.vocabulary)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    entreprises = [ObjectId() for _ in range(max(1, args.count // 100))]
+    now = datetime.now(timezone.utc)
+    started = time.monotonic()
+    inserted = 0
+    while inserted < args.count:
+        size = min(args.batch_size, args.count - inserted)
+        documents = []
+        for _ in range(size):
+            skills = rng.sample(seed_skills, 2)
+            words = rng.choices(vocabulary, weights, k=args.description_words)
+            documents.append(job_schema.derive({
+                JobModel.title: f"{rng.choice(seed_titles)} {skills[0]} {rng.choice(seed_levels)}",
+                JobModel.description: " ".join(skills + words),
+                JobModel.skills: skills,
+                JobModel.location: rng.choice(seed_locations),
+                JobModel.contractType: rng.choice(seed_contracts),
+                JobModel.remote: rng.random() < 0.2,
+                JobModel.entrepriseId: rng.choice(entreprises),
+                JobModel.createdBy: ObjectId(),
+                JobModel.status: OPEN_STATUS,
+                JobModel.createdAt: now - timedelta(seconds=rng.randrange(180 * 86400)),
+                JobModel.applicationCount: 0,
+                JobModel.applicationCountByStatus: {},
+            }))
+        collection.insert_many(documents, ordered=False)
+        inserted += size
+    elapsed = time.monotonic() - started
+    print(f"inserted: {inserted} jobs in {elapsed:.1f}s")
+    return 0
+
+
+def benchmark_sync(load, concurrency):
+    """Run reads through the blocking job service, `concurrency` threads at a time"""
+    service = JobService()
+
+    def timed(item):
+        read, job_id = item
+        started = time.perf_counter()
+        benchmark_reads[read](service, job_id)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        timings = list(pool.map(timed, load))
+    return time.perf_counter() - started, timings
+
+
+async def benchmark_async(load, concurrency):
+    """Run reads through the async job service, `concurrency` coroutines at a time"""
+    service = AsyncJobService()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def timed(item):
+        read, job_id = item
+        async with slots:
+            started = time.perf_counter()
+            await benchmark_reads[read](service, job_id)
+            return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    timings = await asyncio.gather(*(timed(item) for item in load))
+    return time.perf_counter() - started, list(timings)
+
+
+async def benchmark_services(args):
+    """Run the same job reads through the blocking and the async services, at the same concurrency"""
+    sample = job_schema.native_collection.aggregate([{"$sample": {"size": args.ids}}, {"$project": {"_id": 1}}])
+    ids = [str(job["_id"]) for job in sample]
+    if not ids:
+        print("No job to benchmark, see seed-jobs")
+        return 0
+    rng = random.Random(args.seed)
+    load = [(rng.choice(args.reads or list(benchmark_reads)), rng.choice(ids)) for _ in range(args.requests)]
+
+    # Each layer runs the load once untimed first, so both read from a warm server cache
+    benchmark_sync(load, args.concurrency)
+    await benchmark_async(load, args.concurrency)
+    for name, (seconds, timings) in (
+        ('sync', benchmark_sync(load, args.concurrency)),
+        ('async', await benchmark_async(load, args.concurrency)),
+    ):
+        rate = len(timings) / seconds if seconds else 0.0
+        print(f"{name}: {len(timings)} reads in {seconds:.1f}s ({rate:.0f}/s), {latencies(timings)}")
+    return 0
+
+
+def migrate_references(args):
+    """Convert the references stored as strings to ObjectId"""
+    failed = False
+    for name, (schema, model, *_) in importable.items():
+        try:
+            counts = TypedQuery.migrate(schema.native_collection, model, dry_run=args.dry_run)
+        except PyMongoError as e:
+            print(f"{name}: failed, {e}")
+            failed = True
+            continue
+        action = "to convert" if args.dry_run else "converted"
+        for field, count in counts.items():
+            print(f"{name}.{field}: {count} {action}")
+    return 1 if failed else 0
+
+
+def geocode_locations(args):
+    """Geocode the locations of the jobs and entreprises with the bundled gazetteer"""
+    for name, schema, location_field in (
+        ('jobs', job_schema, JobModel.location),
+        ('entreprises', entreprise_schema, EntrepriseModel.location),
+    ):
+        totals = Gazetteer.backfill(
+            schema.native_collection, location_field, schema.LOCATION_POINT,
+            batch_size=args.batch_size, refresh_all=args.all
+        )
+        print(f"{name}: {totals['checked']} checked, {totals['located']} located")
+    return 0
+
+
+async def normalize_skills(args):
+    """Normalize the skills of the jobs written without skillTerms, imported or older"""
+    totals = await AsyncJobService().normalize_skills(batch_size=args.batch_size, refresh_all=args.all)
+    print(f"jobs: {totals['checked']} checked, {totals['withSkills']} with skills")
+    return 0
+
+
+async def run_lifecycle(args):
+    """Publish the scheduled drafts and close the expired jobs, on the worker holding the lease"""
+    scheduler = Scheduler("job-lifecycle", args.interval, LIFECYCLE_LEASE_SECONDS)
+    task = functools.partial(AsyncJobService().run_lifecycle, batch_size=args.batch_size)
+    if not args.once:
+        try:
+            await scheduler.run_async(task)
+        except asyncio.CancelledError:
+            # Interrupted: run_async gave the lease up
+            pass
+        return 0
+    try:
+        totals = await scheduler.tick_async(task)
+    finally:
+        # Let a looping worker take the next tick at once
+        await scheduler.lease.release_async()
+    if totals is None:
+        print("Lease held by another worker")
+        return 0
+    print(f"published: {totals['published']}, expired: {totals['expired']}")
+    return 0
+
+
+def archive_deleted(args):
+    """Move the legacy documents deleted in place, before deletes moved them, to the archive collections"""
+    failed = False
+    for name, schema in archived.items():
+        try:
+            totals = Archive.move(schema.native_collection, batch_size=args.batch_size, dry_run=args.dry_run)
+        except PyMongoError as e:
+            print(f"{name}: failed, {e}")
+            failed = True
+            continue
+        action = "to move" if args.dry_run else "moved"
+        print(f"{name}: {totals['moved']} {action} to {schema.schema_name}{Archive.SUFFIX}")
+    return 1 if failed else 0
+
+
+async def purge_deleted(args):
+    """Hard delete the documents deleted for longer than the retention period of their module"""
+    failed = False
+    for name in args.modules or purgeable:
+        purge = purgeable[name]().purge(batch_size=args.batch_size, max_per_second=args.max_per_second)
+        try:
+            progress = await (purge.count_async() if args.dry_run else purge.run_async())
+        except asyncio.CancelledError:
+            print(f"{name}: interrupted, run the command again to resume from the checkpoint")
+            return 1
+        except PyMongoError as e:
+            print(f"{name}: failed, {e}")
+            failed = True
+            continue
+        if progress is None:
+            print(f"{name}: purge held by another worker")
+        elif args.dry_run:
+            for collection, count in progress.items():
+                print(f"{name}: {count} to delete from {collection}")
+        else:
+            for state in progress:
+                status = "done" if state['finishedAt'] else "stopped, lease lost"
+                print(
+                    f"{name}: {state['deleted']} deleted from {state['collection']} in {state['seconds']}s "
+                    f"({state['perSecond']}/s), {status}"
+                )
+    return 1 if failed else 0
+
+
+def build_parser():
+    """Build the command line parser"""
+    parser = argparse.ArgumentParser(description='JCI API maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    indexes = commands.add_parser('ensure-indexes', help='Create or reconcile schema indexes')
+    indexes.add_argument('--dry-run', action='store_true', help='Only print the diff')
+    indexes.add_argument('--prune', action='store_true', help='Drop indexes that are not declared')
+    indexes.set_defaults(handler=ensure_indexes)
+
+    importer = commands.add_parser('import', help='Load an NDJSON or CSV file into a collection')
+    importer.add_argument('collection', choices=sorted(importable))
+    importer.add_argument('file', help='NDJSON or CSV file, as written by the export endpoints')
+    importer.add_argument('--format', choices=ImportHelper.formats, help='Default: from the file extension')
+    importer.add_argument('--batch-size', type=int, default=1000, help='Records per insert_many')
+    importer.add_argument('--workers', type=int, help='Validation processes, default: one per CPU')
+    importer.add_argument('--writers', type=int, default=4, help='insert_many kept in flight')
+    importer.add_argument('--checkpoint', help='Checkpoint file, the import resumes from it when it exists')
+    importer.add_argument('--show-errors', type=int, default=20, help='Rejected records to print')
+    importer.set_defaults(handler=import_file)
+
+    counters = commands.add_parser('reconcile-counters', help='Recompute drifted job and entreprise counters')
+    counters.add_argument('--batch-size', type=int, default=500, help='Documents recounted per aggregation')
+    counters.add_argument('--dry-run', action='store_true', help='Only count the drifted documents')
+    counters.set_defaults(handler=reconcile_counters)
+
+    similar = commands.add_parser('refresh-similar', help='Compute the similar jobs of the published jobs')
+    similar.add_argument('--batch-size', type=int, default=500, help='Jobs written per bulk_write')
+    similar.add_argument('--workers', type=int, default=8, help='Scoring aggregations run in parallel')
+    similar.add_argument('--all', action='store_true', help='Also refresh the similar jobs that are not stale')
+    similar.add_argument('--benchmark', type=int, default=0, help='Then time this many similar job reads')
+    similar.set_defaults(handler=refresh_similar)
+
+    seed = commands.add_parser('seed-jobs', help='Insert synthetic published jobs for benchmarks')
+    seed.add_argument('count', type=int, help='Jobs to insert')
+    seed.add_argument('--batch-size', type=int, default=5000, help='Jobs per insert_many')
+    seed.add_argument('--description-words', type=int, default=60, help='Words per description')
+    seed.add_argument('--vocabulary', type=int, default=5000, help='Filler terms of the descriptions')
+    seed.add_argument('--seed', type=int, default=1, help='Random seed, the same seed inserts the same jobs')
+    seed.add_argument('--append', action='store_true', help='Insert even when the Job collection is not empty')
+    seed.set_defaults(handler=seed_jobs)
+
+    benchmark = commands.add_parser(
+        'benchmark-services', help='Time the same job reads on the blocking and the async services'
+    )
+    benchmark.add_argument('--requests', type=int, default=2000, help='Reads per service layer')
+    benchmark.add_argument('--concurrency', type=int, default=50, help='Threads, or coroutines, reading at once')
+    benchmark.add_argument(
+        '--read', dest='reads', action='append', choices=sorted(benchmark_reads), help='Repeatable, default: all'
+    )
+    benchmark.add_argument('--ids', type=int, default=1000, help='Sampled jobs the reads pick from')
+    benchmark.add_argument('--seed', type=int, default=1, help='Random seed, the same seed replays the same reads')
+    benchmark.set_defaults(handler=benchmark_services)
+
+    references = commands.add_parser('migrate-references', help='Store string references as ObjectId')
+    references.add_argument('--dry-run', action='store_true', help='Only count the documents to convert')
+    references.set_defaults(handler=migrate_references)
+
+    geocode = commands.add_parser('geocode-locations', help='Store the points of job and entreprise locations')
+    geocode.add_argument('--batch-size', type=int, default=1000, help='Documents written per bulk_write')
+    geocode.add_argument('--all', action='store_true', help='Also geocode the documents that already were')
+    geocode.set_defaults(handler=geocode_locations)
+
+    skills = commands.add_parser('normalize-skills', help='Store the normalized skills the job matching reads')
+    skills.add_argument('--batch-size', type=int, default=1000, help='Jobs written per bulk_write')
+    skills.add_argument('--all', action='store_true', help='Also normalize the jobs that already were')
+    skills.set_defaults(handler=normalize_skills)
+
+    lifecycle = commands.add_parser('run-lifecycle', help='Publish scheduled drafts and close expired jobs')
+    lifecycle.add_argument('--once', action='store_true', help='Run one tick instead of looping')
+    lifecycle.add_argument('--interval', type=float, default=LIFECYCLE_INTERVAL_SECONDS, help='Seconds between ticks')
+    lifecycle.add_argument('--batch-size', type=int, default=1000, help='Jobs moved per update_many')
+    lifecycle.set_defaults(handler=run_lifecycle)
+
+    archive = commands.add_parser('archive-deleted', help='Move legacy documents deleted in place to the archives')
+    archive.add_argument('--batch-size', type=int, default=1000, help='Documents moved per batch')
+    archive.add_argument('--dry-run', action='store_true', help='Only count the documents to move')
+    archive.set_defaults(handler=archive_deleted)
+
+    purge = commands.add_parser('purge-deleted', help='Hard delete documents deleted before their retention period')
+    purge.add_argument(
+        '--module', dest='modules', action='append', choices=sorted(purgeable), help='Repeatable, default: every module'
+    )
+    purge.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Documents deleted per delete_many')
+    purge.add_argument(
+        '--max-per-second', type=float, default=PURGE_MAX_DELETES_PER_SECOND, help='Deletes per second, 0 for no pause'
+    )
+    purge.add_argument('--dry-run', action='store_true', help='Only count the documents to delete')
+    purge.set_defaults(handler=purge_deleted)
+
+    return parser
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    arguments = build_parser().parse_args()
+    result = arguments.handler(arguments)
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(run_async(result))
+    sys.exit(result)